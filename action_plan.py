@@ -0,0 +1,138 @@
+# --- ファイル: action_plan.py ---
+"""
+アクションプラン (actions のリスト) を実行前に検証・正規化する「コンパイル」処理を提供します。
+各ステップを冪等 (再実行しても副作用が増えない) かどうかに分類し、
+ステップ単位のリトライ設定 (retry) を正規化して、安全でないリトライを拒否します。
+また、プランの静的検査 (lint_actions) で固定 sleep などの改善点を提案します。
+"""
+import logging
+from typing import List, Dict, Any, Optional, Union
+
+from playwright.async_api import (
+    TimeoutError as PlaywrightTimeoutError,
+    Error as PlaywrightError,
+)
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# 失敗した試行を繰り返しても副作用が重複しないアクション
+IDEMPOTENT_ACTIONS = {
+    "get_inner_text", "get_text_content", "get_inner_html", "get_attribute",
+    "get_all_attributes", "get_all_text_contents", "wait_visible", "wait_page_load",
+    "sleep", "screenshot", "scroll_page_to_bottom", "scroll_to_element", "hover",
+    "scroll_until_stable", "wait_for_settle",
+    "input",         # fill() は既存の値を置き換えるため再実行しても結果は同じ
+    "select_option", # 同じ値の再選択は結果を変えない
+}
+# リトライ対象として指定できるエラー分類
+RETRY_ERROR_CLASSES = ("timeout", "not_found", "playwright")
+DEFAULT_RETRY_ON = ("timeout", "not_found")
+
+def is_idempotent(step: Dict[str, Any]) -> bool:
+    """ステップが冪等かどうかを判定する。click やページ遷移を伴う複合アクションは冪等ではない。"""
+    return str(step.get("action", "")).lower() in IDEMPOTENT_ACTIONS
+
+def normalize_retry_policy(step: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    ステップの retry 設定を正規化する。未指定なら None。
+    retry は試行回数の整数、または attempts / backoff_ms / backoff_factor / max_backoff_ms / on を持つ辞書。
+    形式が不正な場合は ValueError を送出する。
+    """
+    retry_spec: Union[int, Dict[str, Any], None] = step.get("retry")
+    if retry_spec is None or retry_spec is False:
+        return None
+    if retry_spec is True:
+        retry_spec = {} # 既定値でリトライ
+    elif isinstance(retry_spec, int):
+        retry_spec = {"attempts": retry_spec}
+    if not isinstance(retry_spec, dict):
+        raise ValueError(f"Invalid 'retry' for action '{step.get('action')}': must be an integer or an object.")
+    try:
+        policy = {
+            "attempts": int(retry_spec.get("attempts", config.RETRY_DEFAULT_ATTEMPTS)),
+            "backoff_ms": int(retry_spec.get("backoff_ms", config.RETRY_DEFAULT_BACKOFF_MS)),
+            "backoff_factor": float(retry_spec.get("backoff_factor", 2.0)),
+            "max_backoff_ms": int(retry_spec.get("max_backoff_ms", config.RETRY_MAX_BACKOFF_MS)),
+            "on": [str(c).lower() for c in retry_spec.get("on", DEFAULT_RETRY_ON)],
+        }
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid 'retry' values for action '{step.get('action')}': {retry_spec}")
+    if policy["attempts"] < 1 or policy["backoff_ms"] < 0 or policy["backoff_factor"] < 1.0:
+        raise ValueError(f"Invalid 'retry' values for action '{step.get('action')}': attempts>=1, backoff_ms>=0, backoff_factor>=1 are required.")
+    unknown_classes = [c for c in policy["on"] if c not in RETRY_ERROR_CLASSES]
+    if unknown_classes:
+        raise ValueError(f"Unknown error classes in 'retry.on': {unknown_classes}. Use {list(RETRY_ERROR_CLASSES)}.")
+    return policy if policy["attempts"] > 1 else None
+
+def compile_actions(actions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    アクションリストを実行用に正規化したコピーを返す (元のリストは変更しない)。
+    各ステップには内部キー _idempotent / _retry_policy を付与する。
+    冪等でないステップのリトライ指定は拒否し、_retry_refused に理由を残す。
+    paginate の本体ステップ (steps) も再帰的に処理する。
+    """
+    compiled: List[Dict[str, Any]] = []
+    for index, step in enumerate(actions):
+        compiled_step = dict(step)
+        compiled_step["_idempotent"] = is_idempotent(step)
+        retry_policy = normalize_retry_policy(step)
+        if retry_policy and not compiled_step["_idempotent"]:
+            reason = f"Action '{step.get('action')}' is not idempotent; retrying it could repeat side effects."
+            logger.warning(f"ステップ {index + 1}: リトライ指定を拒否しました - {reason}")
+            compiled_step["_retry_refused"] = reason
+            retry_policy = None
+        compiled_step["_retry_policy"] = retry_policy
+        if isinstance(step.get("steps"), list):
+            compiled_step["steps"] = compile_actions(step["steps"])
+        compiled.append(compiled_step)
+    return compiled
+
+def classify_error(error: BaseException) -> str:
+    """例外をリトライ判定用のエラー分類に変換する。"""
+    if isinstance(error, PlaywrightTimeoutError):
+        return "timeout"
+    if isinstance(error, PlaywrightError):
+        return "playwright"
+    if isinstance(error, ValueError):
+        return "value"
+    return "other"
+
+def retry_delay_ms(policy: Dict[str, Any], attempt: int) -> int:
+    """attempt 回目 (1始まり) の失敗後に待つ時間 (指数バックオフ、上限あり) を返す。"""
+    delay = policy["backoff_ms"] * (policy["backoff_factor"] ** (attempt - 1))
+    return int(min(delay, policy["max_backoff_ms"]))
+
+# 直前のアクションごとに、sleep の代わりに推奨する wait_for_settle の方法
+_SETTLE_SUGGESTIONS = {
+    "click": ("network_idle", "直前の click に settle_mode を指定し、クリックの前から監視して通信が落ち着くのを待つ (結果の要素が分かる場合は selector_count も有効)"),
+    "input": ("dom_quiet", "入力に伴う候補表示などのDOM変更が落ち着くのを待つ"),
+    "select_option": ("network_idle", "選択に伴う再読み込みの通信が落ち着くのを待つ"),
+    "scroll_page_to_bottom": ("dom_quiet", "遅延読み込みのDOM変更が落ち着くのを待つ (繰り返すなら scroll_until_stable)"),
+}
+
+def lint_actions(actions: List[Dict[str, Any]], _prefix: str = "") -> List[Dict[str, Any]]:
+    """
+    アクションプランを静的に検査し、改善提案のリストを返す (実行はしない)。
+    現在は固定時間の sleep ステップを検出し、直前のアクションに応じた wait_for_settle を提案する。
+    戻り値の各要素: {"step": ステップ番号, "rule": ルール名, "message": 提案内容, "suggestion": 置き換え例}
+    """
+    findings: List[Dict[str, Any]] = []
+    previous_action: Optional[str] = None
+    for index, step in enumerate(actions):
+        step_label = f"{_prefix}{index + 1}"
+        action = str(step.get("action", "")).lower()
+        if action == "sleep":
+            mode, reason = _SETTLE_SUGGESTIONS.get(previous_action or "", ("dom_quiet", "ページのDOM変更が落ち着くのを待つ"))
+            findings.append({
+                "step": step_label,
+                "rule": "fixed-sleep",
+                "message": f"固定時間の sleep ({step.get('value', 1.0)}秒) は遅いページでは不足し、速いページでは無駄になります。{reason}方が確実です。",
+                # click の後は単独の wait_for_settle ではクリック中に完了した通信を検出できないため、click 自体に指定する
+                "suggestion": {"action": "click", "settle_mode": mode} if previous_action == "click" else {"action": "wait_for_settle", "settle_mode": mode},
+            })
+        if isinstance(step.get("steps"), list):
+            findings.extend(lint_actions(step["steps"], _prefix=f"{step_label}."))
+        previous_action = action
+    return findings
@@ -0,0 +1,113 @@
+# --- ファイル: artifact_store.py ---
+"""
+大きなステップ結果 (innerHTML、ページテキスト、PDFテキストなど) をディスクに退避する
+コンテンツアドレス型のアーティファクトストア。
+閾値を超えた文字列は SHA-256 をファイル名とするファイルに書き出し、
+結果にはパス・サイズ・ハッシュ・プレビューを持つハンドルだけを残します。
+ハンドルは MCP リソース (artifact://<sha256>) またはこのモジュールの load_artifact で解決できます。
+"""
+import hashlib
+import logging
+import os
+import re
+from typing import Dict, Any, Union
+
+import config
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_URI_PREFIX = "artifact://"
+# 退避対象とする結果のキー (値は文字列、または文字列のリスト)
+SPILLABLE_RESULT_KEYS = ("html", "text", "pdf_text", "pdf_texts", "scraped_texts")
+_SHA256_REGEX = re.compile(r"^[0-9a-f]{64}$")
+
+def is_artifact_handle(value: Any) -> bool:
+    """値がアーティファクトのハンドルかどうかを判定する。"""
+    return isinstance(value, dict) and str(value.get("artifact_uri", "")).startswith(ARTIFACT_URI_PREFIX)
+
+def _artifact_path(sha256: str) -> str:
+    # 1ディレクトリのファイル数が増えすぎないよう、ハッシュ先頭2文字でサブディレクトリを分ける
+    return os.path.join(config.ARTIFACT_DIR, sha256[:2], f"{sha256}.txt")
+
+def _write_artifact(data: bytes, sha256: str) -> str:
+    """内容をハッシュのパスに書き込み (既にあれば何もしない)、パスを返す。失敗時は OSError。"""
+    path = _artifact_path(sha256)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return path
+
+def store_text(text: str) -> str:
+    """サイズに関わらず文字列をアーティファクトとして保存し、SHA-256 を返す。失敗時は OSError。"""
+    data = text.encode("utf-8")
+    sha256 = hashlib.sha256(data).hexdigest()
+    _write_artifact(data, sha256)
+    return sha256
+
+def spill_text(text: Any) -> Union[Any, Dict[str, Any]]:
+    """
+    文字列が閾値 (ARTIFACT_SPILL_THRESHOLD バイト) を超える場合はファイルに書き出してハンドルを返す。
+    閾値以下の文字列や文字列以外の値はそのまま返す。同じ内容は一度だけ書き込まれる。
+    """
+    if not isinstance(text, str):
+        return text
+    data = text.encode("utf-8")
+    if len(data) <= config.ARTIFACT_SPILL_THRESHOLD:
+        return text
+    sha256 = hashlib.sha256(data).hexdigest()
+    try:
+        path = _write_artifact(data, sha256)
+    except OSError as e:
+        # 退避に失敗した場合は元の文字列を結果に残す (データは失わない)
+        logger.warning(f"アーティファクトの書き込みに失敗しました。結果に文字列を保持します: {e}")
+        return text
+    logger.debug(f"大きな結果をアーティファクトに退避しました: {path} ({len(data)} bytes)")
+    return {
+        "artifact_uri": f"{ARTIFACT_URI_PREFIX}{sha256}",
+        "path": path,
+        "size_bytes": len(data),
+        "sha256": sha256,
+        "preview": text[:config.ARTIFACT_PREVIEW_CHARS],
+    }
+
+def spill_large_payloads(result: Dict[str, Any]) -> int:
+    """
+    1件のステップ結果の中の大きな文字列 (SPILLABLE_RESULT_KEYS) をその場でハンドルに置き換える。
+    置き換えた件数を返す。
+    """
+    spilled = 0
+    for key in SPILLABLE_RESULT_KEYS:
+        value = result.get(key)
+        if isinstance(value, str):
+            handle = spill_text(value)
+            if handle is not value:
+                result[key] = handle
+                spilled += 1
+        elif isinstance(value, list):
+            for idx, item in enumerate(value):
+                handle = spill_text(item)
+                if handle is not item:
+                    value[idx] = handle
+                    spilled += 1
+    return spilled
+
+def load_artifact(sha256_or_uri: str) -> str:
+    """ハッシュ (または artifact:// URI) からアーティファクトの内容を読み込む。存在しない場合は FileNotFoundError。"""
+    sha256 = sha256_or_uri[len(ARTIFACT_URI_PREFIX):] if sha256_or_uri.startswith(ARTIFACT_URI_PREFIX) else sha256_or_uri
+    if not _SHA256_REGEX.match(sha256):
+        raise ValueError(f"Invalid artifact id: '{sha256_or_uri}'")
+    with open(_artifact_path(sha256), "r", encoding="utf-8") as f:
+        return f.read()
+
+def resolve_payload(value: Any) -> Any:
+    """ハンドルであれば内容を読み込んで返し、それ以外の値はそのまま返す。読み込めない場合はプレビューを返す。"""
+    if not is_artifact_handle(value):
+        return value
+    try:
+        return load_artifact(value["sha256"])
+    except (OSError, ValueError) as e:
+        logger.warning(f"アーティファクト {value.get('artifact_uri')} を読み込めませんでした: {e}")
+        return value.get("preview", "")
@@ -11,12 +11,92 @@ NEW_PAGE_EVENT_TIMEOUT = 4000   #  4000 新しいページが開くのを待つ
 
 # --- 動的探索関連設定 ---
 DYNAMIC_SEARCH_MAX_DEPTH = 2    # iframe探索の最大深度
+DYNAMIC_SEARCH_BACKEND   = 'frame_locator' # 'frame_locator': 可視iframeをFrameLocatorで幅優先探索 / 'frame_tree': page.frames を直接探索
+DYNAMIC_SEARCH_MODE      = 'bfs'  # 単一要素探索の方式 'bfs': 浅い順に1スコープずつ待機 / 'race': 全フレームで同時に待機 / 'shadow': open shadow root を先に走査 (ステップの search_mode で上書き可)
+RACE_TIE_WINDOW_MS       = 50     #    50 レースモードで同着とみなし、より浅いフレームの結果を待つ猶予 (ミリ秒)
+SHADOW_SEARCH_BUDGET_RATIO = 0.5  # shadow DOM 走査に使う時間の割合。残りは通常の探索 (iframe) に使う
+SHADOW_WALK_POLL_INTERVAL  = 200  #   200 shadow root 走査で要素が見つかるまでの再走査間隔 (ミリ秒)
+FINDER_BUDGET_MIN_SLICE_MS = 150  #   150 1スコープで要素を待つ時間の下限 (ミリ秒)
+FINDER_BUDGET_MAX_SLICE_MS = 2000 #  2000 1スコープで要素を待つ時間の上限 (ミリ秒)
+FINDER_BUDGET_DEPTH_DECAY  = 0.6  # 深度が1段深くなるごとの時間配分の重み (発見実績のある深度は重みが増える)
+FINDER_BUDGET_PROBE_SHARE  = 0.5  # 子iframeの有効性確認に使える残り時間の割合
+FINDER_BUDGET_REVISIT_SHARE = 0.2 # 一巡して見つからなかった場合の再確認に使える全体タイムアウトの割合 (0 で再確認しない)
+SCOPE_CACHE_ENABLED      = True # 要素が見つかったiframe経路を学習し、次回は先に探索する
+SCOPE_CACHE_FILE         = 'cache/selector_scope_cache.json' # 学習したiframe経路の保存先
+SCOPE_CACHE_PROBE_TIMEOUT = 3000 #  3000 キャッシュ済み経路での要素確認タイムアウト (ミリ秒)
+OPTIONAL_STEP_PROBE_TIMEOUT = 1500 # 1500 optional ステップで wait_time_ms 未指定時の要素探索タイムアウト (ミリ秒)
+
+# --- target_hints 解決関連設定 ---
+TARGET_HINTS_TIMEOUT       = 3000 #  3000 ヒント候補の検査に使う最大時間 (ミリ秒)。超過後は fallback_selector で探索
+TARGET_HINTS_POLL_INTERVAL = 200  #   200 一意な候補が見つかるまでの再検査間隔 (ミリ秒)
+
+# --- ページネーション (paginate アクション) 関連設定 ---
+PAGINATE_DEFAULT_MAX_PAGES   = 10    # max_pages 未指定時の最大ページ数
+PAGINATE_NEXT_PROBE_TIMEOUT  = 3000  #  3000 「次へ」要素の存在確認タイムアウト (ミリ秒)
+PAGINATE_DEFAULT_PAGE_CHANGE = 'navigation' # ページ切替の待機方法 ('navigation', 'url_change', 'detach', 'settle')
+
+# --- 静止待機 (DOM変更・ネットワークの静止) と無限スクロール関連設定 ---
+SETTLE_QUIET_MS                  = 500   #   500 DOM変更がこの時間発生しなければ静止とみなす (ミリ秒)
+SETTLE_TIMEOUT                   = 3000  #  3000 1回の静止待機の上限時間 (ミリ秒)。超過しても処理は続行
+SETTLE_POLL_INTERVAL             = 100   #   100 要素数の変化 (selector_count) を確認する間隔 (ミリ秒)
+ENGINE_SETTLE_QUIET_MS           = 150   #   150 エンジン内部のスクロール後の静止判定時間 (ミリ秒)。固定sleepの代替
+ENGINE_SETTLE_TIMEOUT            = 2000  #  2000 エンジン内部の静止待機の上限時間 (ミリ秒)
+SCROLL_UNTIL_STABLE_ROUNDS       = 2     # 項目数が連続してこの回数増えなければ頭打ちとみなす
+SCROLL_UNTIL_STABLE_MAX_SCROLLS  = 50    # scroll_until_stable の最大スクロール回数
+SCROLL_UNTIL_STABLE_MAX_DURATION = 60000 # 60000 scroll_until_stable 全体の時間予算 (ミリ秒)
+
+# --- ステップ単位のリトライ (retry 指定) 関連設定 ---
+RETRY_DEFAULT_ATTEMPTS   = 3     # retry: true 等で attempts 未指定時の試行回数 (初回を含む)
+RETRY_DEFAULT_BACKOFF_MS = 300   #   300 最初のリトライまでの待機時間 (ミリ秒)。以降 backoff_factor 倍
+RETRY_MAX_BACKOFF_MS     = 5000  #  5000 リトライ間隔の上限 (ミリ秒)
+
+# --- PDF 処理関連設定 ---
+PDF_MAX_DOWNLOAD_BYTES   = 100 * 1024 * 1024 # ダウンロードするPDFの最大サイズ (バイト)。Content-Length または受信量が超えたら中止
+PDF_DOWNLOAD_CHUNK_BYTES = 64 * 1024   # 一時ファイルへ書き込む単位 (バイト)
+PDF_TEMP_DIR             = None        # ダウンロードしたPDFの一時保存先 (None の場合はOSの一時ディレクトリ)
+PDF_PROCESS_POOL_ENABLED = True        # PDFテキスト抽出を別プロセスで実行する (False の場合はスレッドで実行)
+PDF_POOL_MAX_WORKERS     = None        # プロセスプールのワーカー数 (None の場合は min(4, CPUコア数))
+PDF_EXTRACT_TIMEOUT      = 120000      # 120000 1文書のテキスト抽出の上限時間 (ミリ秒)。ワーカーが処理を始めてから計測し、超過したプールは実行中の他の文書の完了後に終了させる
+PDF_DETECT_BY_CONTENT_TYPE = True      # リンク先がPDFかを Content-Type とマジックバイトで判定する (False の場合は URL の拡張子 .pdf で判定)
+PDF_DETECT_TIMEOUT       = 5000        #  5000 リンク先がPDFかどうかの判定 (HEAD / 先頭部分のGET) のタイムアウト (ミリ秒)
+PDF_DETECT_CACHE_SIZE    = 2048        # PDF判定結果をキャッシュするURL数
+PDF_SNIFF_BYTES          = 1024        # マジックバイト (%PDF-) を探すファイル先頭のバイト数
+PDF_PARALLEL_MIN_PAGES   = 40          # pdf_options.parallel_chunks で分割抽出する最小ページ数 (これ未満は分割しない)
+
+# --- チェックポイント関連設定 ---
+CHECKPOINT_SAVE_STORAGE_STATE = True # ストレージ状態 (Cookie・localStorage) を保存し再開時に復元する (変化した場合だけ書き込み、権限は所有者のみ)
+
+# --- 結果のストリーミング出力 (JSONL) 関連設定 ---
+RESULT_STREAM_FSYNC_EVERY    = 20   # この件数ごとにディスクへ同期する
+RESULT_STREAM_FSYNC_INTERVAL = 2.0  # 前回の同期からこの秒数が経過していれば同期する
+RESULT_STREAM_ZSTD_LEVEL     = 3    # zstd 圧縮レベル (.zst 出力時)
+
+# --- 差分取得 (incremental モード) 関連設定 ---
+INCREMENTAL_REFRESH_DEFAULT = False  # ステップで incremental 未指定時に差分取得を行うか
+REFRESH_CACHE_FILE          = 'cache/refresh_cache.json' # URLごとの検証子 (ETag / Last-Modified)・内容ハッシュの保存先
+
+# --- ロギング関連設定 ---
+LOG_QUEUE_ENABLED  = True  # ログの整形・書き込みを専用スレッド (QueueListener) で行い、イベントループを止めない
+LOG_SAMPLING_RATES = {     # モジュールごとに DEBUG ログを N 件に1件へ間引く (1 以下で間引かない)
+    'playwright_finders': 10,
+    'playwright_actions': 10,
+}
+LOG_SAMPLING_BURST = 20    # 呼び出し箇所ごとに最初のこの件数までは間引かない
 
 # --- ファイルパス・ディレクトリ名 ---
 LOG_FILE               = 'output_web_runner.log'
 DEFAULT_INPUT_FILE     = 'input.json'
 DEFAULT_SCREENSHOT_DIR = 'screenshots'
 RESULTS_OUTPUT_FILE    = 'output_results.txt'
+RESULTS_JSONL_FILE     = 'output_results.jsonl' # ステップ完了ごとに結果を追記するファイル (.zst で終わる場合は zstd 圧縮)
+CHECKPOINT_DIR         = 'checkpoints' # チェックポイントファイルの保存先ディレクトリ
+MCP_CHECKPOINT_DIR     = 'output/checkpoints' # MCPサーバーのチェックポイント保存先 (resume_from はこの配下のみ指定可)
+ARTIFACT_DIR           = 'output/artifacts' # 大きな結果 (HTML・ページテキスト・PDFテキスト) の退避先
+
+# --- 大きな結果の退避 (アーティファクト) 関連設定 ---
+ARTIFACT_SPILL_ENABLED    = False  # 閾値を超える結果の文字列をファイルに退避し、結果にはハンドルだけを残す (artifact:// リソースを読めるクライアント向け。MCP では spill_artifacts で実行ごとに指定可)
+ARTIFACT_SPILL_THRESHOLD  = 32768  # 32KB 退避する文字列のサイズ閾値 (UTF-8バイト数)
+ARTIFACT_PREVIEW_CHARS    = 300    # ハンドルに含めるプレビューの文字数
 
 # --- その他 ---
 # 必要に応じて他の設定値を追加
@@ -0,0 +1,259 @@
+# --- ファイル: finder_benchmark.py ---
+"""
+動的探索 (find_element_dynamically / find_all_elements_dynamically) のベンチマーク。
+ローカルの HTTP サーバーで生成したフィクスチャページ (iframe の深さ・兄弟数・応答しない iframe・
+shadow DOM・要素数を変えたもの) をヘッドレスで探索し、シナリオごとの p50/p95 レイテンシと
+ブラウザとの往復回数を JSON で出力します。外部サイトには接続しないため、探索処理の変更前後の比較に使えます。
+
+使い方:
+    python finder_benchmark.py --iterations 20 --output output/finder_benchmark.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Optional
+from urllib.parse import urlparse, parse_qs
+
+from playwright.async_api import async_playwright, Page
+
+import config
+import playwright_finders
+
+logger = logging.getLogger(__name__)
+
+HANG_SECONDS = 30 # 応答しない iframe (/hang) がレスポンスを返すまでの時間
+
+# --- フィクスチャページ生成 ---
+def _page(body: str) -> str:
+    return f"<!DOCTYPE html><html><head><meta charset='utf-8'></head><body>{body}</body></html>"
+
+def _render_fixture(path: str, query: Dict[str, List[str]]) -> Optional[str]:
+    """パスとクエリからフィクスチャの HTML を生成する。未知のパスは None。"""
+    def arg(name: str, default: int) -> int:
+        return int(query.get(name, [default])[0])
+    if path == "/nest": # 深さ d の入れ子 iframe。最深部に目的の要素
+        depth = arg("d", 0)
+        if depth <= 0:
+            return _page("<p>leaf</p><button id='target'>target</button>")
+        return _page(f"<p>depth {depth}</p><iframe src='/nest?d={depth - 1}' width='600' height='400'></iframe>")
+    if path == "/siblings": # n 個の兄弟 iframe。最後の iframe にだけ目的の要素
+        count = arg("n", 1)
+        frames = "".join(f"<iframe src='/sibling?i={i}&last={int(i == count - 1)}' width='200' height='100'></iframe>" for i in range(count))
+        return _page(f"<p>siblings</p>{frames}")
+    if path == "/sibling":
+        return _page("<button id='target'>target</button>" if arg("last", 0) else "<p>empty</p>")
+    if path == "/dead": # 応答しない iframe が n 個あり、その後ろの有効な iframe に目的の要素
+        count = arg("n", 1)
+        frames = "".join(f"<iframe src='/hang?i={i}' width='200' height='100'></iframe>" for i in range(count))
+        return _page(f"<p>dead frames</p>{frames}<iframe src='/sibling?last=1' width='200' height='100'></iframe>")
+    if path == "/shadow": # 深さ d の入れ子 open shadow root の最深部に目的の要素
+        depth = arg("d", 1)
+        script = (
+            "<script>"
+            f"let host = document.getElementById('host');"
+            f"for (let i = 0; i < {depth}; i++) {{"
+            "  const root = host.attachShadow({mode: 'open'});"
+            "  const inner = document.createElement('div');"
+            "  inner.className = 'shadow-host-' + i;"
+            "  root.appendChild(inner);"
+            "  host = inner;"
+            "}"
+            "host.innerHTML = \"<button id='target'>target</button>\";"
+            "</script>"
+        )
+        return _page(f"<div id='host'></div>{script}")
+    if path == "/items": # n 個の一致要素 (トップレベルと iframe 内に半分ずつ)
+        count = arg("n", 10)
+        top = "".join(f"<a class='item' href='/x{i}'>item {i}</a>" for i in range(count // 2))
+        return _page(f"{top}<iframe src='/items_frame?n={count - count // 2}' width='600' height='400'></iframe>")
+    if path == "/items_frame":
+        return _page("".join(f"<a class='item' href='/y{i}'>item {i}</a>" for i in range(arg("n", 10))))
+    return None
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == "/hang":
+            time.sleep(HANG_SECONDS) # 読み込みが終わらない iframe を再現
+            body = _page("<p>too late</p>")
+        else:
+            body = _render_fixture(parsed.path, parse_qs(parsed.query))
+        if body is None:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass # ベンチマーク終了後に切断された /hang など
+
+    def log_message(self, format, *args):
+        pass # アクセスログは出力しない
+
+def start_fixture_server() -> ThreadingHTTPServer:
+    """空いているポートでフィクスチャサーバーをバックグラウンド起動する。"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FixtureHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# --- ブラウザとの往復回数の計測 ---
+class RoundTripCounter:
+    """
+    Playwright の内部チャネル (Channel.send 系) を一時的に包んで、ブラウザへの要求回数を数える。
+    内部APIが見つからないバージョンでは計測せず、count は None のままになる。
+    """
+    _METHOD_NAMES = ("send", "send_return_as_dict")
+
+    def __init__(self):
+        self.count: Optional[int] = None
+        self._originals: Dict[str, Any] = {}
+        try:
+            from playwright._impl._connection import Channel
+            self._channel_class = Channel
+        except ImportError:
+            self._channel_class = None
+
+    def __enter__(self) -> "RoundTripCounter":
+        if self._channel_class is None:
+            return self
+        self.count = 0
+        counter = self
+        for name in self._METHOD_NAMES:
+            original = getattr(self._channel_class, name, None)
+            if original is None:
+                continue
+            self._originals[name] = original
+            def make_wrapper(original_method):
+                async def wrapper(channel_self, *args, **kwargs):
+                    counter.count += 1
+                    return await original_method(channel_self, *args, **kwargs)
+                return wrapper
+            setattr(self._channel_class, name, make_wrapper(original))
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        for name, original in self._originals.items():
+            setattr(self._channel_class, name, original)
+        self._originals.clear()
+
+# --- シナリオ定義 ---
+# finder: 'single' は find_element_dynamically、'all' は find_all_elements_dynamically を計測
+SCENARIOS: List[Dict[str, Any]] = [
+    {"name": "depth_0", "path": "/nest?d=0", "finder": "single", "selector": "#target", "max_depth": 0},
+    {"name": "depth_1", "path": "/nest?d=1", "finder": "single", "selector": "#target", "max_depth": 1},
+    {"name": "depth_2", "path": "/nest?d=2", "finder": "single", "selector": "#target", "max_depth": 2},
+    {"name": "depth_3", "path": "/nest?d=3", "finder": "single", "selector": "#target", "max_depth": 3},
+    {"name": "siblings_5", "path": "/siblings?n=5", "finder": "single", "selector": "#target", "max_depth": 1},
+    {"name": "siblings_20", "path": "/siblings?n=20", "finder": "single", "selector": "#target", "max_depth": 1},
+    {"name": "dead_iframes_3", "path": "/dead?n=3", "finder": "single", "selector": "#target", "max_depth": 1},
+    {"name": "shadow_3", "path": "/shadow?d=3", "finder": "single", "selector": "#target", "max_depth": 1, "search_mode": "shadow"},
+    {"name": "race_depth_3", "path": "/nest?d=3", "finder": "single", "selector": "#target", "max_depth": 3, "search_mode": "race"},
+    {"name": "items_100", "path": "/items?n=100", "finder": "all", "selector": "a.item", "max_depth": 1},
+    {"name": "items_1000", "path": "/items?n=1000", "finder": "all", "selector": "a.item", "max_depth": 1},
+]
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """最近傍順位法による百分位数。"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return round(ordered[rank - 1], 1)
+
+async def _run_finder_once(page: Page, scenario: Dict[str, Any], timeout: int) -> Dict[str, Any]:
+    search_context = playwright_finders.new_search_context() # 実行間で無効 iframe の記録を持ち越さない
+    with RoundTripCounter() as counter:
+        start_time = time.monotonic()
+        if scenario["finder"] == "all":
+            elements = await playwright_finders.find_all_elements_dynamically(
+                page, scenario["selector"], max_depth=scenario["max_depth"], timeout=timeout, search_context=search_context
+            )
+            found = len(elements)
+        else:
+            element, _ = await playwright_finders.find_element_dynamically(
+                page, scenario["selector"], max_depth=scenario["max_depth"], timeout=timeout,
+                search_context=search_context, search_mode=scenario.get("search_mode")
+            )
+            found = 1 if element else 0
+        elapsed_ms = (time.monotonic() - start_time) * 1000
+    return {"elapsed_ms": elapsed_ms, "round_trips": counter.count, "found": found}
+
+async def run_benchmark(iterations: int, timeout: int, headless: bool, scenario_names: Optional[List[str]]) -> Dict[str, Any]:
+    server = start_fixture_server()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    scenarios = [s for s in SCENARIOS if not scenario_names or s["name"] in scenario_names]
+    report: Dict[str, Any] = {
+        "iterations": iterations,
+        "timeout_ms": timeout,
+        "search_backend": config.DYNAMIC_SEARCH_BACKEND,
+        "search_mode": config.DYNAMIC_SEARCH_MODE,
+        "scenarios": [],
+    }
+    try:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=headless)
+            try:
+                for scenario in scenarios:
+                    page = await browser.new_page()
+                    await page.goto(base_url + scenario["path"], wait_until="domcontentloaded")
+                    runs = [await _run_finder_once(page, scenario, timeout) for _ in range(iterations)]
+                    await page.close()
+                    latencies = [run["elapsed_ms"] for run in runs]
+                    round_trips = [run["round_trips"] for run in runs if run["round_trips"] is not None]
+                    summary = {
+                        "name": scenario["name"],
+                        "finder": scenario["finder"],
+                        "p50_ms": percentile(latencies, 50),
+                        "p95_ms": percentile(latencies, 95),
+                        "max_ms": round(max(latencies), 1),
+                        "round_trips_p50": percentile(round_trips, 50),
+                        "round_trips_max": max(round_trips) if round_trips else None,
+                        "found_min": min(run["found"] for run in runs),
+                    }
+                    report["scenarios"].append(summary)
+                    logger.info(f"{scenario['name']}: p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms 往復={summary['round_trips_p50']} 発見={summary['found_min']}")
+            finally:
+                await browser.close()
+    finally:
+        server.shutdown()
+    return report
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(
+        description="ローカルのフィクスチャページで動的探索のレイテンシと往復回数を計測します。",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--iterations", type=int, default=10, help="シナリオごとの計測回数。")
+    parser.add_argument("--timeout", type=int, default=config.DEFAULT_ACTION_TIMEOUT, help="1回の探索のタイムアウト (ミリ秒)。")
+    parser.add_argument("--headless", action=argparse.BooleanOptionalAction, default=True, help="ヘッドレスモードで実行。")
+    parser.add_argument("--scenario", action="append", metavar="NAME", help=f"実行するシナリオ (複数指定可)。未指定時は全て: {[s['name'] for s in SCENARIOS]}")
+    parser.add_argument("--use-scope-cache", action="store_true", help="スコープキャッシュを有効にしたまま計測する (既定では無効化して探索そのものを計測)。")
+    parser.add_argument("--output", metavar="FILE", help="結果JSONの出力先。未指定時は標準出力。")
+    args = parser.parse_args()
+
+    if not args.use_scope_cache:
+        config.SCOPE_CACHE_ENABLED = False # 学習済み経路による短絡を除外する
+    result = asyncio.run(run_benchmark(args.iterations, args.timeout, args.headless, args.scenario))
+    result_json = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        if os.path.dirname(args.output):
+            os.makedirs(os.path.dirname(args.output), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(result_json)
+        logger.info(f"ベンチマーク結果を {args.output} に書き込みました。")
+    else:
+        print(result_json)
+    sys.exit(0)
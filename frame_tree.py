@@ -0,0 +1,53 @@
+# --- ファイル: frame_tree.py ---
+"""
+page.frames (実際の Frame ツリー) をもとに、探索対象のフレーム一覧を提供します。
+FrameLocator による 'iframe:visible >> nth=i' の再解決を行わず、Frame オブジェクトを直接扱うため、
+訪問済み判定が正確になり、深い入れ子でも列挙は1回で済みます。
+一覧はページごとにキャッシュし、frameattached / framedetached / framenavigated イベントで無効化します。
+"""
+import logging
+import weakref
+from typing import List, Tuple, Dict, Any
+
+from playwright.async_api import Page, Frame
+
+logger = logging.getLogger(__name__)
+
+# (Frame, 深度, 起点からの child_frames インデックス経路)
+FrameEntry = Tuple[Frame, int, Tuple[int, ...]]
+
+# ページごとのキャッシュ: {"entries": List[FrameEntry] or None (要再構築)}
+_tree_cache: "weakref.WeakKeyDictionary[Page, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+
+def _watch_page(page: Page) -> Dict[str, Any]:
+    """ページのフレーム変化イベントを購読し、キャッシュ領域を返す。"""
+    state = _tree_cache.get(page)
+    if state is None:
+        state = {"entries": None}
+        def _invalidate(_frame: Frame) -> None:
+            state["entries"] = None
+        for event_name in ("frameattached", "framedetached", "framenavigated"):
+            page.on(event_name, _invalidate)
+        _tree_cache[page] = state
+    return state
+
+def get_frame_tree(page: Page, max_depth: int) -> List[FrameEntry]:
+    """
+    メインフレームを深度0とし、max_depth までのフレームを幅優先順で返す。
+    フレームの変化イベントが発生するまでは前回の一覧を再利用する (ブラウザへの往復は発生しない)。
+    """
+    state = _watch_page(page)
+    entries = state["entries"]
+    if entries is None:
+        entries = []
+        pending: List[FrameEntry] = [(page.main_frame, 0, ())]
+        while pending:
+            frame, depth, path = pending.pop(0)
+            if frame.is_detached():
+                continue
+            entries.append((frame, depth, path))
+            for index, child in enumerate(frame.child_frames):
+                pending.append((child, depth + 1, path + (index,)))
+        state["entries"] = entries
+        logger.debug(f"フレームツリーを再構築しました: {len(entries)} フレーム")
+    return [entry for entry in entries if entry[1] <= max_depth and not entry[0].is_detached()]
@@ -0,0 +1,93 @@
+# --- ファイル: html_cleanup_benchmark.py ---
+"""
+html_processor.cleanup_html のエンジン ('bs4' / 'lxml') の処理時間を比較するベンチマーク。
+保存済みの HTML (既定: t_simplified_html_output.html) を各エンジンで繰り返しクリーンアップし、
+p50/p95 の処理時間と、両エンジンの出力が一致するかを JSON で出力します。
+--scale を指定すると body の中身を複製して大きなページ (検索結果の多いSERPなど) を模擬します。
+
+使い方:
+    python html_cleanup_benchmark.py --iterations 10 --scale 5 --output output/html_cleanup_benchmark.json
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import sys
+import time
+from typing import List, Dict, Any, Optional
+
+import html_processor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HTML_FILE = 't_simplified_html_output.html'
+ENGINES = ['bs4', 'lxml']
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """最近傍順位法による百分位数。"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return round(ordered[rank - 1], 1)
+
+def scale_html(html_content: str, scale: int) -> str:
+    """body の中身を scale 回繰り返した HTML を返す。body が見つからない場合は文書全体を繰り返す。"""
+    if scale <= 1:
+        return html_content
+    match = re.search(r'(<body[^>]*>)(.*)(</body>)', html_content, re.IGNORECASE | re.DOTALL)
+    if not match:
+        return html_content * scale
+    return html_content[:match.start(2)] + match.group(2) * scale + html_content[match.end(2):]
+
+def run_benchmark(html_content: str, iterations: int, engines: List[str]) -> Dict[str, Any]:
+    results: Dict[str, Any] = {"input_chars": len(html_content), "iterations": iterations, "engines": {}}
+    outputs: Dict[str, str] = {}
+    for engine in engines:
+        timings_ms: List[float] = []
+        for _ in range(iterations):
+            start_time = time.perf_counter()
+            outputs[engine] = html_processor.cleanup_html(html_content, engine=engine)
+            timings_ms.append((time.perf_counter() - start_time) * 1000)
+        results["engines"][engine] = {
+            "p50_ms": percentile(timings_ms, 50),
+            "p95_ms": percentile(timings_ms, 95),
+            "output_chars": len(outputs[engine]),
+        }
+        logger.info(f"エンジン '{engine}': p50={results['engines'][engine]['p50_ms']}ms, p95={results['engines'][engine]['p95_ms']}ms")
+    if len(outputs) > 1:
+        results["outputs_match"] = len(set(outputs.values())) == 1
+    return results
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(
+        description="保存済みのHTMLで cleanup_html のエンジンごとの処理時間と出力の一致を計測します。",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--input", default=DEFAULT_HTML_FILE, help="クリーンアップするHTMLファイル。")
+    parser.add_argument("--iterations", type=int, default=5, help="エンジンごとの計測回数。")
+    parser.add_argument("--scale", type=int, default=1, help="body の中身を複製する倍率 (大きなページの模擬)。")
+    parser.add_argument("--engine", action="append", choices=ENGINES, help=f"計測するエンジン (複数指定可)。未指定時は全て: {ENGINES}")
+    parser.add_argument("--output", metavar="FILE", help="結果JSONの出力先。未指定時は標準出力。")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        source_html = f.read()
+    # 計測中はクリーンアップ処理自体のログを抑える
+    logging.getLogger().handlers[0].addFilter(lambda record: record.name == __name__ or record.levelno >= logging.WARNING)
+    result = run_benchmark(scale_html(source_html, args.scale), args.iterations, args.engine or ENGINES)
+    result["input_file"] = args.input
+    result["scale"] = args.scale
+    result_json = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        if os.path.dirname(args.output):
+            os.makedirs(os.path.dirname(args.output), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(result_json)
+        logger.info(f"ベンチマーク結果を {args.output} に書き込みました。")
+    else:
+        print(result_json)
+    sys.exit(0)
@@ -6,9 +6,14 @@ import logging
 import traceback
 import re
 import time
-from typing import List, Set
+from typing import List, Set, Dict, Any, Optional, Tuple
 from bs4 import BeautifulSoup, Comment # BeautifulSoupが必要
 
+try:
+    from lxml import etree # 任意: 'lxml' エンジンで使用 (ない場合は 'bs4' エンジンで処理)
+except ImportError:
+    etree = None
+
 logger = logging.getLogger(__name__)
 
 # --- HTMLクリーンアップ設定 ---
@@ -34,14 +39,25 @@ SECTIONS_TO_REMOVE_SELECTORS: List[str] = [
 TAGS_KEEP_STYLE_ATTR: Set[str] = {'a', 'button', 'input', 'textarea', 'select', 'option'}
 REMOVE_COMMENTS = True
 PRETTIFY_HTML = True # 整形するかどうか
+CLEANUP_ENGINE = 'lxml' # 'lxml': ルールを一度だけコンパイルし、lxml のツリーを1回の走査で削除 / 'bs4': 従来の BeautifulSoup による方式
 
 # --- HTMLクリーンアップ関数 ---
-def cleanup_html(html_content: str) -> str:
+def cleanup_html(html_content: str, engine: Optional[str] = None) -> str:
     """
     与えられたHTML文字列から不要なタグ、属性、コメントを削除し、整形します。
+    engine を省略した場合は CLEANUP_ENGINE を使用します。lxml がない場合は 'bs4' で処理します。
     """
     if not html_content:
         return ""
+    engine = engine or CLEANUP_ENGINE
+    if engine == 'lxml':
+        if etree is not None:
+            return _cleanup_html_lxml(html_content)
+        logging.debug("lxmlが見つからないため、bs4 エンジンで処理します。")
+    return _cleanup_html_bs4(html_content)
+
+def _cleanup_html_bs4(html_content: str) -> str:
+    """BeautifulSoup のツリーをコメント・セレクター・タグ・属性ごとに走査して削除する (従来の方式)。"""
     logging.info("HTMLクリーンアップ処理開始...")
     start_time = time.time()
     try:
@@ -143,6 +159,225 @@ def cleanup_html(html_content: str) -> str:
         logging.debug(traceback.format_exc())
         return html_content # エラー時は元のHTMLを返す
 
+# --- lxml エンジン (ルールのコンパイルと1回の走査による削除) ---
+_SIMPLE_SELECTOR_RE = re.compile(r'^([a-zA-Z][\w-]*)?((?:[.#][\w-]+|\[[\w-]+(?:=(?:"[^"]*"|\'[^\']*\'|[\w-]+))?\])*)$')
+_SELECTOR_PART_RE = re.compile(r'([.#])([\w-]+)|\[([\w-]+)(?:=(?:"([^"]*)"|\'([^\']*)\'|([\w-]+)))?\]')
+_LEADING_DOCTYPE_RE = re.compile(r'^\s*(?:<!--.*?-->\s*)*<!doctype', re.IGNORECASE | re.DOTALL)
+# 削除した要素の前後のテキストの境目の印 (Unicode の非文字)。従来の方式では前後が別の文字列のまま残り、
+# prettify() で別の行になるため、整形前に印の位置で文字列を分ける
+_TEXT_BOUNDARY = '\ufdd0'
+_compiled_rules_cache: Dict[Tuple, Dict[str, Any]] = {} # 設定値の組み合わせごとにコンパイル済みのルールを保持
+
+def _parse_simple_selector(selector: str) -> Optional[Dict[str, Any]]:
+    """
+    タグ名・.class・#id・[属性] / [属性="値"] の組み合わせだけからなるセレクターを条件の辞書に変換する。
+    それ以外 (子孫結合子や疑似クラスなど) の場合は None。
+    """
+    match = _SIMPLE_SELECTOR_RE.match(selector.strip())
+    if not match or not selector.strip():
+        return None
+    condition: Dict[str, Any] = {"tag": match.group(1).lower() if match.group(1) else None, "id": None, "classes": set(), "attrs": []}
+    for part in _SELECTOR_PART_RE.finditer(match.group(2)):
+        prefix, name, attr_name, dq_value, sq_value, bare_value = part.groups()
+        if prefix == '#':
+            condition["id"] = name
+        elif prefix == '.':
+            condition["classes"].add(name)
+        else:
+            value = next((v for v in (dq_value, sq_value, bare_value) if v is not None), None)
+            condition["attrs"].append((attr_name.lower(), value))
+    return condition
+
+def _compile_cleanup_rules() -> Dict[str, Any]:
+    """
+    モジュールの設定値から削除ルールをコンパイルする。設定値が変わらない限り、結果を再利用する。
+    単一のタグ名・id・class だけのセレクターは集合に振り分け、要素ごとの判定を集合の参照で済ませる。
+    """
+    cache_key = (tuple(TAGS_TO_REMOVE), tuple(ATTRIBUTES_TO_REMOVE), tuple(SECTIONS_TO_REMOVE_SELECTORS), frozenset(TAGS_KEEP_STYLE_ATTR))
+    rules = _compiled_rules_cache.get(cache_key)
+    if rules is not None:
+        return rules
+    rules = {
+        "remove_tags": {tag.lower() for tag in TAGS_TO_REMOVE},
+        "remove_ids": set(),
+        "remove_classes": set(),
+        "conditions": [],        # タグ・id・class・属性の組み合わせ条件
+        "complex_selectors": [], # 1回の走査では判定できないセレクター (cssselect で事前に一致要素を求める)
+        "literal_attrs": set(),
+        "attr_patterns": [],
+        "keep_style_tags": set(TAGS_KEEP_STYLE_ATTR),
+        "attr_decisions": {},    # 属性名ごとの削除判定のメモ
+    }
+    for selector in SECTIONS_TO_REMOVE_SELECTORS:
+        condition = _parse_simple_selector(selector)
+        if condition is None:
+            rules["complex_selectors"].append(selector)
+        elif condition["tag"] and not (condition["id"] or condition["classes"] or condition["attrs"]):
+            rules["remove_tags"].add(condition["tag"])
+        elif condition["id"] and not (condition["tag"] or condition["classes"] or condition["attrs"]):
+            rules["remove_ids"].add(condition["id"])
+        elif len(condition["classes"]) == 1 and not (condition["tag"] or condition["id"] or condition["attrs"]):
+            rules["remove_classes"].update(condition["classes"])
+        else:
+            rules["conditions"].append(condition)
+    # 属性名の判定は従来の方式と同じ基準 (正規表現の記号を含むものを正規表現として扱う)
+    for item in ATTRIBUTES_TO_REMOVE:
+        if isinstance(item, str) and any(c in item for c in '^$*+?.'):
+            try: rules["attr_patterns"].append(re.compile(item))
+            except re.error: logging.warning(f"  - 無効な属性削除正規表現をスキップ: {item}")
+        elif isinstance(item, str): rules["literal_attrs"].add(item)
+    _compiled_rules_cache.clear()
+    _compiled_rules_cache[cache_key] = rules
+    return rules
+
+def _matches_condition(element: Any, condition: Dict[str, Any]) -> bool:
+    if condition["tag"] and element.tag != condition["tag"]:
+        return False
+    if condition["id"] and element.get("id") != condition["id"]:
+        return False
+    if condition["classes"] and not condition["classes"].issubset((element.get("class") or "").split()):
+        return False
+    for attr_name, value in condition["attrs"]:
+        attr_value = element.get(attr_name)
+        if attr_value is None or (value is not None and attr_value != value):
+            return False
+    return True
+
+def _should_remove_element(element: Any, rules: Dict[str, Any], complex_matches: Set[Any]) -> bool:
+    if element.tag in rules["remove_tags"] or element in complex_matches:
+        return True
+    if rules["remove_ids"] and element.get("id") in rules["remove_ids"]:
+        return True
+    class_value = element.get("class")
+    if class_value and rules["remove_classes"] and not rules["remove_classes"].isdisjoint(class_value.split()):
+        return True
+    return any(_matches_condition(element, condition) for condition in rules["conditions"])
+
+def _should_remove_attr(attr_name: str, rules: Dict[str, Any]) -> bool:
+    decision = rules["attr_decisions"].get(attr_name)
+    if decision is None:
+        decision = attr_name in rules["literal_attrs"] or any(pattern.match(attr_name) for pattern in rules["attr_patterns"])
+        rules["attr_decisions"][attr_name] = decision
+    return decision
+
+def _remove_keep_tail(element: Any, boundary: str) -> None:
+    """
+    要素を削除する。要素の後ろに続くテキスト (tail) は直前の兄弟または親に付け替えて残す。
+    付け替え先と tail がどちらも空白以外を含む場合は、間に boundary を挟む。
+    """
+    parent = element.getparent()
+    tail = element.tail
+    if tail:
+        previous = element.getprevious()
+        preceding_text = (previous.tail if previous is not None else parent.text) or ""
+        separator = boundary if preceding_text.strip() and tail.strip() else ""
+        if previous is not None:
+            previous.tail = f"{preceding_text}{separator}{tail}"
+        else:
+            parent.text = f"{preceding_text}{separator}{tail}"
+    parent.remove(element)
+
+def _split_text_at_boundaries(soup: BeautifulSoup) -> None:
+    """文字列を _TEXT_BOUNDARY の位置で別々の文字列に分ける (従来の方式と同じ整形結果にするため)。"""
+    for string in soup.find_all(string=lambda text: _TEXT_BOUNDARY in text):
+        string.replace_with(*[type(string)(part) for part in string.split(_TEXT_BOUNDARY) if part])
+
+def _find_complex_selector_matches(root: Any, selectors: List[str]) -> Optional[Set[Any]]:
+    """1回の走査では判定できないセレクターに一致する要素を求める。cssselect がない場合は None。"""
+    if not selectors:
+        return set()
+    try:
+        from lxml.cssselect import CSSSelector
+    except ImportError:
+        return None
+    matches: Set[Any] = set()
+    for selector in selectors:
+        try:
+            matches.update(CSSSelector(selector)(root))
+        except Exception as e_sel:
+            logging.warning(f"  - セクション削除セレクター '{selector}' の処理中にエラー: {e_sel}")
+    return matches
+
+def _serialize_document(root: Any, html_content: str) -> str:
+    """
+    削除後のツリーを HTML 文字列にする。libxml2 は DOCTYPE がない文書にも既定の DOCTYPE を補うため、
+    元の HTML に DOCTYPE がある場合だけ出力する。ルート要素の前後のコメントは REMOVE_COMMENTS が False の場合だけ残す。
+    """
+    parts: List[str] = []
+    if _LEADING_DOCTYPE_RE.match(html_content) and root.getroottree().docinfo.doctype:
+        parts.append(root.getroottree().docinfo.doctype)
+    siblings_before = [] if REMOVE_COMMENTS else list(root.itersiblings(preceding=True))[::-1]
+    siblings_after = [] if REMOVE_COMMENTS else list(root.itersiblings())
+    for node in siblings_before + [root] + siblings_after:
+        parts.append(etree.tostring(node, encoding="unicode", method="html", with_tail=False))
+    return "".join(parts)
+
+def _cleanup_html_lxml(html_content: str) -> str:
+    """
+    lxml のツリーを1回だけ走査し、コメント・削除対象のセクションとタグ・不要な属性をまとめて削除する。
+    削除した要素の子孫は走査しない。
+    整形 (prettify) は従来の方式と同じ出力になるよう、削除後の小さな HTML を BeautifulSoup で行う。
+    PRETTIFY_HTML が False の場合、head 内などの空白だけのテキストは従来の方式と一致しないことがある。
+    """
+    logging.info("HTMLクリーンアップ処理開始 (lxml)...")
+    start_time = time.time()
+    try:
+        rules = _compile_cleanup_rules()
+        parser = etree.HTMLParser(encoding="utf-8")
+        root = etree.fromstring(html_content.encode("utf-8"), parser)
+        if root is None:
+            return _cleanup_html_bs4(html_content)
+        complex_matches = _find_complex_selector_matches(root, rules["complex_selectors"])
+        if complex_matches is None:
+            logging.debug("cssselect が見つからないため、bs4 エンジンで処理します。")
+            return _cleanup_html_bs4(html_content)
+
+        # 整形しない場合、または元の HTML に印の文字が含まれる場合は、テキストの境目を記録しない
+        boundary = _TEXT_BOUNDARY if PRETTIFY_HTML and _TEXT_BOUNDARY not in html_content else ""
+        removed_comments_count = 0
+        removed_element_count = 0
+        removed_attrs_count = 0
+        stack = [root]
+        while stack:
+            element = stack.pop()
+            # 属性削除 (style は TAGS_KEEP_STYLE_ATTR のタグでは残す)
+            attrs_to_delete = [
+                attr_name for attr_name in element.attrib
+                if _should_remove_attr(attr_name, rules) and not (attr_name == 'style' and element.tag in rules["keep_style_tags"])
+            ]
+            for attr_name in attrs_to_delete:
+                del element.attrib[attr_name]
+            removed_attrs_count += len(attrs_to_delete)
+            for child in list(element):
+                if not isinstance(child.tag, str):
+                    # コメントはパース時ではなくここで削除する (前後のテキストの境目を記録するため)。処理命令などは残す
+                    if REMOVE_COMMENTS and child.tag is etree.Comment:
+                        _remove_keep_tail(child, boundary)
+                        removed_comments_count += 1
+                    continue
+                if _should_remove_element(child, rules, complex_matches):
+                    _remove_keep_tail(child, boundary)
+                    removed_element_count += 1
+                else:
+                    stack.append(child)
+        if removed_comments_count > 0: logging.info(f"  - {removed_comments_count} 個のコメントを削除しました。")
+        if removed_element_count > 0: logging.info(f"  - 合計 {removed_element_count} 個のセクション・指定タグを削除しました。")
+        if removed_attrs_count > 0: logging.info(f"  - 合計 {removed_attrs_count} 個の不要な属性を削除しました。")
+
+        pruned_html = _serialize_document(root, html_content)
+        soup = BeautifulSoup(pruned_html, 'lxml')
+        if boundary and boundary in pruned_html:
+            _split_text_at_boundaries(soup)
+        cleaned_html = soup.prettify() if PRETTIFY_HTML else str(soup)
+        end_time = time.time()
+        logging.info(f"HTMLクリーンアップ完了 (lxml, 処理時間: {end_time - start_time:.2f}秒).")
+        return cleaned_html
+
+    except Exception as e:
+        logging.error(f"HTMLクリーンアップ (lxml) 中に予期せぬエラーが発生しました: {e}")
+        logging.debug(traceback.format_exc())
+        return _cleanup_html_bs4(html_content) # 従来の方式で処理する
+
 # --- 単体テスト用 ---
 if __name__ == '__main__':
     import time
@@ -8,7 +8,6 @@ import asyncio
 import logging
 import os
 import sys
-import pprint
 
 # --- 各モジュールをインポート ---
 import config
@@ -16,6 +15,8 @@ import utils
 # --- ▼▼▼ 修正 ▼▼▼ ---
 # import playwright_handler -> playwright_launcher をインポート
 import playwright_launcher
+import action_plan
+import result_stream
 # --- ▲▲▲ 修正 ▲▲▲ ---
 
 # --- エントリーポイント ---
@@ -50,6 +51,34 @@ if __name__ == "__main__":
         metavar="MS",
         help="各操作間の待機時間(ms)。"
     )
+    parser.add_argument(
+        '--checkpoint',
+        action='store_true',
+        help=f"各ステップ成功後 (paginate では URL が変わるページ切替ごと) にチェックポイントを '{config.CHECKPOINT_DIR}' に保存する。"
+    )
+    parser.add_argument(
+        '--resume-from',
+        default=None,
+        metavar="CHECKPOINT",
+        help="指定したチェックポイントファイルから実行を再開する。"
+    )
+    parser.add_argument(
+        '--results-jsonl',
+        default=config.RESULTS_JSONL_FILE,
+        metavar="FILE",
+        help="各ステップの結果を完了ごとに追記する JSONL ファイル (.zst で終わる場合は zstd 圧縮)。"
+    )
+    parser.add_argument(
+        '--text-report',
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help=f"実行後に JSONL からテキストレポート ('{config.RESULTS_OUTPUT_FILE}') を生成する。"
+    )
+    parser.add_argument(
+        '--lint',
+        action='store_true',
+        help="アクションを実行せずにプランを検査し、固定 sleep の置き換え候補などを表示する。"
+    )
     args = parser.parse_args()
 
     # --- 3. 入力ファイルパス解決 ---
@@ -82,6 +111,18 @@ if __name__ == "__main__":
             logging.critical(f"エラー: JSON '{json_file_path}' から target_url または actions を取得できませんでした。")
             sys.exit(1)
 
+        if args.lint:
+            findings = action_plan.lint_actions(actions)
+            print(f"\n--- プラン検査結果 ({json_file_path}): {len(findings)} 件 ---")
+            for finding in findings:
+                print(f"[ステップ {finding['step']}] {finding['rule']}: {finding['message']}")
+                print(f"    置き換え例: {finding['suggestion']}")
+            sys.exit(0)
+
+        checkpoint_path = utils.default_checkpoint_path() if args.checkpoint and not args.resume_from else None
+        if checkpoint_path:
+            logging.info(f"チェックポイントファイル: {checkpoint_path}")
+
         # --- ▼▼▼ 修正 ▼▼▼ ---
         # Playwrightハンドラ -> ランチャー を呼び出し
         success, results = asyncio.run(playwright_launcher.run_playwright_automation_async(
@@ -89,18 +130,24 @@ if __name__ == "__main__":
             actions=actions,
             headless_mode=args.headless, # BooleanOptionalAction の結果を渡す
             slow_motion=args.slowmo,
-            default_timeout=effective_default_timeout
+            default_timeout=effective_default_timeout,
+            checkpoint_path=checkpoint_path,
+            resume_from=args.resume_from,
+            result_stream_path=args.results_jsonl
         ))
         # --- ▲▲▲ 修正 ▲▲▲ ---
 
         # --- 5. 結果表示・出力 ---
+        # 結果全体の整形表示は大きなクロールでは遅いため、ステップごとの状態だけを表示する (詳細は JSONL を参照)
         print("\n--- 最終実行結果 ---")
-        # pprintで見やすく整形して表示
-        pprint.pprint(results)
-        logging.info(f"最終実行結果(詳細):\n{pprint.pformat(results)}")
+        for res in results:
+            print(f"  Step {res.get('step')}: {res.get('action', '')} ({res.get('status')}){' - ' + str(res.get('message')) if res.get('status') == 'error' else ''}")
+        print(f"詳細な結果: {args.results_jsonl}")
 
-        # 結果ファイル書き込み (utils内の関数を使用)
-        utils.write_results_to_file(results, config.RESULTS_OUTPUT_FILE) # 単体実行用出力ファイル
+        # テキストレポートは JSONL から生成する (result_stream.py で後から生成することもできる)
+        if args.text_report:
+            jsonl_path = args.results_jsonl if os.path.exists(args.results_jsonl) else args.results_jsonl.removesuffix(result_stream.ZSTD_SUFFIX)
+            result_stream.render_text_report(jsonl_path, config.RESULTS_OUTPUT_FILE) # 単体実行用出力ファイル
 
         sys.exit(0 if success else 1)
 
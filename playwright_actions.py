@@ -3,6 +3,9 @@
 Playwrightの各アクション（クリック、入力、取得など）を実行するコアロジック。
 """
 import asyncio
+import contextlib
+import hashlib
+import json
 import logging
 import os
 import time
@@ -10,7 +13,8 @@ import pprint
 import traceback
 import re # <<< 正規表現モジュールをインポート
 from urllib.parse import urljoin, urlparse # <<< urlparse を追加
-from typing import List, Tuple, Optional, Union, Dict, Any, Set # <<< Set を追加
+from typing import List, Tuple, Optional, Union, Dict, Any, Set, Callable # <<< Set を追加
+import httpx # PDF判定・ダウンロードのクライアントをステップ内で共有する
 
 from playwright.async_api import (
     Page,
@@ -25,8 +29,21 @@ from playwright.async_api import (
 
 import config
 import utils # PDF処理などで使用
-from playwright_finders import find_element_dynamically, find_all_elements_dynamically
-from playwright_helper_funcs import get_page_inner_text # get_page_inner_text は別途使用
+from playwright_finders import find_element_dynamically, find_element_groups_dynamically, new_search_context, ElementGroup
+from playwright_hints import resolve_target_hints_async
+import action_plan
+import artifact_store
+import refresh_cache
+from playwright_helper_funcs import (
+    get_page_inner_text, # get_page_inner_text は別途使用
+    wait_for_dom_settle_async,
+    wait_for_settle_async,
+    arm_settle_async,
+    ArmedSettle,
+    SETTLE_MODES,
+    scroll_scope_to_bottom_async,
+    extract_items_from_index_async,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +51,31 @@ logger = logging.getLogger(__name__)
 # メールアドレス抽出用の正規表現 (一般的なもの)
 EMAIL_REGEX = re.compile(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}")
 
+async def _get_page_inner_text_incremental(
+    context: BrowserContext, api_request_context: APIRequestContext, url: str, timeout: int, http_client: Optional[httpx.AsyncClient] = None
+) -> Tuple[bool, Optional[str], str]:
+    """
+    差分取得モードでページのテキストを取得する。前回の検証子で 304 が返れば前回のテキストを再利用し (ページを開かない)、
+    そうでなければ通常どおり取得して記録する。(成功したか, テキストまたはエラー, 差分状態) を返す。
+    前回の記録がない場合は条件付きリクエストを送らず、検証子はページを開いたときのレスポンスから記録する。
+    """
+    previous_entry = refresh_cache.get_entry(url)
+    if previous_entry:
+        probe = await utils.conditional_probe_async(api_request_context, url, previous_entry, client=http_client)
+        if probe["not_modified"]:
+            previous_text = refresh_cache.load_previous_text(previous_entry)
+            if previous_text is not None:
+                logger.info(f"ページは前回から変更されていません (304)。前回のテキストを再利用します: {url}")
+                refresh_cache.mark_not_modified(url, None)
+                return True, previous_text, refresh_cache.REFRESH_UNCHANGED
+    response_info: Dict[str, Any] = {}
+    success, content_or_error = await get_page_inner_text(context, url, timeout, response_info=response_info)
+    if not success or content_or_error is None:
+        return success, content_or_error, refresh_cache.REFRESH_CHANGED if previous_entry else refresh_cache.REFRESH_NEW
+    # ページは検証子があっても動的に変わることが多いため、状態はテキストのハッシュで判定する
+    refresh_state = refresh_cache.record(url, None, content_or_error, None, response_info.get("etag"), response_info.get("last_modified"))
+    return success, content_or_error, refresh_state
+
 async def _extract_emails_from_page_async(context: BrowserContext, url: str, timeout: int) -> List[str]:
     """
     指定されたURLに新しいページでアクセスし、ページのinnerTextとmailtoリンクからメールアドレスを抽出する。
@@ -50,16 +92,16 @@ async def _extract_emails_from_page_async(context: BrowserContext, url: str, tim
         page = await context.new_page()
         # ナビゲーションタイムアウトを設定
         nav_timeout = max(int(page_access_timeout * 0.9), 10000)
-        logger.debug(f"  Navigating to {url} with timeout {nav_timeout}ms")
+        logger.debug("  Navigating to %s with timeout %dms", url, nav_timeout)
         await page.goto(url, wait_until="load", timeout=nav_timeout)
-        logger.debug(f"  Navigation to {url} successful.")
+        logger.debug("  Navigation to %s successful.", url)
 
         # ページ全体のテキストを取得 (タイムアウトは残り時間で)
         remaining_time_for_text = page_access_timeout - (time.monotonic() - start_time) * 1000
         if remaining_time_for_text <= 1000: # 最低1秒は確保
             raise PlaywrightTimeoutError(f"Not enough time left to get page text from {url}")
         text_timeout = int(remaining_time_for_text)
-        logger.debug(f"  Getting page innerText with timeout {text_timeout}ms")
+        logger.debug("  Getting page innerText with timeout %dms", text_timeout)
         # bodyがない場合もあるので、ルート要素から取得を試みる
         page_text = await page.locator(':root').inner_text(timeout=text_timeout)
 
@@ -67,13 +109,13 @@ async def _extract_emails_from_page_async(context: BrowserContext, url: str, tim
         if page_text:
             found_in_text = EMAIL_REGEX.findall(page_text)
             if found_in_text:
-                logger.debug(f"  Found {len(found_in_text)} potential emails in page text.")
+                logger.debug("  Found %d potential emails in page text.", len(found_in_text))
                 emails_found.update(found_in_text) # Setに追加して重複排除
 
         # mailto: リンクからメールアドレスを抽出
         mailto_links = await page.locator("a[href^='mailto:']").all()
         if mailto_links:
-            logger.debug(f"  Found {len(mailto_links)} mailto links.")
+            logger.debug("  Found %d mailto links.", len(mailto_links))
             for link in mailto_links:
                 try:
                     href = await link.get_attribute('href', timeout=500) # mailtoリンク取得は短時間で
@@ -85,9 +127,9 @@ async def _extract_emails_from_page_async(context: BrowserContext, url: str, tim
                              # 簡易バリデーション
                              if EMAIL_REGEX.match(email_part):
                                  emails_found.add(email_part)
-                                 logger.debug(f"    Extracted email from mailto: {email_part}")
+                                 logger.debug("    Extracted email from mailto: %s", email_part)
                              else:
-                                  logger.debug(f"    Skipping invalid mailto part: {email_part}")
+                                  logger.debug("    Skipping invalid mailto part: %s", email_part)
 
                 except PlaywrightTimeoutError:
                     logger.warning(f"  Timeout getting href from a mailto link on {url}")
@@ -121,25 +163,236 @@ async def _extract_emails_from_page_async(context: BrowserContext, url: str, tim
 # --- ▲▲▲ 追加 ▲▲▲ ---
 
 
+# --- paginate アクション用ヘルパー ---
+# 「新しい項目」の判定に使う結果キー (リスト値の各要素を項目として扱う)
+PAGINATE_ITEM_RESULT_KEYS = ("url_list", "text_list", "attribute_list", "extracted_emails")
+
+def _collect_page_item_keys(step_results: List[Dict[str, Any]]) -> Set[str]:
+    """
+    ページ内で実行された本体ステップの結果から、項目を識別するキーの集合を作る。
+    取得系アクションのリスト結果と単一値 (text, value) を対象とする。
+    """
+    item_keys: Set[str] = set()
+    for res in step_results:
+        if res.get("status") != "success":
+            continue
+        for key in PAGINATE_ITEM_RESULT_KEYS:
+            values = res.get(key)
+            if isinstance(values, list):
+                item_keys.update(f"{key}:{v}" for v in values if v is not None)
+        for key in ("text", "value"):
+            if res.get(key) is not None:
+                item_keys.add(f"{key}:{res[key]}")
+    return item_keys
+
+async def _arm_step_settle(
+    step_data: Dict[str, Any], root_page: Page, scope: Union[Page, FrameLocator], timeout: int
+) -> Optional[ArmedSettle]:
+    """
+    click / paginate の settle_mode 指定から、アクションの前に監視を開始した静止待機を作る (指定がなければ None)。
+    selector_count は settle_selector の要素数、settle_count はその期待数 (以上) を表す。
+    """
+    settle_mode = (step_data.get("settle_mode") or "").lower()
+    if not settle_mode:
+        return None
+    if settle_mode not in SETTLE_MODES:
+        raise ValueError(f"Invalid 'settle_mode': '{settle_mode}'. Use one of {list(SETTLE_MODES)}.")
+    try:
+        quiet_ms = int(step_data.get("quiet_ms") or config.SETTLE_QUIET_MS)
+        expected_count = int(step_data["settle_count"]) if step_data.get("settle_count") is not None else None
+    except (TypeError, ValueError):
+        raise ValueError("Invalid 'quiet_ms' or 'settle_count' for settle_mode.")
+    return await arm_settle_async(
+        root_page, scope, settle_mode, timeout, quiet_ms=quiet_ms,
+        url_pattern=step_data.get("url_pattern"), selector=step_data.get("settle_selector"), expected_count=expected_count
+    )
+
+# スコープ単位の一括抽出スクリプト (要素ごとの往復を避ける)
+_TEXT_CONTENTS_JS = "els => els.map(el => (el.textContent || '').trim())"
+_ATTRIBUTE_VALUES_JS = "(els, attr) => els.map(el => el.getAttribute(attr))"
+
+async def _evaluate_all_in_groups(element_groups: List[ElementGroup], script: str, arg: Any = None, label: str = "value") -> List[Any]:
+    """
+    スコープごとのグループに対して evaluate_all を1回ずつ (並行に) 実行し、探索順に連結した値のリストを返す。
+    往復回数は要素数ではなくスコープ数に比例する。失敗したスコープは件数分のエラー文字列で埋める。
+    """
+    group_values = await asyncio.gather(
+        *[scope.locator(selector).evaluate_all(script, arg) for scope, selector, _ in element_groups],
+        return_exceptions=True
+    )
+    values: List[Any] = []
+    for (scope, selector, count), scope_values in zip(element_groups, group_values):
+        if isinstance(scope_values, Exception):
+            logger.warning(f"  スコープ {type(scope).__name__} での {label} 一括取得中にエラー ({count}件): {type(scope_values).__name__} - {scope_values}")
+            values.extend([f"Error: {type(scope_values).__name__} getting {label}"] * count)
+        else:
+            values.extend(scope_values)
+    return values
+
+
+# 実行条件・早期終了条件のキー (評価順)。早期終了条件を先に評価する
+STEP_CONDITION_KEYS = ("exit_if_exists", "exit_unless_exists", "if_exists", "unless_exists")
+
+async def _evaluate_step_conditions(scope: Union[Page, FrameLocator], step_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    ステップの実行条件・早期終了条件を、待機しない count() で1回だけ評価する。
+    条件が成立した場合は {"outcome": "skip" | "exit", "condition": キー, "selector": セレクター} を返し、
+    何もしない (通常どおり実行する) 場合は None を返す。
+    """
+    for key in STEP_CONDITION_KEYS:
+        condition_selector = step_data.get(key)
+        if not condition_selector:
+            continue
+        exists = await scope.locator(condition_selector).count() > 0
+        if key == "exit_if_exists" and exists or key == "exit_unless_exists" and not exists:
+            return {"outcome": "exit", "condition": key, "selector": condition_selector}
+        if key == "if_exists" and not exists or key == "unless_exists" and exists:
+            return {"outcome": "skip", "condition": key, "selector": condition_selector}
+    return None
+
+
 async def execute_actions_async(
     initial_page: Page,
     actions: List[Dict[str, Any]],
     api_request_context: APIRequestContext,
-    default_timeout: int
+    default_timeout: int,
+    checkpoint_path: Optional[str] = None,
+    start_index: int = 0,
+    initial_results: Optional[List[Dict[str, Any]]] = None,
+    on_step_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+    initial_frame_chains: Optional[List[Optional[List[str]]]] = None,
+    checkpoint_results_bytes: Optional[int] = None,
+    spill_artifacts: Optional[bool] = None,
+    initial_paginate_state: Optional[Dict[str, Any]] = None
 ) -> Tuple[bool, List[Dict[str, Any]]]:
     """
     指定されたページを起点として、定義されたアクションリストを順に実行します。
     iframeの探索や切り替え、データ取得、エラーハンドリングなどを行います。
     実行全体の成否 (bool) と、各ステップの結果詳細のリスト (List[dict]) を返します。
+    checkpoint_path を指定すると、各ステップの成功後に再開用のチェックポイントを保存します。
+    start_index / initial_results / initial_frame_chains (iframe スタックと現在のスコープの復元用) は
+    チェックポイントからの再開時に使用します。checkpoint_results_bytes は、同じチェックポイントファイルから再開する場合に
+    initial_results が書き込み済みの結果ファイルのバイト数です (None の場合は結果ファイルを作り直して全件を書き込む)。
+    チェックポイントはトップレベルのステップ単位で保存し、トップレベルの paginate では URL が変わるページ切替のたびにも保存します。
+    initial_paginate_state (チェックポイントの paginate_state) を渡すと、その paginate は中断したページから続けます。
+    URL が変わらないページ切替 (同じ URL 上での再描画) では途中のページを開き直せないため、paginate の最初のページからやり直します。
+    on_step_result を指定すると、各ステップの完了直後にそのステップで追加された結果を1件ずつ渡します (JSONL 出力など)。
+    spill_artifacts は大きな結果をアーティファクトに退避するかどうかです (None の場合は config.ARTIFACT_SPILL_ENABLED)。
     """
-    results: List[Dict[str, Any]] = []
+    if spill_artifacts is None:
+        spill_artifacts = config.ARTIFACT_SPILL_ENABLED
+    results: List[Dict[str, Any]] = list(initial_results) if initial_results else []
+    emitted_count = len(results) # on_step_result に渡し済みの件数 (再開時の既存結果は渡さない)
     current_target: Union[Page, FrameLocator] = initial_page # 現在の操作対象スコープ
     root_page: Page = initial_page # ルートとなるページオブジェクト (ページ遷移後も更新)
     current_context: BrowserContext = root_page.context # 現在のブラウザコンテキスト
     iframe_stack: List[Union[Page, FrameLocator]] = [] # iframe切り替えのためのスタック
-
-    for i, step_data in enumerate(actions):
-        step_num = i + 1
+    # iframe_stack の各スコープと現在のスコープを、ルートページから辿る frame_locator のセレクター列で表したもの (チェックポイントからの復元用)。
+    # Frameツリー方式の探索結果 (Frame) のように辿り直せないスコープは None
+    frame_chain_stack: List[Optional[List[str]]] = []
+    current_frame_chain: Optional[List[str]] = []
+    exit_requested: Optional[Dict[str, Any]] = None # 早期終了条件が成立した場合にその内容を保持
+    search_context: Dict[str, Any] = new_search_context() # 無効と判定した iframe などを実行全体で共有
+    # チェックポイントの結果ファイルに書き込み済みの件数とバイト数
+    checkpointed_count, checkpointed_bytes = (len(results), checkpoint_results_bytes) if checkpoint_results_bytes is not None else (0, 0)
+    last_storage_state_digest: Optional[str] = None # 前回保存したストレージ状態のダイジェスト (変化したときだけ書き込む)
+    paginate_resume_state: Dict[str, Any] = dict(initial_paginate_state or {}) # 再開する paginate の位置 (使用後は空にする)
+
+    if initial_frame_chains:
+        # チェックポイント保存時の iframe スタックと現在のスコープを、ルートページから frame_locator を辿り直して復元する
+        if all(chain is not None for chain in initial_frame_chains):
+            restored_scopes: List[Union[Page, FrameLocator]] = []
+            for chain in initial_frame_chains:
+                scope: Union[Page, FrameLocator] = root_page
+                for frame_selector in chain:
+                    scope = scope.frame_locator(frame_selector)
+                restored_scopes.append(scope)
+            iframe_stack.extend(restored_scopes[:-1])
+            frame_chain_stack.extend(initial_frame_chains[:-1])
+            current_target = restored_scopes[-1]
+            current_frame_chain = initial_frame_chains[-1]
+            logger.info(f"チェックポイントから iframe スコープを復元しました: {current_frame_chain or 'ページ'} (スタック {len(iframe_stack)} 件)")
+        else:
+            logger.warning("チェックポイント保存時のスコープは辿り直せない (Frameツリー方式の探索結果) ため、ページのトップレベルから再開します。")
+
+    def _push_scope(new_target: Union[Page, FrameLocator, Frame], new_chain: Optional[List[str]]) -> None:
+        """現在のスコープを iframe_stack に積み (重複は積まない)、new_target に切り替える。"""
+        nonlocal current_target, current_frame_chain
+        if id(current_target) not in [id(s) for s in iframe_stack]:
+            iframe_stack.append(current_target)
+            frame_chain_stack.append(current_frame_chain)
+        current_target = new_target
+        current_frame_chain = new_chain
+
+    def _emit_new_results() -> None:
+        """on_step_result に未出力の結果を渡す。"""
+        nonlocal emitted_count
+        if on_step_result:
+            for result in results[emitted_count:]:
+                try:
+                    on_step_result(result)
+                except Exception as emit_err:
+                    # 結果の出力失敗で本処理は止めない
+                    logger.warning(f"ステップ結果の出力に失敗しました: {type(emit_err).__name__} - {emit_err}")
+        emitted_count = len(results)
+
+    async def _run_step(step_num: Union[int, str], step_data: Dict[str, Any], total_steps: int, result_extra: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        1ステップを実行し、結果を results に追加する。成功なら True、処理中断が必要なら False を返す。
+        paginate などの複合アクションからも本体ステップの実行に再利用される。
+        このステップの結果にはタイミング内訳 (timing) を付与し、完了時に on_step_result へ出力する。
+        retry 指定 (action_plan.compile_actions で正規化済み) がある場合は、
+        対象のエラー分類で失敗した試行の結果を破棄し、バックオフ後に再実行する。
+        result_extra を指定すると、このステップで追加された全結果に出力前に付与する (paginate のページ番号など)。
+        """
+        step_timing = utils.new_step_timing()
+        results_before_step = len(results)
+        step_start_time = time.monotonic()
+        retry_policy: Optional[Dict[str, Any]] = step_data.get("_retry_policy")
+        max_attempts = retry_policy["attempts"] if retry_policy else 1
+        retry_errors: List[Dict[str, Any]] = []
+        attempt = 1
+        while True:
+            results_before_attempt = len(results)
+            step_ok = await _run_step_body(step_num, step_data, total_steps, step_timing, attempts_left=max_attempts - attempt)
+            if step_ok or attempt >= max_attempts:
+                break
+            last_result = results[-1] if len(results) > results_before_attempt else {}
+            error_class = last_result.get("error_class")
+            if last_result.get("step") != step_num or error_class not in retry_policy["on"]:
+                break
+            delay_ms = action_plan.retry_delay_ms(retry_policy, attempt)
+            logger.warning(f"ステップ {step_num} が '{error_class}' で失敗しました。{delay_ms}ms 後にリトライします ({attempt + 1}/{max_attempts})。")
+            retry_errors.append({"attempt": attempt, "error_class": error_class, "message": last_result.get("message")})
+            del results[results_before_attempt:] # 失敗した試行の結果は最終結果に残さない
+            with utils.measure_ms(step_timing, "wait_ms"):
+                await asyncio.sleep(delay_ms / 1000)
+            attempt += 1
+        timing_summary = utils.finalize_step_timing(step_timing, (time.monotonic() - step_start_time) * 1000)
+        for res in results[results_before_step:]:
+            if result_extra:
+                res.update(result_extra)
+            if res.get("step") == step_num:
+                res["timing"] = timing_summary
+                if retry_errors:
+                    res["attempts"] = attempt
+                    res["retry_errors"] = retry_errors
+                if step_data.get("_retry_refused"):
+                    res["retry_refused"] = step_data["_retry_refused"]
+                if spill_artifacts:
+                    # 大きな文字列はステップ完了ごとにディスクへ退避し、メモリ上の結果を小さく保つ
+                    artifact_store.spill_large_payloads(res)
+        logger.debug("ステップ %s タイミング: %s", step_num, timing_summary)
+        # paginate の本体ステップもここを通るため、ページごとの結果はループの完了を待たずに出力される
+        _emit_new_results()
+        return step_ok
+
+    async def _run_step_body(step_num: Union[int, str], step_data: Dict[str, Any], total_steps: int, step_timing: Dict[str, Any], attempts_left: int = 0) -> bool:
+        """
+        _run_step の本体。探索・待機・通信にかかった時間を step_timing に加算する。
+        エラー結果にはリトライ判定用の error_class を付与する。attempts_left はリトライの残り回数。
+        """
+        nonlocal current_target, root_page, current_context, exit_requested, current_frame_chain
         action = step_data.get("action", "").lower()
         selector = step_data.get("selector")
         iframe_selector_input = step_data.get("iframe_selector")
@@ -147,10 +400,17 @@ async def execute_actions_async(
         attribute_name = step_data.get("attribute_name")
         option_type = step_data.get("option_type")
         option_value = step_data.get("option_value")
+        target_hints = step_data.get("target_hints") or None # LLM生成の要素特定ヒント (空リストは未指定扱い)
+        search_mode = step_data.get("search_mode") # 単一要素探索の方式 ('bfs' / 'race')。未指定なら config の既定値
+        pdf_options = step_data.get("pdf_options") # PDFテキスト抽出の方式と対象ページ
+        incremental = bool(step_data.get("incremental", config.INCREMENTAL_REFRESH_DEFAULT)) # 前回から変わっていないPDF/ページは再利用
         # アクション固有タイムアウト > 全体デフォルトタイムアウト > configデフォルト
         action_wait_time = step_data.get("wait_time_ms", default_timeout)
+        optional_step = bool(step_data.get("optional")) # 要素が見つからなくても失敗にしない
+        # optional ステップで wait_time_ms 未指定なら、要素探索は短い存在確認で打ち切る
+        finder_timeout = min(action_wait_time, config.OPTIONAL_STEP_PROBE_TIMEOUT) if optional_step and "wait_time_ms" not in step_data else action_wait_time
 
-        logger.info(f"--- ステップ {step_num}/{len(actions)}: Action='{action}' ---")
+        logger.info(f"--- ステップ {step_num}/{total_steps}: Action='{action}' ---")
         step_info = {"selector": selector, "value": value, "iframe(指定)": iframe_selector_input,
                      "option_type": option_type, "option_value": option_value, "attribute_name": attribute_name}
         # Noneでない値だけをログに出力
@@ -171,9 +431,25 @@ async def execute_actions_async(
         except Exception as e:
             logger.error(f"ステップ {step_num} 開始前の状態取得中にエラー: {e}", exc_info=True)
             results.append({"step": step_num, "status": "error", "action": action, "message": f"Failed to get target info before step: {e}"})
-            return False, results # 状態取得失敗は致命的として中断
+            return False # 状態取得失敗は致命的として中断
 
         try:
+            # --- 実行条件・早期終了条件 (待機せずに1回だけ評価) ---
+            if any(step_data.get(key) for key in STEP_CONDITION_KEYS):
+                with utils.measure_ms(step_timing, "finder_ms"):
+                    condition = await _evaluate_step_conditions(current_target, step_data)
+                if condition:
+                    if condition["outcome"] == "exit":
+                        logger.info(f"早期終了条件 {condition['condition']}='{condition['selector']}' が成立したため、残りのステップを実行せずに終了します。")
+                        exit_requested = condition
+                        results.append({"step": step_num, "status": "skipped", "action": action, "early_exit": True, "condition": condition,
+                                        "message": f"Early exit: {condition['condition']} '{condition['selector']}'"})
+                    else:
+                        logger.info(f"実行条件 {condition['condition']}='{condition['selector']}' を満たさないため、このステップをスキップします。")
+                        results.append({"step": step_num, "status": "skipped", "action": action, "condition": condition,
+                                        "message": f"Condition not met: {condition['condition']} '{condition['selector']}'"})
+                    return True
+
             # --- Iframe/Parent Frame 切替 ---
             if action == "switch_to_iframe":
                 if not iframe_selector_input:
@@ -191,36 +467,37 @@ async def execute_actions_async(
                 except Exception as e:
                     raise PlaywrightError(f"Iframe '{iframe_selector_input}' への切り替え中に予期せぬエラーが発生しました: {e}")
 
-                # 切り替え成功
-                if id(current_target) not in [id(s) for s in iframe_stack]: # 現在のターゲットがまだスタックになければ追加
-                    iframe_stack.append(current_target)
-                current_target = target_frame_locator # ターゲットを新しい FrameLocator に更新
+                # 切り替え成功: 現在のターゲットをスタックに積み、新しい FrameLocator に更新
+                _push_scope(target_frame_locator, current_frame_chain + [iframe_selector_input] if current_frame_chain is not None else None)
                 logger.info(f"FrameLocator '{iframe_selector_input}' への切り替え成功。")
                 results.append({"step": step_num, "status": "success", "action": action, "selector": iframe_selector_input})
-                continue # 次のステップへ
+                return True # 次のステップへ
 
             elif action == "switch_to_parent_frame":
                 if not iframe_stack:
                     logger.warning("既にトップレベルフレームか、iframeスタックが空です。操作はスキップされます。")
                     # FrameLocatorの場合のみルートページに戻す安全策は維持
-                    if isinstance(current_target, FrameLocator):
-                        logger.info("現在のターゲットがFrameLocatorのため、ルートページに戻します。")
+                    if not isinstance(current_target, Page): # FrameLocator または Frame (Frameツリー方式の探索結果)
+                        logger.info(f"現在のターゲットが{type(current_target).__name__}のため、ルートページに戻します。")
                         current_target = root_page
+                        current_frame_chain = []
                     results.append({"step": step_num, "status": "warning", "action": action, "message": "Already at top-level or stack empty."})
                 else:
                     logger.info("[ユーザー指定] 親ターゲットに戻ります...")
                     current_target = iframe_stack.pop() # スタックから親ターゲットを取り出す
+                    current_frame_chain = frame_chain_stack.pop()
                     target_type = type(current_target).__name__
                     logger.info(f"親ターゲットへの切り替え成功。現在の探索スコープ: {target_type}")
                     results.append({"step": step_num, "status": "success", "action": action})
-                continue # 次のステップへ
+                return True # 次のステップへ
 
 
             # --- ページ全体操作 ---
-            if action in ["wait_page_load", "sleep", "scroll_page_to_bottom"]:
+            if action in ["wait_page_load", "sleep", "wait_for_settle", "scroll_page_to_bottom"]:
                 if action == "wait_page_load":
                     logger.info("ページの読み込み完了 (load) を待ちます...")
-                    await root_page.wait_for_load_state("load", timeout=action_wait_time)
+                    with utils.measure_ms(step_timing, "wait_ms"):
+                        await root_page.wait_for_load_state("load", timeout=action_wait_time)
                     logger.info("ページの読み込みが完了しました。")
                     results.append({"step": step_num, "status": "success", "action": action})
                 elif action == "sleep":
@@ -230,21 +507,250 @@ async def execute_actions_async(
                     except (TypeError, ValueError):
                         raise ValueError("Invalid value for sleep action. Must be a non-negative number (seconds).")
                     logger.info(f"{seconds:.1f} 秒待機します...")
-                    await asyncio.sleep(seconds)
+                    with utils.measure_ms(step_timing, "wait_ms"):
+                        await asyncio.sleep(seconds)
                     results.append({"step": step_num, "status": "success", "action": action, "duration_sec": seconds})
+                elif action == "wait_for_settle":
+                    settle_mode = (step_data.get("settle_mode") or "network_idle").lower()
+                    if settle_mode not in SETTLE_MODES:
+                        raise ValueError(f"Invalid 'settle_mode' for wait_for_settle: '{settle_mode}'. Use one of {list(SETTLE_MODES)}.")
+                    try:
+                        quiet_ms = int(step_data.get("quiet_ms") or config.SETTLE_QUIET_MS)
+                        expected_count = int(value) if settle_mode == "selector_count" and value is not None else None
+                    except (TypeError, ValueError):
+                        raise ValueError("Invalid 'quiet_ms' or 'value' (expected count) for wait_for_settle.")
+                    logger.info(f"ページの静止を待ちます (方法: {settle_mode}, タイムアウト: {action_wait_time}ms)...")
+                    with utils.measure_ms(step_timing, "wait_ms"):
+                        settle_info = await wait_for_settle_async(
+                            root_page, current_target, settle_mode, action_wait_time, quiet_ms=quiet_ms,
+                            url_pattern=step_data.get("url_pattern"), selector=selector, expected_count=expected_count
+                        )
+                    if not settle_info["settled"]:
+                        logger.warning(f"{action_wait_time}ms 以内に静止しませんでした (方法: {settle_mode})。処理は続行します。")
+                    else:
+                        logger.info(f"静止を確認しました ({settle_info['elapsed_ms']}ms)。")
+                    results.append({"step": step_num, "status": "success", "action": action, "settle_mode": settle_mode, **settle_info})
                 elif action == "scroll_page_to_bottom":
                     logger.info("ページ最下部へスクロールします...")
                     # JavaScriptを実行してスクロール
                     await root_page.evaluate('window.scrollTo(0, document.body.scrollHeight)')
-                    await asyncio.sleep(0.5) # スクロール後の描画やイベント発生を少し待つ
+                    with utils.measure_ms(step_timing, "wait_ms"):
+                        # 固定sleepではなく、スクロールで発生する描画・遅延読み込みのDOM変更が落ち着くのを待つ
+                        await wait_for_dom_settle_async(root_page, config.ENGINE_SETTLE_QUIET_MS, config.ENGINE_SETTLE_TIMEOUT)
                     logger.info("ページ最下部へのスクロールが完了しました。")
                     results.append({"step": step_num, "status": "success", "action": action})
-                continue # 次のステップへ
+                return True # 次のステップへ
+
+
+            # --- ページネーション (本体ステップをページごとにネイティブ実行) ---
+            if action == "paginate":
+                body_steps = step_data.get("steps")
+                next_selector = step_data.get("next_selector")
+                if not body_steps or not isinstance(body_steps, list):
+                    raise ValueError("Action 'paginate' requires a non-empty 'steps' list.")
+                if not next_selector:
+                    raise ValueError("Action 'paginate' requires 'next_selector'.")
+                try:
+                    max_pages = int(step_data.get("max_pages") or config.PAGINATE_DEFAULT_MAX_PAGES)
+                    if max_pages < 1: raise ValueError
+                except (TypeError, ValueError):
+                    raise ValueError("Invalid value for 'max_pages'. Must be a positive integer.")
+                stop_when_no_new_items = bool(step_data.get("stop_when_no_new_items", True))
+                # settle_mode だけが指定された場合は、ページ切替をその静止待機だけで判定する ('settle')
+                page_change = (step_data.get("page_change_wait") or ("settle" if step_data.get("settle_mode") else config.PAGINATE_DEFAULT_PAGE_CHANGE)).lower()
+                if page_change not in ("navigation", "url_change", "detach", "settle"):
+                    raise ValueError(f"Invalid 'page_change_wait' for paginate: '{page_change}'. Use 'navigation', 'url_change', 'detach' or 'settle'.")
+                if page_change == "settle" and not step_data.get("settle_mode"):
+                    raise ValueError("paginate with page_change_wait='settle' requires 'settle_mode'.")
+                next_probe_timeout = min(config.PAGINATE_NEXT_PROBE_TIMEOUT, action_wait_time)
+
+                logger.info(f"ページネーションを開始します (最大 {max_pages} ページ, 次へ='{next_selector}', 切替待機='{page_change}')...")
+                seen_item_keys: Set[str] = set()
+                first_page = 1
+                # チェックポイントから再開する場合は、中断したページ (保存時の URL で開き直し済み) から続ける
+                if isinstance(step_num, int) and paginate_resume_state.get("step_index") == step_num - 1:
+                    first_page = int(paginate_resume_state["next_page"])
+                    seen_item_keys.update(paginate_resume_state.get("seen_item_keys") or [])
+                    logger.info(f"[paginate] チェックポイントからページ {first_page} を再開します (既知の項目 {len(seen_item_keys)} 件)。")
+                    paginate_resume_state.clear()
+                pages_visited = first_page - 1
+                stop_reason = "max_pages"
+                for page_num in range(first_page, max_pages + 1):
+                    pages_visited = page_num
+                    logger.info(f"[paginate] ページ {page_num}/{max_pages} の本体ステップ ({len(body_steps)}件) を実行します...")
+                    results_before_page = len(results)
+                    for j, body_step in enumerate(body_steps):
+                        body_step_num = f"{step_num}.{page_num}.{j + 1}"
+                        with utils.measure_ms(step_timing, "body_ms"): # 本体ステップは各自の timing を持つ
+                            body_ok = await _run_step(body_step_num, body_step, len(body_steps), result_extra={"page": page_num})
+                        if not body_ok:
+                            logger.error(f"[paginate] ページ {page_num} の本体ステップ {body_step_num} でエラーが発生したため中断します。")
+                            return False
+                        if exit_requested:
+                            break
+                    # --- 停止条件: 本体ステップで早期終了条件が成立 ---
+                    if exit_requested:
+                        stop_reason = "early_exit"
+                        break
+
+                    # --- 停止条件: 新しい項目がない ---
+                    page_item_keys = _collect_page_item_keys(results[results_before_page:])
+                    new_item_keys = page_item_keys - seen_item_keys
+                    seen_item_keys.update(new_item_keys)
+                    logger.info(f"[paginate] ページ {page_num}: 項目 {len(page_item_keys)} 件 (新規 {len(new_item_keys)} 件)")
+                    if stop_when_no_new_items and page_num > 1 and not new_item_keys:
+                        stop_reason = "no_new_items"
+                        break
+                    # --- 停止条件: 最大ページ数 ---
+                    if page_num >= max_pages:
+                        stop_reason = "max_pages"
+                        break
+                    # --- 停止条件: 「次へ」が存在しない ---
+                    with utils.measure_ms(step_timing, "finder_ms"):
+                        next_element, _ = await find_element_dynamically(
+                            current_target, next_selector, max_depth=config.DYNAMIC_SEARCH_MAX_DEPTH, timeout=next_probe_timeout, target_state="visible",
+                            search_context=search_context
+                        )
+                    if not next_element:
+                        logger.info(f"[paginate] 次へ要素 '{next_selector}' が見つからないため終了します。")
+                        stop_reason = "next_missing"
+                        break
+
+                    # --- 次ページへ移動し、固定sleepではなくイベントでページ切替を待つ ---
+                    previous_url = root_page.url
+                    logger.info(f"[paginate] ページ {page_num + 1} へ移動します (待機方法: {page_change})...")
+                    # settle_mode 指定時は、クリックで起きる通信・要素数の変化を取りこぼさないようクリックの前に監視を開始する
+                    armed_settle = await _arm_step_settle(step_data, root_page, current_target, action_wait_time)
+                    try:
+                        if page_change == "navigation":
+                            with utils.measure_ms(step_timing, "wait_ms"):
+                                async with root_page.expect_navigation(wait_until="domcontentloaded", timeout=action_wait_time):
+                                    await next_element.click(timeout=action_wait_time)
+                        elif page_change == "url_change":
+                            await next_element.click(timeout=action_wait_time)
+                            with utils.measure_ms(step_timing, "wait_ms"):
+                                await root_page.wait_for_url(lambda url: url != previous_url, wait_until="domcontentloaded", timeout=action_wait_time)
+                        elif page_change == "settle":
+                            await next_element.click(timeout=action_wait_time)
+                        else: # detach: クリックした「次へ」要素がDOMから外れる (再描画される) のを待つ
+                            next_handle = await next_element.element_handle(timeout=action_wait_time)
+                            await next_element.click(timeout=action_wait_time)
+                            with utils.measure_ms(step_timing, "wait_ms"):
+                                try:
+                                    await root_page.wait_for_function("el => !el.isConnected", arg=next_handle, timeout=action_wait_time)
+                                except PlaywrightError as detach_err:
+                                    # ナビゲーションで実行コンテキストが破棄された場合もページ切替とみなす
+                                    if "context was destroyed" not in str(detach_err).lower(): raise
+                                    await root_page.wait_for_load_state("domcontentloaded", timeout=action_wait_time)
+                    except Exception:
+                        if armed_settle: armed_settle.cancel()
+                        raise
+                    if armed_settle:
+                        with utils.measure_ms(step_timing, "wait_ms"):
+                            settle_info = await armed_settle.wait()
+                        logger.info(f"[paginate] 切替後の静止待機 ({armed_settle.mode}): settled={settle_info['settled']} ({settle_info['elapsed_ms']}ms)")
+                    logger.info(f"[paginate] ページ切替完了: URL='{root_page.url}'")
+                    # トップレベルの paginate で、URL で開き直せるページに移動した場合はページごとにチェックポイントを保存する
+                    if isinstance(step_num, int) and root_page.url != previous_url:
+                        await _save_checkpoint(step_num - 1, paginate_state={
+                            "step_index": step_num - 1, "next_page": page_num + 1, "seen_item_keys": sorted(seen_item_keys)
+                        })
+
+                logger.info(f"ページネーション完了: {pages_visited} ページ, 停止理由='{stop_reason}', 項目数={len(seen_item_keys)}")
+                results.append({"step": step_num, "status": "success", "action": action, "next_selector": next_selector,
+                                "pages_visited": pages_visited, "stop_reason": stop_reason, "items_seen": len(seen_item_keys)})
+                return True # 次のステップへ
+
+
+            # --- 無限スクロール (DOM/ネットワークの静止を待ちながら項目数が頭打ちになるまでスクロール) ---
+            if action == "scroll_until_stable":
+                settle_mode = (step_data.get("settle_mode") or "dom_quiet").lower()
+                if settle_mode not in ("dom_quiet", "network_idle"):
+                    raise ValueError(f"Invalid 'settle_mode' for scroll_until_stable: '{settle_mode}'. Use 'dom_quiet' or 'network_idle'.")
+                extract_mode = (step_data.get("extract") or "").lower() or None
+                if extract_mode not in (None, "text", "attribute"):
+                    raise ValueError(f"Invalid 'extract' for scroll_until_stable: '{extract_mode}'. Use 'text' or 'attribute'.")
+                if extract_mode and not selector:
+                    raise ValueError("scroll_until_stable with 'extract' requires 'selector' (item selector).")
+                if extract_mode == "attribute" and not attribute_name:
+                    raise ValueError("scroll_until_stable with extract='attribute' requires 'attribute_name'.")
+                try:
+                    max_items = int(step_data["max_items"]) if step_data.get("max_items") is not None else None
+                    max_duration_ms = int(step_data.get("max_duration_ms") or config.SCROLL_UNTIL_STABLE_MAX_DURATION)
+                    stable_rounds = int(step_data.get("stable_rounds") or config.SCROLL_UNTIL_STABLE_ROUNDS)
+                    max_scrolls = int(step_data.get("max_scrolls") or config.SCROLL_UNTIL_STABLE_MAX_SCROLLS)
+                    quiet_ms = int(step_data.get("quiet_ms") or config.SETTLE_QUIET_MS)
+                except (TypeError, ValueError):
+                    raise ValueError("Invalid numeric option for scroll_until_stable (max_items, max_duration_ms, stable_rounds, max_scrolls, quiet_ms).")
+
+                async def _scroll_progress() -> int:
+                    # 項目セレクターがあれば項目数 (待機しない count())、なければ文書の高さで伸びを判定する
+                    if selector:
+                        return await current_target.locator(selector).count()
+                    return await current_target.locator(':root').evaluate("root => (root.ownerDocument.scrollingElement || root).scrollHeight")
+
+                logger.info(f"無限スクロールを開始します (項目='{selector}', 静止判定={settle_mode}, 頭打ち判定={stable_rounds}回, 最大{max_scrolls}回/{max_duration_ms}ms)...")
+                scroll_start_time = time.monotonic()
+                progress = await _scroll_progress()
+                extracted_items: List[Optional[str]] = []
+                extracted_count = 0 # 抽出済みの要素インデックス (差分抽出の開始位置)
+                if extract_mode:
+                    extracted_items = await extract_items_from_index_async(current_target, selector, 0, attribute_name if extract_mode == "attribute" else None)
+                    extracted_count = len(extracted_items)
+                scrolls = 0
+                unchanged_rounds = 0
+                stop_reason = "max_scrolls"
+                while scrolls < max_scrolls:
+                    if max_items is not None and selector and progress >= max_items:
+                        stop_reason = "max_items"
+                        break
+                    remaining_ms = max_duration_ms - (time.monotonic() - scroll_start_time) * 1000
+                    if remaining_ms <= 0:
+                        stop_reason = "time_budget"
+                        break
+                    scrolls += 1
+                    settle_timeout = int(min(config.SETTLE_TIMEOUT, remaining_ms))
+                    # スクロールで始まる通信を取りこぼさないよう、スクロールの前に監視を開始する
+                    armed_settle = await arm_settle_async(root_page, current_target, settle_mode, settle_timeout, quiet_ms=quiet_ms)
+                    try:
+                        await scroll_scope_to_bottom_async(current_target)
+                    except Exception:
+                        armed_settle.cancel()
+                        raise
+                    with utils.measure_ms(step_timing, "wait_ms"):
+                        settle_info = await armed_settle.wait()
+                    new_progress = await _scroll_progress()
+                    logger.info(f"[scroll_until_stable] スクロール {scrolls}: {'項目数' if selector else '高さ'} {progress} -> {new_progress} (静止={settle_info['settled']}, {settle_info['elapsed_ms']}ms)")
+                    if extract_mode and selector and new_progress > extracted_count:
+                        new_items = await extract_items_from_index_async(current_target, selector, extracted_count, attribute_name if extract_mode == "attribute" else None)
+                        extracted_items.extend(new_items)
+                        extracted_count += len(new_items)
+                    # --- 停止条件: 項目数 (または高さ) の頭打ち ---
+                    if new_progress <= progress:
+                        unchanged_rounds += 1
+                        if unchanged_rounds >= stable_rounds:
+                            stop_reason = "plateau"
+                            break
+                    else:
+                        unchanged_rounds = 0
+                        progress = new_progress
+
+                scroll_result: Dict[str, Any] = {"scrolls": scrolls, "stop_reason": stop_reason, "settle_mode": settle_mode}
+                if selector:
+                    scroll_result["item_count"] = progress
+                if extract_mode:
+                    if max_items is not None:
+                        extracted_items = extracted_items[:max_items]
+                    scroll_result["text_list" if extract_mode == "text" else "attribute_list"] = extracted_items
+                    scroll_result["results_count"] = len(extracted_items)
+                logger.info(f"無限スクロール完了: {scrolls} 回, 停止理由='{stop_reason}'" + (f", 項目数={progress}" if selector else ""))
+                results.append({"step": step_num, "status": "success", "action": action, "selector": selector, **scroll_result})
+                return True # 次のステップへ
 
 
             # --- 要素操作のための準備 ---
             element: Optional[Locator] = None # 単一要素操作用
-            found_elements_list: List[Tuple[Locator, Union[Page, FrameLocator]]] = [] # 複数要素操作用
+            element_groups: List[ElementGroup] = [] # 複数要素操作用 (スコープ, セレクター, 件数)
             found_scope: Optional[Union[Page, FrameLocator]] = None # 要素が見つかったスコープ
 
             # アクションが単一要素を必要とするか、複数要素を対象とするか
@@ -253,41 +759,72 @@ async def execute_actions_async(
             # スクリーンショットはセレクターがあれば単一要素、なければページ全体
             is_screenshot_element = action == "screenshot" and selector is not None
 
+            hint_resolution: Optional[Dict[str, Any]] = None # target_hints の解決レポート
             if action in single_element_required_actions or action in multiple_elements_actions or is_screenshot_element:
-                if not selector:
+                uses_target_hints = bool(target_hints) and action in single_element_required_actions
+                if not selector and not uses_target_hints:
                     raise ValueError(f"Action '{action}' requires a 'selector'.")
 
                 # --- 要素探索 ---
                 if action in single_element_required_actions or is_screenshot_element:
                     # 探索する要素の状態を決定
                     required_state = 'visible' if action in ['click', 'hover', 'screenshot', 'select_option', 'input', 'wait_visible', 'scroll_to_element'] else 'attached'
-                    logger.info(f"単一要素 '{selector}' (状態: {required_state}) を動的に探索します...")
-                    element, found_scope = await find_element_dynamically(
-                        current_target, selector, max_depth=config.DYNAMIC_SEARCH_MAX_DEPTH, timeout=action_wait_time, target_state=required_state
-                    )
+                    if uses_target_hints:
+                        # ヒント候補を並行検査し、一意にマッチしなければ selector をフォールバックとして使う
+                        logger.info(f"target_hints ({len(target_hints)}件) で単一要素 (状態: {required_state}) を解決します (フォールバック: '{selector}')...")
+                        with utils.measure_ms(step_timing, "finder_ms"):
+                            element, found_scope, hint_resolution = await resolve_target_hints_async(
+                                current_target, target_hints, selector, timeout=finder_timeout, target_state=required_state,
+                                search_context=search_context, search_mode=search_mode
+                            )
+                    else:
+                        logger.info(f"単一要素 '{selector}' (状態: {required_state}) を動的に探索します...")
+                        with utils.measure_ms(step_timing, "finder_ms"):
+                            element, found_scope = await find_element_dynamically(
+                                current_target, selector, max_depth=config.DYNAMIC_SEARCH_MAX_DEPTH, timeout=finder_timeout, target_state=required_state,
+                                search_context=search_context, search_mode=search_mode
+                            )
                     if not element or not found_scope:
                         # 要素が見つからない場合は明確なエラーとして処理を中断
                         error_msg = f"要素 '{selector}' (状態: {required_state}) が現在のスコープおよび探索可能なiframe (深さ{config.DYNAMIC_SEARCH_MAX_DEPTH}まで) 内で見つかりませんでした。"
+                        if uses_target_hints:
+                            error_msg = f"target_hints ({len(target_hints)}件) のいずれも一意にマッチせず、フォールバック " + error_msg
+                        retry_policy = step_data.get("_retry_policy")
+                        if optional_step and not (attempts_left > 0 and retry_policy and "not_found" in retry_policy["on"]):
+                            logger.info(f"optional ステップのため、要素 '{selector}' が見つからないことを許容してスキップします。({finder_timeout}ms)")
+                            skipped_result = {"step": step_num, "status": "skipped", "action": action, "selector": selector, "optional": True,
+                                              "message": f"Optional element not found within {finder_timeout}ms."}
+                            if hint_resolution: skipped_result["hint_resolution"] = hint_resolution
+                            results.append(skipped_result)
+                            return True
                         logger.error(error_msg)
-                        results.append({"step": step_num, "status": "error", "action": action, "selector": selector, "required_state": required_state, "message": error_msg})
-                        return False, results # Falseを返して処理中断
+                        error_result = {"step": step_num, "status": "error", "action": action, "selector": selector, "required_state": required_state, "message": error_msg, "error_class": "not_found"}
+                        if hint_resolution: error_result["hint_resolution"] = hint_resolution
+                        if search_context["last_search_path"]: error_result["search_path"] = search_context["last_search_path"] # どのスコープにどれだけ待ったか
+                        results.append(error_result)
+                        return False # Falseを返して処理中断
 
                     # 要素が見つかったスコープが現在の探索スコープと異なる場合、ターゲットを更新
                     if id(found_scope) != id(current_target):
                         found_scope_type = type(found_scope).__name__
                         logger.info(f"要素発見スコープ({found_scope_type})が現在のスコープ({type(current_target).__name__})と異なるため、探索スコープを更新します。")
                         # スタック管理: 現在のターゲットをスタックに追加 (重複回避)
-                        if id(current_target) not in [id(s) for s in iframe_stack]:
-                            iframe_stack.append(current_target)
-                        current_target = found_scope
+                        found_frame_path = search_context.get("last_found_frame_path")
+                        found_chain = (
+                            current_frame_chain + [f"iframe:visible >> nth={nth_index}" for nth_index in found_frame_path]
+                            if current_frame_chain is not None and found_frame_path is not None and not isinstance(found_scope, Frame) else None
+                        )
+                        _push_scope(found_scope, found_chain)
                     logger.info(f"最終的な単一操作対象スコープ: {type(current_target).__name__}")
 
                 elif action in multiple_elements_actions:
                     logger.info(f"複数要素 '{selector}' を動的に探索します...")
-                    found_elements_list = await find_all_elements_dynamically(
-                        current_target, selector, max_depth=config.DYNAMIC_SEARCH_MAX_DEPTH, timeout=action_wait_time
-                    )
-                    if not found_elements_list:
+                    with utils.measure_ms(step_timing, "finder_ms"):
+                        element_groups = await find_element_groups_dynamically(
+                            current_target, selector, max_depth=config.DYNAMIC_SEARCH_MAX_DEPTH, timeout=action_wait_time,
+                            search_context=search_context
+                        )
+                    if not element_groups:
                         # 複数要素が見つからなくてもエラーとはせず、警告ログに留め、後続処理で空リストとして扱う
                         logger.warning(f"要素 '{selector}' が現在のスコープおよび探索可能なiframe (深さ{config.DYNAMIC_SEARCH_MAX_DEPTH}まで) 内で見つかりませんでした。")
                     # 複数要素の場合、見つかった各要素のスコープは異なる可能性があるため、current_target は更新しない
@@ -295,12 +832,17 @@ async def execute_actions_async(
 
             # --- 各アクション実行 ---
             action_result_details = {"selector": selector} if selector else {} # 結果にセレクター情報を含める
+            if hint_resolution: action_result_details["hint_resolution"] = hint_resolution # どのヒントが採用されたか
+            if element and any(entry.get("outcome") == "race_unsupported_fallback_bfs" for entry in search_context["last_search_path"]):
+                action_result_details["search_mode_fallback"] = "bfs" # race を指定したが起点が FrameLocator のため BFS で探索した
 
             if action == "click":
                 if not element: raise ValueError("Click action requires an element, but it was not found.")
                 logger.info("要素をクリックします...")
                 context_for_click = root_page.context # 新しいページが開くイベントはルートページのコンテキストで捕捉
                 new_page: Optional[Page] = None
+                # settle_mode 指定時は、クリックで起きる通信・要素数の変化を取りこぼさないようクリックの前に監視を開始する
+                armed_settle = await _arm_step_settle(step_data, root_page, current_target, action_wait_time)
                 try:
                     # 新しいページが開く可能性を考慮して待機 (タイムアウトは短めに設定)
                     async with context_for_click.expect_page(timeout=config.NEW_PAGE_EVENT_TIMEOUT) as new_page_info:
@@ -309,9 +851,11 @@ async def execute_actions_async(
                     new_page = await new_page_info.value
                     new_page_url = new_page.url
                     logger.info(f"クリックにより新しいページが開きました: URL={new_page_url}")
+                    if armed_settle: armed_settle.cancel() # 元のページの静止は待たない
                     try:
                         # 新しいページのロード完了を待つ (タイムアウトはアクション固有時間)
-                        await new_page.wait_for_load_state("load", timeout=action_wait_time)
+                        with utils.measure_ms(step_timing, "wait_ms"):
+                            await new_page.wait_for_load_state("load", timeout=action_wait_time)
                         logger.info("新しいページのロードが完了しました。")
                     except PlaywrightTimeoutError:
                         logger.warning(f"新しいページのロード待機がタイムアウトしました ({action_wait_time}ms)。処理は続行します。")
@@ -320,6 +864,8 @@ async def execute_actions_async(
                     current_target = new_page
                     current_context = new_page.context
                     iframe_stack.clear()
+                    frame_chain_stack.clear()
+                    current_frame_chain = []
                     logger.info("スコープを新しいページにリセットしました。iframeスタックもクリアされました。")
                     action_result_details.update({"new_page_opened": True, "new_page_url": new_page_url})
                     results.append({"step": step_num, "status": "success", "action": action, **action_result_details})
@@ -327,9 +873,14 @@ async def execute_actions_async(
                     # expect_pageがタイムアウトした場合 (新しいページが開かなかった場合)
                     logger.info(f"クリックは完了しましたが、{config.NEW_PAGE_EVENT_TIMEOUT}ms 以内に新しいページは開きませんでした。")
                     action_result_details["new_page_opened"] = False
+                    if armed_settle:
+                        with utils.measure_ms(step_timing, "wait_ms"):
+                            action_result_details["settle"] = {"settle_mode": armed_settle.mode, **await armed_settle.wait()}
+                        logger.info(f"クリック後の静止待機 ({armed_settle.mode}): {action_result_details['settle']}")
                     results.append({"step": step_num, "status": "success", "action": action, **action_result_details})
                 except Exception as click_err:
                     # クリック自体が失敗した場合など
+                    if armed_settle: armed_settle.cancel()
                     logger.error(f"クリック操作中に予期せぬエラーが発生しました: {click_err}", exc_info=True)
                     raise click_err # エラーを再送出してステップ全体のエラーハンドリングに任せる
 
@@ -381,6 +932,7 @@ async def execute_actions_async(
                 if not element: raise ValueError("Get attribute action requires an element.")
                 if not attribute_name: raise ValueError("Action 'get_attribute' requires 'attribute_name'.")
                 logger.info(f"要素の属性 '{attribute_name}' を取得します...")
+                if pdf_options: utils.normalize_pdf_options(pdf_options) # 不正な指定はダウンロード前にエラーにする
                 attr_value = await element.get_attribute(attribute_name, timeout=action_wait_time)
                 pdf_text_content = None
                 processed_value = attr_value # 結果に含める値（URL変換やPDFテキストが入る可能性）
@@ -395,22 +947,28 @@ async def execute_actions_async(
                             logger.info(f"  href属性値を絶対URLに変換: '{original_url}' -> '{absolute_url}'")
                         processed_value = absolute_url # 結果には絶対URLを
 
-                        # PDFかどうかを判定して処理
-                        if isinstance(absolute_url, str) and absolute_url.lower().endswith('.pdf'):
-                            logger.info(f"  リンク先がPDFファイルです。ダウンロードとテキスト抽出を試みます: {absolute_url}")
-                            # PDFダウンロード (utilsを使用)
-                            pdf_bytes = await utils.download_pdf_async(api_request_context, absolute_url)
-                            if pdf_bytes:
-                                # PDFテキスト抽出 (utilsを使用, 同期関数を非同期実行)
-                                pdf_text_content = await asyncio.to_thread(utils.extract_text_from_pdf_sync, pdf_bytes)
-                                if isinstance(pdf_text_content, str) and pdf_text_content.startswith("Error:"):
-                                     logger.error(f"  PDFテキスト抽出エラー: {pdf_text_content}")
-                                else:
-                                     log_text = pdf_text_content[:200] + '...' if pdf_text_content and len(pdf_text_content) > 200 else pdf_text_content
-                                     logger.info(f"  PDFテキスト抽出完了 (先頭200文字): {log_text if log_text else 'None'}")
+                        # PDFかどうかを判定して処理 (拡張子ではなく Content-Type / マジックバイトで判定)
+                        # 判定とダウンロードは1つのクライアント (クッキーの取得も1回) で行う
+                        link_is_pdf = False
+                        if urlparse(absolute_url).scheme in ('http', 'https'):
+                            async with utils.open_http_session(api_request_context) as http_client:
+                                with utils.measure_ms(step_timing, "network_ms"):
+                                    link_is_pdf = await utils.is_pdf_url_async(api_request_context, absolute_url, client=http_client)
+                                if link_is_pdf:
+                                    logger.info(f"  リンク先がPDFファイルです。ダウンロードとテキスト抽出を試みます: {absolute_url}")
+                                    # PDFを一時ファイルにストリーミングでダウンロードしてテキスト抽出 (utilsを使用)
+                                    with utils.measure_ms(step_timing, "network_ms"):
+                                        pdf_text_content, pdf_size, refresh_state = await utils.fetch_pdf_text_async(
+                                            api_request_context, absolute_url, pdf_options, incremental, client=http_client
+                                        )
+                        if link_is_pdf:
+                            if refresh_state: action_result_details["refresh_state"] = refresh_state
+                            step_timing["network_bytes"] += pdf_size
+                            if pdf_text_content.startswith("Error:"):
+                                 logger.error(f"  PDFダウンロードまたはテキスト抽出エラー: {pdf_text_content}")
                             else:
-                                pdf_text_content = "Error: PDF download failed or returned no data."
-                                logger.error(f"  PDFダウンロード失敗: {absolute_url}")
+                                 log_text = pdf_text_content[:200] + '...' if len(pdf_text_content) > 200 else pdf_text_content
+                                 logger.info(f"  PDFテキスト抽出完了 (先頭200文字): {log_text}")
                         else:
                              logger.debug(f"  リンク先はPDFではありません ({absolute_url})。")
                     except Exception as url_e:
@@ -429,7 +987,7 @@ async def execute_actions_async(
                 if not selector: raise ValueError("Action 'get_all_attributes' requires 'selector'.")
                 if not attribute_name: raise ValueError("Action 'get_all_attributes' requires 'attribute_name'.")
 
-                if not found_elements_list:
+                if not element_groups:
                     logger.warning(f"動的探索で要素 '{selector}' が見つからなかったため、属性/コンテンツ取得をスキップします。")
                     action_result_details["results_count"] = 0 # 結果件数を0にする
                     if attribute_name.lower() in ['href', 'pdf', 'content', 'mail']:
@@ -440,8 +998,8 @@ async def execute_actions_async(
                     if attribute_name.lower() not in ['href', 'pdf', 'content', 'mail']:
                         action_result_details["attribute_list"] = []
                 else:
-                    num_found = len(found_elements_list)
-                    logger.info(f"動的探索で見つかった {num_found} 個の要素から属性/コンテンツ '{attribute_name}' を取得します。")
+                    num_found = sum(count for _, _, count in element_groups)
+                    logger.info(f"動的探索で見つかった {num_found} 個の要素 ({len(element_groups)} スコープ) から属性/コンテンツ '{attribute_name}' を取得します。")
 
                     # 結果格納用リスト
                     url_list_for_file: List[Optional[str]] = []
@@ -455,16 +1013,19 @@ async def execute_actions_async(
                     if attribute_name.lower() in ['href', 'pdf', 'content', 'mail']: # <<< mail を追加
                         logger.info(f"モード '{attribute_name.lower()}': href属性を取得し、絶対URLに変換、必要に応じてコンテンツを取得します...")
 
+                        if pdf_options and attribute_name.lower() == 'pdf':
+                            utils.normalize_pdf_options(pdf_options) # 不正な指定はダウンロード前にエラーにする
                         CONCURRENT_LIMIT = 5 # 同時実行数
+                        refresh_states_by_index: Dict[int, str] = {} # 差分取得モードでの各URLの状態 (new / changed / unchanged)
                         semaphore = asyncio.Semaphore(CONCURRENT_LIMIT)
                         logger.info(f"URLアクセス/コンテンツ取得の同時実行数を {CONCURRENT_LIMIT} に制限します。")
 
                         # 個々の要素から属性/コンテンツを取得する内部関数
                         async def process_single_element_for_href_related(
-                            locator: Locator, index: int, base_url: str, attr_mode: str, sem: asyncio.Semaphore
+                            original_href: Optional[str], index: int, base_url: str, attr_mode: str, sem: asyncio.Semaphore,
+                            http_client: Optional[httpx.AsyncClient] = None
                         ) -> Tuple[Optional[str], Optional[str], Optional[str], Optional[List[str]]]: # <<< mail 用のリストを追加
-                            """ 1要素のhrefを取得し、モードに応じてPDF/コンテンツ/メールも取得 (セマフォで同時実行制御) """
-                            original_href: Optional[str] = None
+                            """ 一括取得済みの1要素のhrefを絶対URLにし、モードに応じてPDF/コンテンツ/メールも取得 (セマフォで同時実行制御) """
                             absolute_url: Optional[str] = None
                             pdf_text: Optional[str] = None
                             scraped_text: Optional[str] = None
@@ -472,13 +1033,13 @@ async def execute_actions_async(
 
                             async with sem: # セマフォで同時実行数を制御
                                 try:
-                                    logger.debug(f"  [{index+1}/{num_found}] Processing started ({attr_mode})...")
-                                    href_timeout = max(500, action_wait_time // num_found if num_found > 5 else action_wait_time // 3)
-                                    original_href = await locator.get_attribute("href", timeout=href_timeout)
-
+                                    logger.debug("  [%d/%d] Processing started (%s)...", index + 1, num_found, attr_mode)
                                     if original_href is None:
-                                        logger.debug(f"  [{index+1}/{num_found}] href属性が見つかりません。")
+                                        logger.debug("  [%d/%d] href属性が見つかりません。", index + 1, num_found)
                                         return None, None, None, None # URLなし
+                                    if original_href.startswith("Error:"):
+                                        # スコープ単位の一括取得に失敗した要素は、理由を URL と pdf / content の結果に残す (通常の属性取得と同様)
+                                        return original_href, (original_href if attr_mode == 'pdf' else None), (original_href if attr_mode == 'content' else None), None
 
                                     # 絶対URL変換
                                     try:
@@ -486,30 +1047,40 @@ async def execute_actions_async(
                                         # URLスキーマが http/https でない場合はスキップ (javascript: mailto: など)
                                         parsed_url = urlparse(absolute_url)
                                         if parsed_url.scheme not in ['http', 'https']:
-                                            logger.debug(f"  [{index+1}/{num_found}] スキップ (非HTTP/HTTPS URL): {absolute_url}")
+                                            logger.debug("  [%d/%d] スキップ (非HTTP/HTTPS URL): %s", index + 1, num_found, absolute_url)
                                             return absolute_url, None, None, None # URLは返す
                                     except Exception as url_conv_e:
                                          logger.warning(f"  [{index+1}/{num_found}] 絶対URL変換エラー ({original_href}): {url_conv_e}")
                                          return f"Error converting URL: {original_href}", None, None, None # エラーURL
 
+                                    # リンク先がPDFかどうか (拡張子ではなく Content-Type / マジックバイトで判定。結果はURLごとにキャッシュ)
+                                    link_is_pdf = attr_mode in ('pdf', 'content') and await utils.is_pdf_url_async(api_request_context, absolute_url, client=http_client)
+
                                     # pdf モードの場合
-                                    if attr_mode == 'pdf' and absolute_url.lower().endswith('.pdf'):
+                                    if attr_mode == 'pdf' and link_is_pdf:
                                         pdf_start = time.monotonic()
-                                        pdf_bytes = await utils.download_pdf_async(api_request_context, absolute_url)
-                                        if pdf_bytes:
-                                            pdf_text = await asyncio.to_thread(utils.extract_text_from_pdf_sync, pdf_bytes)
-                                        else:
-                                            pdf_text = "Error: PDF download failed or returned no data."
+                                        pdf_text, pdf_size, refresh_state = await utils.fetch_pdf_text_async(
+                                            api_request_context, absolute_url, pdf_options, incremental, client=http_client
+                                        )
+                                        step_timing["network_bytes"] += pdf_size
+                                        if refresh_state: refresh_states_by_index[index] = refresh_state
                                         pdf_elapsed = (time.monotonic() - pdf_start) * 1000
-                                        logger.info(f"  [{index+1}/{num_found}] PDF処理完了 ({pdf_elapsed:.0f}ms) URL: {absolute_url}")
+                                        logger.info("  [%d/%d] PDF処理完了 (%.0fms) URL: %s", index + 1, num_found, pdf_elapsed, absolute_url)
 
                                     # content モードの場合 (PDF以外)
-                                    elif attr_mode == 'content' and not absolute_url.lower().endswith('.pdf'):
+                                    elif attr_mode == 'content' and not link_is_pdf:
                                         content_start = time.monotonic()
-                                        success, content_or_error = await get_page_inner_text(current_context, absolute_url, action_wait_time)
+                                        if incremental:
+                                            success, content_or_error, refresh_states_by_index[index] = await _get_page_inner_text_incremental(
+                                                current_context, api_request_context, absolute_url, action_wait_time, http_client=http_client
+                                            )
+                                        else:
+                                            success, content_or_error = await get_page_inner_text(current_context, absolute_url, action_wait_time)
                                         scraped_text = content_or_error
+                                        if success and content_or_error:
+                                            step_timing["network_bytes"] += len(content_or_error.encode("utf-8"))
                                         content_elapsed = (time.monotonic() - content_start) * 1000
-                                        logger.info(f"  [{index+1}/{num_found}] Content取得試行完了 ({content_elapsed:.0f}ms) URL: {absolute_url} Success: {success}")
+                                        logger.info("  [%d/%d] Content取得試行完了 (%.0fms) URL: %s Success: %s", index + 1, num_found, content_elapsed, absolute_url, success)
 
                                     # mail モードの場合 (PDFかどうかは問わない)
                                     elif attr_mode == 'mail':
@@ -517,24 +1088,33 @@ async def execute_actions_async(
                                          # ヘルパー関数を呼び出し
                                          emails_from_page = await _extract_emails_from_page_async(current_context, absolute_url, action_wait_time)
                                          mail_elapsed = (time.monotonic() - mail_start) * 1000
-                                         logger.info(f"  [{index+1}/{num_found}] Mail抽出試行完了 ({mail_elapsed:.0f}ms) URL: {absolute_url} Found: {len(emails_from_page) if emails_from_page else 0}")
+                                         logger.info("  [%d/%d] Mail抽出試行完了 (%.0fms) URL: %s Found: %d", index + 1, num_found, mail_elapsed, absolute_url, len(emails_from_page) if emails_from_page else 0)
 
-                                    logger.debug(f"  [{index+1}/{num_found}] Processing finished. URL: {absolute_url}")
+                                    logger.debug("  [%d/%d] Processing finished. URL: %s", index + 1, num_found, absolute_url)
                                     return absolute_url, pdf_text, scraped_text, emails_from_page # <<< mail 結果を返す
 
-                                except PlaywrightTimeoutError:
-                                    logger.warning(f"  [{index+1}/{num_found}] href属性取得タイムアウト ({href_timeout}ms)。")
-                                    return f"Error: Timeout getting href", None, None, None
+                                except PlaywrightTimeoutError as e:
+                                    logger.warning(f"  [{index+1}/{num_found}] コンテンツ/メール取得タイムアウト: {e}")
+                                    return f"Error: Timeout processing {absolute_url or original_href}", None, None, None
                                 except Exception as e:
                                     logger.warning(f"  [{index+1}/{num_found}] href/コンテンツ/メール取得中に予期せぬエラー: {type(e).__name__} - {e}", exc_info=True)
                                     return f"Error: {type(e).__name__} - {e}", None, None, None
 
-                        # --- 見つかった全要素に対して並行処理 ---
-                        process_tasks = [
-                            process_single_element_for_href_related(loc, idx, current_base_url, attribute_name.lower(), semaphore)
-                            for idx, (loc, _) in enumerate(found_elements_list)
-                        ]
-                        results_tuples = await asyncio.gather(*process_tasks)
+                        # --- href はスコープごとに1回の evaluate_all で一括取得し、URLごとの処理だけを並行実行 ---
+                        # 一括取得は探索ではなく抽出のため、計測せずアクション時間 (内訳の残り) に含める
+                        href_values = await _evaluate_all_in_groups(element_groups, _ATTRIBUTE_VALUES_JS, "href", label="href")
+                        # 並行実行されるURLアクセス全体の経過時間をネットワーク時間として計上する
+                        with utils.measure_ms(step_timing, "network_ms"):
+                            # pdf / content モードのPDF判定・ダウンロード・条件付きリクエストは、全リンクで1つのクライアント (クッキーの取得も1回) を共有する
+                            async with contextlib.AsyncExitStack() as http_stack:
+                                http_client = (
+                                    await http_stack.enter_async_context(utils.open_http_session(api_request_context))
+                                    if attribute_name.lower() in ('pdf', 'content') else None
+                                )
+                                results_tuples = await asyncio.gather(*[
+                                    process_single_element_for_href_related(href, idx, current_base_url, attribute_name.lower(), semaphore, http_client)
+                                    for idx, href in enumerate(href_values)
+                                ])
 
                         # 結果をリストに格納 & mailモードのドメイン重複排除
                         all_extracted_emails_flat: List[str] = [] # mailモード用: 全メールアドレス（ドメイン重複排除前）
@@ -559,12 +1139,12 @@ async def execute_actions_async(
                                         if domain and domain not in processed_domains:
                                             email_list_for_file.append(email) # ユニークドメインのメールを最終リストへ
                                             processed_domains.add(domain) # ドメインを処理済みセットへ
-                                            logger.debug(f"    Added unique domain email: {email}")
+                                            logger.debug("    Added unique domain email: %s", email)
                                         # else: logger.debug(f"    Skipping duplicate domain email: {email}")
                                     except IndexError:
                                         logger.warning(f"    Invalid email format skipped: {email}")
                                 else:
-                                     logger.debug(f"    Skipping invalid or non-string email entry: {email}")
+                                     logger.debug("    Skipping invalid or non-string email entry: %s", email)
                             logger.info(f"ドメイン重複排除完了。ユニークドメインメールアドレス数: {len(email_list_for_file)}")
 
                         # 結果を action_result_details に格納
@@ -575,6 +1155,9 @@ async def execute_actions_async(
                              action_result_details["pdf_texts"] = pdf_texts_list_for_file
                         if attribute_name.lower() == 'content':
                              action_result_details["scraped_texts"] = scraped_texts_list_for_file
+                        if incremental and attribute_name.lower() in ('pdf', 'content'):
+                             # url_list と同じ順序。PDF/ページを取得しなかったURLは None
+                             action_result_details["refresh_states"] = [refresh_states_by_index.get(i) for i in range(len(url_list_for_file))]
                         if attribute_name.lower() == 'mail':
                              action_result_details["extracted_emails"] = email_list_for_file # ドメインユニークなリスト
 
@@ -584,25 +1167,10 @@ async def execute_actions_async(
 
                     # --- href, pdf, content, mail 以外の通常の属性取得 ---
                     else:
-                        logger.info(f"指定された属性 '{attribute_name}' を取得します...")
-                        # 属性値を取得する内部関数
-                        async def get_single_attr(locator: Locator, attr_name: str, index: int) -> Optional[str]:
-                            try:
-                                attr_timeout = max(500, action_wait_time // num_found if num_found > 5 else action_wait_time // 3)
-                                return await locator.get_attribute(attr_name, timeout=attr_timeout)
-                            except PlaywrightTimeoutError:
-                                logger.warning(f"  [{index+1}/{num_found}] 属性 '{attr_name}' 取得タイムアウト ({attr_timeout}ms)。")
-                                return f"Error: Timeout getting attribute '{attr_name}'"
-                            except Exception as e:
-                                logger.warning(f"  [{index+1}/{num_found}] 属性 '{attr_name}' 取得中にエラー: {type(e).__name__}")
-                                return f"Error: {type(e).__name__} getting attribute '{attr_name}'"
-
-                        # 並行処理で属性を取得
-                        attr_tasks = [
-                            get_single_attr(loc, attribute_name, idx)
-                            for idx, (loc, _) in enumerate(found_elements_list)
-                        ]
-                        generic_attribute_list_for_file = await asyncio.gather(*attr_tasks)
+                        logger.info(f"指定された属性 '{attribute_name}' をスコープごとに一括取得します...")
+                        generic_attribute_list_for_file = await _evaluate_all_in_groups(
+                            element_groups, _ATTRIBUTE_VALUES_JS, attribute_name, label=f"attribute '{attribute_name}'"
+                        )
 
                         action_result_details.update({
                             "attribute": attribute_name,
@@ -618,30 +1186,13 @@ async def execute_actions_async(
             elif action == "get_all_text_contents":
                 if not selector: raise ValueError("Action 'get_all_text_contents' requires 'selector'.")
                 text_list: List[Optional[str]] = []
-                if not found_elements_list:
+                if not element_groups:
                     logger.warning(f"動的探索で要素 '{selector}' が見つからなかったため、テキスト取得をスキップします。")
                     action_result_details["results_count"] = 0
                 else:
-                    num_found = len(found_elements_list)
-                    logger.info(f"動的探索で見つかった {num_found} 個の要素から textContent を取得します。")
-                    # textContent を取得する内部関数
-                    async def get_single_text(locator: Locator, index: int) -> Optional[str]:
-                        try:
-                            text_timeout = max(500, action_wait_time // num_found if num_found > 5 else action_wait_time // 3)
-                            text = await locator.text_content(timeout=text_timeout)
-                            return text.strip() if text else "" # 前後空白除去
-                        except PlaywrightTimeoutError:
-                             logger.warning(f"  [{index+1}/{num_found}] textContent取得タイムアウト ({text_timeout}ms)。")
-                             return "Error: Timeout getting textContent"
-                        except Exception as e:
-                            logger.warning(f"  [{index+1}/{num_found}] textContent 取得中にエラー: {type(e).__name__}")
-                            return f"Error: {type(e).__name__} getting textContent"
-
-                    # 並行処理でテキストを取得
-                    get_text_tasks = [
-                        get_single_text(loc, idx) for idx, (loc, _) in enumerate(found_elements_list)
-                    ]
-                    text_list = await asyncio.gather(*get_text_tasks)
+                    num_found = sum(count for _, _, count in element_groups)
+                    logger.info(f"動的探索で見つかった {num_found} 個の要素 ({len(element_groups)} スコープ) から textContent を一括取得します。")
+                    text_list = await _evaluate_all_in_groups(element_groups, _TEXT_CONTENTS_JS, label="textContent")
                     logger.info(f"取得したテキストリスト ({len(text_list)}件)")
                     action_result_details["results_count"] = len(text_list)
 
@@ -678,7 +1229,9 @@ async def execute_actions_async(
                    logger.info("要素が表示されるまでスクロールします...")
                    # scroll_into_view_if_needed は要素がビューポートに入るようにスクロールする
                    await element.scroll_into_view_if_needed(timeout=action_wait_time)
-                   await asyncio.sleep(0.3) # スクロール後の安定待ち
+                   with utils.measure_ms(step_timing, "wait_ms"):
+                       # スクロール後の安定待ち (固定sleepではなくDOM変更の静止で判定)
+                       await wait_for_dom_settle_async(current_target, config.ENGINE_SETTLE_QUIET_MS, config.ENGINE_SETTLE_TIMEOUT)
                    logger.info("要素へのスクロールが成功しました。")
                    results.append({"step": step_num, "status": "success", "action": action, **action_result_details})
 
@@ -709,7 +1262,7 @@ async def execute_actions_async(
                       "get_inner_html", "get_attribute", "get_all_attributes", "get_all_text_contents",
                       "wait_visible", "select_option", "screenshot", "scroll_page_to_bottom",
                       "scroll_to_element", "wait_page_load", "sleep", "switch_to_iframe",
-                      "switch_to_parent_frame"
+                      "switch_to_parent_frame", "paginate", "scroll_until_stable", "wait_for_settle"
                   ]
                   if action not in known_actions:
                      logger.warning(f"未定義または不明なアクション '{action}' です。このステップはスキップされます。")
@@ -718,10 +1271,21 @@ async def execute_actions_async(
         # --- ステップごとのエラーハンドリング ---
         except (PlaywrightTimeoutError, PlaywrightError, ValueError, Exception) as e:
             error_message = f"ステップ {step_num} ({action}) の実行中にエラーが発生しました: {type(e).__name__} - {e}"
-            logger.error(error_message, exc_info=True) # スタックトレース付きでログ出力
+            error_class = action_plan.classify_error(e)
+            retry_policy = step_data.get("_retry_policy")
+            retry_pending = attempts_left > 0 and bool(retry_policy) and error_class in retry_policy["on"]
+            if optional_step and error_class == "timeout" and not retry_pending:
+                # optional ステップのタイムアウトは失敗にせずスキップ扱いとする
+                logger.info(f"optional ステップ {step_num} ({action}) がタイムアウトしたためスキップします: {e}")
+                results.append({"step": step_num, "status": "skipped", "action": action, "selector": selector, "optional": True,
+                                "message": f"Optional step timed out: {e}"})
+                return True
+            logger.error(error_message, exc_info=not retry_pending) # リトライ予定ならスタックトレースは省略
             error_screenshot_path = None
-            # エラー発生時のスクリーンショットを試みる
-            if root_page and not root_page.is_closed():
+            # エラー発生時のスクリーンショットを試みる (リトライ予定の試行では省略)
+            if retry_pending:
+                 logger.info(f"ステップ {step_num} はリトライ予定のため、エラー時のスクリーンショットを省略します。")
+            elif root_page and not root_page.is_closed():
                  timestamp = time.strftime("%Y%m%d_%H%M%S")
                  error_ss_filename = f"error_step{step_num}_{timestamp}.png"
                  error_ss_path = os.path.join(config.DEFAULT_SCREENSHOT_DIR, error_ss_filename)
@@ -745,13 +1309,75 @@ async def execute_actions_async(
                 "action": action,
                 "selector": selector, # エラー発生時のセレクターも記録
                 "message": str(e), # エラーメッセージ本文
+                "error_class": error_class, # リトライ判定用のエラー分類
                 "full_error": error_message, # より詳細なエラー情報 (スタックトレースはログのみ)
                 "traceback": traceback.format_exc() # スタックトレースも結果に含める（デバッグ用）
             }
             if error_screenshot_path:
                 error_details["error_screenshot"] = error_screenshot_path
             results.append(error_details)
-            return False, results # Falseを返して処理中断
+            return False # Falseを返して処理中断
+
+        return True
+
+    async def _save_checkpoint(next_step_index: int, completed: bool = False, paginate_state: Optional[Dict[str, Any]] = None) -> None:
+        """
+        現在のステップ位置・URL・iframe スコープをチェックポイントとして保存する。
+        paginate_state は paginate の途中で保存する場合の再開位置 ({"step_index", "next_page", "seen_item_keys"})。
+        結果は前回の保存以降に増えた分だけを追記し、ストレージ状態は変化した場合だけ書き込む。
+        """
+        nonlocal checkpointed_count, checkpointed_bytes, last_storage_state_digest
+        if not checkpoint_path:
+            return
+        try:
+            storage_state = None
+            if config.CHECKPOINT_SAVE_STORAGE_STATE:
+                storage_state = await root_page.context.storage_state()
+                storage_state_digest = hashlib.sha256(json.dumps(storage_state, sort_keys=True).encode("utf-8")).hexdigest()
+                if storage_state_digest == last_storage_state_digest:
+                    storage_state = None # 前回から変化していなければ書き込まない
+                else:
+                    last_storage_state_digest = storage_state_digest
+            checkpoint_data = {
+                "next_step_index": next_step_index,
+                "completed": completed,
+                "actions_digest": actions_digest,
+                "current_url": root_page.url,
+                "frame_chains": frame_chain_stack + [current_frame_chain],
+                "paginate_state": paginate_state,
+                "saved_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            new_results = results[checkpointed_count:]
+            checkpointed_bytes = await asyncio.to_thread(
+                utils.save_checkpoint, checkpoint_path, checkpoint_data, new_results, storage_state, checkpointed_bytes
+            )
+            checkpointed_count += len(new_results)
+        except Exception as cp_err:
+            # チェックポイント保存の失敗で本処理は止めない (次回は未書き込みの結果を同じ位置からまとめて書き込む)
+            logger.warning(f"チェックポイントの保存に失敗しました ({checkpoint_path}): {type(cp_err).__name__} - {cp_err}")
+            last_storage_state_digest = None
+
+    actions_digest = utils.compute_actions_digest(actions) if checkpoint_path else None
+    if start_index > 0:
+        logger.info(f"チェックポイントから再開します: ステップ {start_index + 1}/{len(actions)} (既存結果 {len(results)} 件)")
+
+    # 実行前に各ステップの冪等性とリトライ指定を検証・正規化する。不正な指定はステップを実行せずにエラー結果として返す
+    try:
+        compiled_actions = action_plan.compile_actions(actions)
+    except ValueError as plan_err:
+        logger.error(f"アクションリストの検証に失敗しました: {plan_err}")
+        results.append({"step": 0, "status": "error", "action": "compile_actions", "message": str(plan_err), "error_class": action_plan.classify_error(plan_err)})
+        _emit_new_results()
+        return False, results
+    for i in range(start_index, len(compiled_actions)):
+        step_succeeded = await _run_step(i + 1, compiled_actions[i], len(compiled_actions))
+        if not step_succeeded:
+            return False, results
+        if exit_requested:
+            logger.info(f"ステップ {i + 1} で早期終了しました。残り {len(actions) - i - 1} ステップは実行しません。")
+            await _save_checkpoint(len(actions), completed=True)
+            break
+        await _save_checkpoint(i + 1, completed=(i + 1 == len(actions)))
 
     # 全てのステップが正常に完了した場合
     return True, results
\ No newline at end of file
@@ -8,36 +8,450 @@ import time
 from collections import deque
 from playwright.async_api import (
     Page,
+    Frame,
     FrameLocator,
     Locator,
     TimeoutError as PlaywrightTimeoutError,
 )
-from typing import List, Tuple, Optional, Union, Deque
+from typing import List, Tuple, Optional, Union, Deque, Dict, Any
 
 import config
+import scope_cache
+import frame_tree
 
 logger = logging.getLogger(__name__)
 
+def new_search_context() -> Dict[str, Any]:
+    """
+    1回の実行 (アクションリスト全体) の間、動的探索で共有する状態を作る。
+    dead_frame_srcs: 有効性確認が完全なタイムアウトで失敗した iframe の URL (以降の探索では確認しない)。
+                     src 属性の値ではなく解決済みの絶対 URL で持ち、FrameLocator 方式と Frameツリー方式 (Frame.url) で共有する
+    depth_hits: 深度ごとの発見回数 (時間配分の事前分布に使う)
+    last_search_path: 直近の単一要素探索で訪れたスコープと配分時間・結果の記録
+    last_found_frame_path: 直近の単一要素探索で要素が見つかった起点からの iframe 経路 (Frame を返す方式では None)
+    """
+    return {"dead_frame_srcs": set(), "depth_hits": {}, "last_search_path": [], "last_found_frame_path": None}
+
+def _depth_weight(depth: int, search_context: Dict[str, Any]) -> float:
+    """深度の重み。深いほど減衰し、この実行中に発見実績のある深度ほど大きくなる。"""
+    hits = search_context.get("depth_hits", {}).get(depth, 0)
+    return (config.FINDER_BUDGET_DEPTH_DECAY ** depth) * (1 + hits)
+
+def _scope_wait_budget(
+    remaining_time_ms: float, depth: int, pending_depths: List[int], max_depth: int, search_context: Dict[str, Any]
+) -> int:
+    """
+    残り時間を、現在のスコープ・待機中のスコープ・未列挙の子フレームに重みで按分し、
+    現在のスコープで要素を待つ時間を返す (FINDER_BUDGET_MIN_SLICE_MS 〜 FINDER_BUDGET_MAX_SLICE_MS)。
+    """
+    own_weight = _depth_weight(depth, search_context)
+    total_weight = own_weight + sum(_depth_weight(d, search_context) for d in pending_depths)
+    if depth < max_depth:
+        total_weight += _depth_weight(depth + 1, search_context) # まだ列挙していない子フレームの分を残す
+    budget = remaining_time_ms * own_weight / total_weight
+    budget = max(config.FINDER_BUDGET_MIN_SLICE_MS, min(config.FINDER_BUDGET_MAX_SLICE_MS, budget))
+    return int(max(50, min(budget, remaining_time_ms - 50))) # 50msのマージン
+
+def _child_probe_budget(remaining_time_ms: float) -> float:
+    """
+    子iframeの有効性確認に使う時間。残り時間を使い切らないよう FINDER_BUDGET_PROBE_SHARE で上限を設けるが、
+    無効な iframe の記録には IFRAME_LOCATOR_TIMEOUT いっぱいの確認が必要なため、残り時間が許す限りその分は確保する。
+    """
+    return max(remaining_time_ms * config.FINDER_BUDGET_PROBE_SHARE, min(config.IFRAME_LOCATOR_TIMEOUT + 50, remaining_time_ms)) # 50ms は _probe_child_frames のマージン
+
+class _ScopeLabel:
+    """ログ用のスコープ表記。FrameLocator の repr はログを実際に出力するときだけ作る。"""
+    __slots__ = ("scope",)
+    deferred_log_safe = True # 表記はスコープのセレクター列だけで決まるため、整形をリスナースレッドに遅らせてよい
+
+    def __init__(self, scope: Union[Page, Frame, FrameLocator]):
+        self.scope = scope
+
+    def __str__(self) -> str:
+        scope_type_name = type(self.scope).__name__
+        return f"{scope_type_name} ({self.scope!r})" if isinstance(self.scope, FrameLocator) else scope_type_name
+
+def _record_search_step(
+    search_path: List[Dict[str, Any]], frame_path: Tuple[int, ...], depth: int, budget_ms: int, step_start_time: float, outcome: str
+) -> Dict[str, Any]:
+    """探索経路の記録に1スコープ分を追加して返す。"""
+    entry = {
+        "scope": "page" if not frame_path else f"iframe{list(frame_path)}",
+        "depth": depth,
+        "budget_ms": budget_ms,
+        "elapsed_ms": round((time.monotonic() - step_start_time) * 1000),
+        "outcome": outcome,
+    }
+    search_path.append(entry)
+    return entry
+
+async def _probe_child_frames(
+    scope: Union[Page, FrameLocator],
+    remaining_time_ms: float,
+    search_context: Dict[str, Any],
+    log_label: str
+) -> List[Tuple[int, FrameLocator]]:
+    """
+    スコープ直下の可視iframeの有効性 (ルート要素の存在) を、共有の締め切り内で並行に確認する。
+    有効な iframe の (nth インデックス, FrameLocator) のリストを返す。
+    完全なタイムアウトで失敗した iframe の URL (相対指定も解決済みの el.src) は search_context に記録し、同じ実行中は再確認しない。
+    """
+    iframe_base_selector = 'iframe:visible' # 可視iframeのみを対象
+    probe_start_time = time.monotonic()
+    try:
+        # 件数と URL を1往復で取得する。el.src は相対指定を解決した絶対 URL (Frameツリー方式の Frame.url と比較できる)
+        frame_srcs: List[str] = await scope.locator(iframe_base_selector).evaluate_all("els => els.map(el => el.src || '')")
+    except Exception as e:
+        logger.warning(f"    スコープ '{type(scope).__name__}' でのiframe列挙中にエラー: {type(e).__name__} - {e}")
+        return []
+    if not frame_srcs:
+        return []
+    dead_frame_srcs = search_context["dead_frame_srcs"]
+    probe_timeout = max(50, min(config.IFRAME_LOCATOR_TIMEOUT, int(remaining_time_ms - 50)))
+    candidates: List[Tuple[int, str, FrameLocator]] = []
+    for i, src in enumerate(frame_srcs):
+        if src and src in dead_frame_srcs:
+            logger.debug("      iframe %d (src='%.80s') はこの実行中に無効と判定済みのためスキップ(%s)", i, src, log_label)
+            continue
+        candidates.append((i, src, scope.frame_locator(f"{iframe_base_selector} >> nth={i}")))
+    logger.debug("      可視iframe候補 %d 件のうち %d 件を並行に確認します (タイムアウト %dms)", len(frame_srcs), len(candidates), probe_timeout)
+
+    outcomes = await asyncio.gather(
+        *[frame_locator.locator(':root').wait_for(state='attached', timeout=probe_timeout) for _, _, frame_locator in candidates],
+        return_exceptions=True
+    )
+    live_frames: List[Tuple[int, FrameLocator]] = []
+    for (i, src, frame_locator), outcome in zip(candidates, outcomes):
+        if not isinstance(outcome, BaseException):
+            live_frames.append((i, frame_locator))
+        elif isinstance(outcome, PlaywrightTimeoutError):
+            logger.debug("      iframe %d (src='%.80s') は有効でないかタイムアウト (%dms)。", i, src, probe_timeout)
+            # 残り時間で短縮されたタイムアウトでは判断できないため、完全なタイムアウトで失敗した場合だけ記録する
+            if src and not src.startswith("about:") and probe_timeout >= config.IFRAME_LOCATOR_TIMEOUT:
+                dead_frame_srcs.add(src)
+        else:
+            logger.warning(f"      iframe {i} の処理中にエラー: {type(outcome).__name__} - {outcome}")
+    probe_elapsed = (time.monotonic() - probe_start_time) * 1000
+    logger.debug("      iframe確認完了(%s): 有効 %d/%d 件 (%.0fms)", log_label, len(live_frames), len(frame_srcs), probe_elapsed)
+    return live_frames
+
+# --- Frameツリー方式の探索 (config.DYNAMIC_SEARCH_BACKEND == 'frame_tree' かつ起点がページの場合) ---
+async def _find_element_in_frame_tree(
+    page: Page, target_selector: str, max_depth: int, timeout: int, target_state: str, search_context: Dict[str, Any]
+) -> Tuple[Optional[Locator], Optional[Union[Page, Frame]]]:
+    """
+    page.frames のツリーを浅い順に直接探索する。メインフレームで見つかった場合のスコープは Page を返す。
+    BFS と同様に、学習済みの経路 (child_frames のインデックス) のフレームを先に確認し、
+    探索したフレームと配分時間・結果を search_context["last_search_path"] に記録する。
+    """
+    start_time = time.monotonic()
+    search_path: List[Dict[str, Any]] = search_context["last_search_path"]
+    frames = frame_tree.get_frame_tree(page, max_depth)
+    page_url = page.url
+    cached_frame_path = scope_cache.get_cached_frame_path(page_url, target_selector, backend="frame_tree")
+    if cached_frame_path: # 学習済みのフレームを先頭に移す (経路が空の場合はメインフレームで、既に先頭)
+        frames.sort(key=lambda entry: entry[2] != cached_frame_path)
+    logger.info(f"動的探索(単一/Frameツリー)開始: セレクター='{target_selector}', フレーム数={len(frames)}, 最大深度={max_depth}, 状態='{target_state}', 全体タイムアウト={timeout}ms")
+    for frame_index, (frame, depth, path) in enumerate(frames):
+        remaining_time_ms = timeout - (time.monotonic() - start_time) * 1000
+        if remaining_time_ms < 100:
+            logger.warning(f"動的探索(単一/Frameツリー)タイムアウト ({timeout}ms)")
+            break
+        step_start_time = time.monotonic()
+        is_cached_frame = bool(cached_frame_path) and path == cached_frame_path
+        # フレーム一覧は列挙済みなので、未列挙の子フレーム分は残さない (max_depth=depth)
+        pending_depths = [entry[1] for entry in frames[frame_index + 1:]]
+        effective_element_timeout = _scope_wait_budget(remaining_time_ms, depth, pending_depths, depth, search_context)
+        if is_cached_frame:
+            effective_element_timeout = max(effective_element_timeout, min(config.SCOPE_CACHE_PROBE_TIMEOUT, int(remaining_time_ms - 100)))
+        outcome_suffix = "_cached" if is_cached_frame else ""
+        try:
+            element = frame.locator(target_selector).first
+            await element.wait_for(state=target_state, timeout=effective_element_timeout)
+            step_elapsed = (time.monotonic() - step_start_time) * 1000
+            logger.info(f"要素 '{target_selector}' をフレーム (深度 {depth}, 経路 {list(path)}, URL='{frame.url[:80]}') で発見。({step_elapsed:.0f}ms)")
+            _record_search_step(search_path, path, depth, effective_element_timeout, step_start_time, f"found{outcome_suffix}")
+            return _on_scope_found(element, (page if depth == 0 else frame), depth, path, page_url, target_selector, search_context, backend="frame_tree")
+        except PlaywrightTimeoutError:
+            logger.debug("    フレーム (深度 %d, 経路 %s) では見つからず (タイムアウト %dms)。", depth, list(path), effective_element_timeout)
+            _record_search_step(search_path, path, depth, effective_element_timeout, step_start_time, f"not_found{outcome_suffix}")
+        except Exception as e:
+            # 探索中にフレームが外れた場合など
+            logger.warning(f"    フレーム (深度 {depth}, 経路 {list(path)}) での探索中にエラー: {type(e).__name__} - {e}")
+            _record_search_step(search_path, path, depth, effective_element_timeout, step_start_time, f"error{outcome_suffix}")
+    final_elapsed_time = (time.monotonic() - start_time) * 1000
+    logger.warning(f"動的探索(単一/Frameツリー)完了: 要素 '{target_selector}' が見つかりませんでした。({final_elapsed_time:.0f}ms)")
+    if cached_frame_path:
+        scope_cache.forget_frame_path(page_url, target_selector, backend="frame_tree") # 古くなった学習結果を破棄
+    return None, None
+
+async def _race_element_in_frame_tree(
+    page: Page, target_selector: str, max_depth: int, timeout: int, target_state: str, search_context: Dict[str, Any]
+) -> Tuple[Optional[Locator], Optional[Union[Page, Frame]]]:
+    """
+    全フレームで同時に要素の待機を開始し、最初に条件を満たしたフレームを採用する (レースモード)。
+    ほぼ同時に見つかった場合は浅いフレームを優先し、残りの待機はキャンセルする。
+    採用したフレームの経路はスコープキャッシュ (Frameツリー方式のキー) と search_context["last_search_path"] に記録する。
+    """
+    start_time = time.monotonic()
+    frames = frame_tree.get_frame_tree(page, max_depth)
+    logger.info(f"動的探索(単一/レース)開始: セレクター='{target_selector}', フレーム数={len(frames)}, 状態='{target_state}', 全体タイムアウト={timeout}ms")
+    wait_tasks: Dict["asyncio.Task[None]", Tuple[Frame, int, Tuple[int, ...]]] = {
+        asyncio.ensure_future(frame.locator(target_selector).first.wait_for(state=target_state, timeout=timeout)): (frame, depth, path)
+        for frame, depth, path in frames
+    }
+    pending = set(wait_tasks)
+    winner: Optional["asyncio.Task[None]"] = None
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            succeeded = [task for task in done if not task.cancelled() and task.exception() is None]
+            if not succeeded:
+                continue # タイムアウトやフレームの切断で終わった待機は無視して残りを待つ
+            winner = min(succeeded, key=lambda task: wait_tasks[task][1])
+            # 同着とみなす短い猶予の間に、より浅いフレームでも見つかればそちらを優先する
+            shallower = {task for task in pending if wait_tasks[task][1] < wait_tasks[winner][1]}
+            if shallower:
+                tie_done, _ = await asyncio.wait(shallower, timeout=config.RACE_TIE_WINDOW_MS / 1000)
+                tie_succeeded = [task for task in tie_done if not task.cancelled() and task.exception() is None]
+                if tie_succeeded:
+                    winner = min(tie_succeeded, key=lambda task: wait_tasks[task][1])
+                pending -= tie_done
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in wait_tasks: # 取得されなかった例外の警告を抑止する
+            if task.done() and not task.cancelled(): task.exception()
+
+    elapsed = (time.monotonic() - start_time) * 1000
+    if winner is None:
+        logger.warning(f"動的探索(単一/レース)完了: 要素 '{target_selector}' が見つかりませんでした。({elapsed:.0f}ms)")
+        search_context["last_search_path"].append({"scope": f"race({len(frames)} frames)", "depth": max_depth, "budget_ms": timeout, "elapsed_ms": round(elapsed), "outcome": "not_found_race"})
+        return None, None
+    frame, depth, path = wait_tasks[winner]
+    logger.info(f"要素 '{target_selector}' をフレーム (深度 {depth}, 経路 {list(path)}) で発見 (レース)。({elapsed:.0f}ms)")
+    _record_search_step(search_context["last_search_path"], path, depth, timeout, start_time, "found_race")
+    return _on_scope_found(frame.locator(target_selector).first, (page if depth == 0 else frame), depth, path, page.url, target_selector, search_context, backend="frame_tree")
+
+async def _find_element_groups_in_frame_tree(
+    page: Page, target_selector: str, max_depth: int, timeout: int, search_context: Dict[str, Any]
+) -> List[Tuple[Union[Page, Frame], str, int]]:
+    """
+    page.frames の全フレームで要素数を並行に数え (count() は待機しない)、見つかったフレームごとのグループを返す。
+    応答しないフレームで止まらないよう timeout で打ち切り、それまでに数えられたフレームの結果を返す。
+    IFRAME_LOCATOR_TIMEOUT 以上待っても数えられなかったフレームの URL は search_context に無効として記録し、
+    この実行中に無効と判定済みの URL のフレーム (FrameLocator 方式で記録したものを含む) は数えない。
+    """
+    start_time = time.monotonic()
+    dead_frame_srcs = search_context["dead_frame_srcs"]
+    frames = [entry for entry in frame_tree.get_frame_tree(page, max_depth) if entry[1] == 0 or entry[0].url not in dead_frame_srcs]
+    count_tasks = {asyncio.ensure_future(frame.locator(target_selector).count()): (frame, depth, path) for frame, depth, path in frames}
+    done, pending = await asyncio.wait(count_tasks, timeout=max(0.1, timeout / 1000)) if count_tasks else (set(), set())
+    for task in pending:
+        task.cancel()
+        frame, depth, _ = count_tasks[task]
+        # 短縮されたタイムアウトでは判断できないため、FrameLocator 方式と同じく完全なタイムアウトで応答しなかった場合だけ記録する
+        if depth > 0 and timeout >= config.IFRAME_LOCATOR_TIMEOUT and frame.url and not frame.url.startswith("about:"):
+            dead_frame_srcs.add(frame.url)
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+        logger.warning(f"動的探索(複数/Frameツリー)タイムアウト ({timeout}ms): {len(pending)}/{len(frames)} フレームの要素数を取得できませんでした。")
+    element_groups: List[Tuple[Union[Page, Frame], str, int]] = []
+    for task, (frame, depth, path) in count_tasks.items(): # フレーム一覧の順 (浅い順) を保つ
+        if task not in done:
+            continue
+        if task.exception() is not None:
+            logger.warning(f"    フレーム (深度 {depth}, 経路 {list(path)}) での要素数取得中にエラー: {type(task.exception()).__name__} - {task.exception()}")
+        elif task.result():
+            element_groups.append((page if depth == 0 else frame, target_selector, task.result()))
+    final_elapsed_time = (time.monotonic() - start_time) * 1000
+    total_count = sum(count for _, _, count in element_groups)
+    logger.info(f"動的探索(複数/Frameツリー)完了: 合計 {total_count} 個の要素が {len(element_groups)}/{len(frames)} フレームで見つかりました。({final_elapsed_time:.0f}ms)")
+    return element_groups
+
+# --- shadow DOM 探索 (search_mode='shadow' の場合) ---
+# 文書と全ての open shadow root を1回の評価で幅優先に走査し、selector に一致する要素を含む
+# shadow host の経路 (各 root 内での host のCSSパスのリスト) を返す。見つからなければ null。
+# selector が DOM の querySelector で扱えない場合 (text=、:has-text()、>>、xpath など Playwright 独自の構文) は
+# {unsupported: true} を返す。closed shadow root はページのJSからも参照できないため対象外。
+_SHADOW_WALK_JS = """
+(root, selector) => {
+    const cssPathWithin = (el) => {
+        const parts = [];
+        for (let node = el; node && node.nodeType === 1; node = node.parentElement) {
+            const rootNode = node.getRootNode();
+            if (node.id && rootNode.querySelectorAll('#' + CSS.escape(node.id)).length === 1) {
+                parts.unshift('#' + CSS.escape(node.id));
+                break;
+            }
+            let index = 1;
+            for (let sib = node.previousElementSibling; sib; sib = sib.previousElementSibling) {
+                if (sib.localName === node.localName) index++;
+            }
+            parts.unshift(`${node.localName}:nth-of-type(${index})`);
+        }
+        return parts.join(' > ');
+    };
+    const queue = [{node: root.ownerDocument, path: []}];
+    while (queue.length) {
+        const {node, path} = queue.shift();
+        let found = null;
+        try { found = node.querySelector(selector); } catch (e) { return {unsupported: true}; }
+        if (found) return path;
+        for (const el of node.querySelectorAll('*')) {
+            if (el.shadowRoot) queue.push({node: el.shadowRoot, path: path.concat([cssPathWithin(el)])});
+        }
+    }
+    return null;
+}
+"""
+
+def _build_shadow_locator(scope: Union[Page, Frame, FrameLocator], shadow_path: List[str], target_selector: str) -> Locator:
+    """shadow host の経路から Locator を組み立てる。2段目以降は直前の host の shadow root 直下から辿る。"""
+    locator: Optional[Locator] = None
+    for index, host_css in enumerate(shadow_path):
+        locator = scope.locator(host_css) if locator is None else locator.locator(f":scope > {host_css}")
+    return (locator or scope).locator(target_selector).first
+
+async def _find_element_in_shadow_dom(
+    scope: Union[Page, Frame, FrameLocator], target_selector: str, timeout: int, target_state: str
+) -> Optional[Locator]:
+    """
+    open shadow root を含めて要素を探索する (iframe には降りない)。
+    学習済みの shadow host 経路があれば先に確認し、なければページ内の1回の評価で経路を求める。
+    見つかった経路はドメイン単位でキャッシュする。
+    セレクターが shadow root の走査で扱えない構文の場合は、待機せずにすぐ None を返す。
+    """
+    start_time = time.monotonic()
+    page_url = scope.url if isinstance(scope, (Page, Frame)) else None
+    cached_shadow_path = scope_cache.get_cached_shadow_path(page_url, target_selector) if page_url else None
+    if cached_shadow_path:
+        element = _build_shadow_locator(scope, cached_shadow_path, target_selector)
+        try:
+            await element.wait_for(state=target_state, timeout=max(50, min(config.SCOPE_CACHE_PROBE_TIMEOUT, timeout - 100)))
+            logger.info(f"要素 '{target_selector}' をキャッシュ済み shadow host 経路 {cached_shadow_path} で発見。({(time.monotonic() - start_time) * 1000:.0f}ms)")
+            return element
+        except PlaywrightTimeoutError:
+            logger.info(f"キャッシュ済み shadow host 経路 {cached_shadow_path} では見つからず。shadow root を走査します。")
+            scope_cache.forget_shadow_path(page_url, target_selector)
+
+    while True:
+        remaining_time_ms = timeout - (time.monotonic() - start_time) * 1000
+        if remaining_time_ms < 100:
+            break
+        try:
+            shadow_path = await scope.locator(':root').evaluate(_SHADOW_WALK_JS, target_selector, timeout=int(remaining_time_ms))
+        except Exception as e:
+            logger.warning(f"shadow root の走査中にエラー: {type(e).__name__} - {e}")
+            return None
+        if isinstance(shadow_path, dict) and shadow_path.get("unsupported"):
+            logger.info(f"セレクター '{target_selector}' は shadow root の走査 (querySelector) で扱えない構文のため、通常の探索に移ります。")
+            return None
+        if shadow_path is not None:
+            element = _build_shadow_locator(scope, shadow_path, target_selector)
+            remaining_time_ms = timeout - (time.monotonic() - start_time) * 1000
+            try:
+                await element.wait_for(state=target_state, timeout=max(50, int(remaining_time_ms)))
+            except PlaywrightTimeoutError:
+                logger.info(f"shadow host 経路 {shadow_path} で要素は存在しますが、状態 '{target_state}' になりませんでした。")
+                return None
+            logger.info(f"要素 '{target_selector}' を shadow host 経路 {shadow_path} で発見。({(time.monotonic() - start_time) * 1000:.0f}ms)")
+            if page_url and shadow_path:
+                scope_cache.remember_shadow_path(page_url, target_selector, shadow_path)
+            return element
+        await asyncio.sleep(config.SHADOW_WALK_POLL_INTERVAL / 1000)
+    logger.info(f"shadow root を含めても要素 '{target_selector}' は見つかりませんでした。({(time.monotonic() - start_time) * 1000:.0f}ms)")
+    return None
+
 # --- 動的要素探索ヘルパー関数 (単一要素用) ---
+def _on_scope_found(
+    element: Locator, scope: Union[Page, FrameLocator, Frame], depth: int, frame_path: scope_cache.FramePath,
+    page_url: Optional[str], target_selector: str, search_context: Dict[str, Any], backend: str = "frame_locator"
+) -> Tuple[Locator, Union[Page, FrameLocator, Frame]]:
+    """発見時の共通処理: 深度の発見実績とスコープキャッシュを更新する。backend は経路の種類 (scope_cache 参照)。"""
+    depth_hits = search_context.setdefault("depth_hits", {})
+    depth_hits[depth] = depth_hits.get(depth, 0) + 1
+    search_context["last_found_frame_path"] = frame_path
+    if page_url:
+        scope_cache.remember_frame_path(page_url, target_selector, frame_path, backend=backend)
+    return element, scope
+
 async def find_element_dynamically(
     base_locator: Union[Page, FrameLocator],
     target_selector: str,
     max_depth: int = config.DYNAMIC_SEARCH_MAX_DEPTH,
     timeout: int = config.DEFAULT_ACTION_TIMEOUT,
-    target_state: str = "attached"
+    target_state: str = "attached",
+    search_context: Optional[Dict[str, Any]] = None,
+    search_mode: Optional[str] = None
 ) -> Tuple[Optional[Locator], Optional[Union[Page, FrameLocator]]]:
     """
     指定された起点からiframe内を含めて動的に単一の要素を探索します。
     見つかった要素のLocatorと、それが見つかったスコープ (Page or FrameLocator) を返します。
     タイムアウトするか見つからない場合は (None, None) を返します。
+    search_context (new_search_context) を渡すと、無効な iframe の判定と深度ごとの発見実績を実行全体で共有し、
+    探索したスコープ・配分時間・結果を search_context["last_search_path"] に記録します。
+    各スコープでの待機時間は固定値ではなく、残り時間を待機中のスコープに深度と発見実績の重みで按分します。
+    config.DYNAMIC_SEARCH_BACKEND が 'frame_tree' で起点がページの場合は page.frames を直接探索します。
+    search_mode (未指定時は config.DYNAMIC_SEARCH_MODE) が 'race' で起点がページの場合は、全フレームで同時に待機します。
+    起点が FrameLocator の場合は通常の探索で代替し、その旨を探索経路に記録します。
+    'shadow' の場合は先に open shadow root を走査し (時間予算の一部)、見つからなければ通常の探索に移ります。
+    学習済みの shadow host 経路は 'shadow' の場合だけ使用します。
     """
+    if search_context is None: search_context = new_search_context()
+    search_path: List[Dict[str, Any]] = []
+    search_context["last_search_path"] = search_path # 呼び出し側が探索経路を参照できるようにする (BFS 以外の方式では空)
+    search_context["last_found_frame_path"] = None
+    effective_search_mode = search_mode or config.DYNAMIC_SEARCH_MODE
+    if effective_search_mode == "shadow":
+        shadow_start_time = time.monotonic()
+        shadow_budget = int(timeout * config.SHADOW_SEARCH_BUDGET_RATIO)
+        shadow_element = await _find_element_in_shadow_dom(base_locator, target_selector, shadow_budget, target_state)
+        if shadow_element:
+            search_context["last_found_frame_path"] = ()
+            return shadow_element, base_locator # shadow DOM は同じフレーム内なのでスコープは変わらない
+        timeout = max(100, int(timeout - (time.monotonic() - shadow_start_time) * 1000))
+        effective_search_mode = "bfs"
+    if effective_search_mode == "race":
+        if isinstance(base_locator, Page):
+            return await _race_element_in_frame_tree(base_locator, target_selector, max_depth, timeout, target_state, search_context)
+        # FrameLocator には Frame ツリーがないため、同時待機はできない。通常の探索で代替したことを経路に残す
+        logger.info(f"起点が {type(base_locator).__name__} のためレースモードは使えません。通常の探索 (BFS) で代替します。")
+        search_path.append({"scope": type(base_locator).__name__, "depth": 0, "budget_ms": 0, "elapsed_ms": 0, "outcome": "race_unsupported_fallback_bfs"})
+    if config.DYNAMIC_SEARCH_BACKEND == "frame_tree" and isinstance(base_locator, Page):
+        return await _find_element_in_frame_tree(base_locator, target_selector, max_depth, timeout, target_state, search_context)
     logger.info(f"動的探索(単一)開始: 起点={type(base_locator).__name__}, セレクター='{target_selector}', 最大深度={max_depth}, 状態='{target_state}', 全体タイムアウト={timeout}ms")
     start_time = time.monotonic()
-    queue: Deque[Tuple[Union[Page, FrameLocator], int]] = deque([(base_locator, 0)])
-    visited_scope_ids = {id(base_locator)}
-    element_wait_timeout = 2000  # 要素存在確認のタイムアウト（短め）
-    iframe_check_timeout = config.IFRAME_LOCATOR_TIMEOUT # iframe有効性確認のタイムアウト
-    logger.debug(f"  要素待機タイムアウト: {element_wait_timeout}ms, フレーム確認タイムアウト: {iframe_check_timeout}ms")
+    # キューには (スコープ, 深度, 起点からのiframe経路) を積む。経路はスコープキャッシュの学習に使う
+    queue: Deque[Tuple[Union[Page, FrameLocator], int, scope_cache.FramePath]] = deque([(base_locator, 0, ())])
+    visited_scopes: List[Tuple[Union[Page, FrameLocator], int, scope_cache.FramePath]] = []
+    logger.debug(f"  要素待機時間は残り時間をスコープに按分 ({config.FINDER_BUDGET_MIN_SLICE_MS}〜{config.FINDER_BUDGET_MAX_SLICE_MS}ms), フレーム確認タイムアウト: {config.IFRAME_LOCATOR_TIMEOUT}ms")
+
+    # --- 学習済みスコープを先に確認 (キャッシュはページ起点の探索でのみ使用) ---
+    page_url = base_locator.url if isinstance(base_locator, Page) else None
+    cached_frame_path = scope_cache.get_cached_frame_path(page_url, target_selector) if page_url else None
+    if cached_frame_path: # 経路が空 (トップレベル) の場合は通常の探索の最初と同じなので省略
+        cached_scope: Union[Page, FrameLocator] = base_locator
+        for nth_index in cached_frame_path:
+            cached_scope = cached_scope.frame_locator(f"iframe:visible >> nth={nth_index}")
+        probe_start_time = time.monotonic()
+        probe_timeout = max(50, min(config.SCOPE_CACHE_PROBE_TIMEOUT, timeout - 100))
+        try:
+            element = cached_scope.locator(target_selector).first
+            await element.wait_for(state=target_state, timeout=probe_timeout)
+            probe_elapsed = (time.monotonic() - probe_start_time) * 1000
+            logger.info(f"要素 '{target_selector}' をキャッシュ済みスコープ (iframe経路 {list(cached_frame_path)}) で発見。({probe_elapsed:.0f}ms)")
+            _record_search_step(search_path, cached_frame_path, len(cached_frame_path), probe_timeout, probe_start_time, "found_cached")
+            scope_cache.remember_frame_path(page_url, target_selector, cached_frame_path)
+            search_context["last_found_frame_path"] = cached_frame_path
+            return element, cached_scope
+        except PlaywrightTimeoutError:
+            _record_search_step(search_path, cached_frame_path, len(cached_frame_path), probe_timeout, probe_start_time, "not_found_cached")
+            probe_elapsed = (time.monotonic() - probe_start_time) * 1000
+            logger.info(f"キャッシュ済みスコープ (iframe経路 {list(cached_frame_path)}) では見つからず。通常の探索に切り替えます。({probe_elapsed:.0f}ms)")
+        except Exception as e:
+            logger.warning(f"キャッシュ済みスコープでの探索中にエラー (通常の探索に切り替え): {type(e).__name__} - {e}")
 
     while queue:
         current_monotonic_time = time.monotonic()
@@ -50,106 +464,99 @@ async def find_element_dynamically(
              logger.warning(f"動的探索(単一)の残り時間がわずかなため ({remaining_time_ms:.0f}ms)、探索を打ち切ります。")
              return None, None
 
-        current_scope, current_depth = queue.popleft()
-        scope_type_name = type(current_scope).__name__
-        scope_identifier = f" ({repr(current_scope)})" if isinstance(current_scope, FrameLocator) else ""
-        logger.debug(f"  探索中(単一): スコープ={scope_type_name}{scope_identifier}, 深度={current_depth}, 残り時間: {remaining_time_ms:.0f}ms")
+        current_scope, current_depth, current_frame_path = queue.popleft()
+        scope_label = _ScopeLabel(current_scope)
+        logger.debug("  探索中(単一): スコープ=%s, 深度=%d, 残り時間: %.0fms", scope_label, current_depth, remaining_time_ms)
 
+        visited_scopes.append((current_scope, current_depth, current_frame_path))
         step_start_time = time.monotonic()
+        # 要素の待機時間は、残り時間を待機中のスコープと深度の重みで按分して決める
+        effective_element_timeout = _scope_wait_budget(remaining_time_ms, current_depth, [d for _, d, _ in queue], max_depth, search_context)
         try:
             element = current_scope.locator(target_selector).first
-            # 要素の待機タイムアウトは、全体タイムアウトの残り時間と設定値の小さい方、かつ最低50msを確保
-            effective_element_timeout = max(50, min(element_wait_timeout, int(remaining_time_ms - 50))) # 50msのマージン
             await element.wait_for(state=target_state, timeout=effective_element_timeout)
             step_elapsed = (time.monotonic() - step_start_time) * 1000
-            logger.info(f"要素 '{target_selector}' をスコープ '{scope_type_name}{scope_identifier}' (深度 {current_depth}) で発見。({step_elapsed:.0f}ms)")
-            return element, current_scope
+            logger.info("要素 '%s' をスコープ '%s' (深度 %d) で発見。(%.0fms)", target_selector, scope_label, current_depth, step_elapsed)
+            _record_search_step(search_path, current_frame_path, current_depth, effective_element_timeout, step_start_time, "found")
+            return _on_scope_found(element, current_scope, current_depth, current_frame_path, page_url, target_selector, search_context)
         except PlaywrightTimeoutError:
             step_elapsed = (time.monotonic() - step_start_time) * 1000
-            logger.debug(f"    スコープ '{scope_type_name}{scope_identifier}' 直下では見つからず (タイムアウト {effective_element_timeout}ms)。({step_elapsed:.0f}ms)")
+            logger.debug("    スコープ '%s' 直下では見つからず (タイムアウト %dms)。(%.0fms)", scope_label, effective_element_timeout, step_elapsed)
+            search_entry = _record_search_step(search_path, current_frame_path, current_depth, effective_element_timeout, step_start_time, "not_found")
         except Exception as e:
             step_elapsed = (time.monotonic() - step_start_time) * 1000
-            logger.warning(f"    スコープ '{scope_type_name}{scope_identifier}' での要素 '{target_selector}' 探索中にエラー: {type(e).__name__} - {e} ({step_elapsed:.0f}ms)")
+            logger.warning("    スコープ '%s' での要素 '%s' 探索中にエラー: %s - %s (%.0fms)", scope_label, target_selector, type(e).__name__, e, step_elapsed)
+            search_entry = _record_search_step(search_path, current_frame_path, current_depth, effective_element_timeout, step_start_time, "error")
 
-        # --- iframe探索 ---
+        # --- iframe探索 (兄弟iframeの有効性確認は共有の締め切り内で並行実行) ---
         if current_depth < max_depth:
-            # 再度時間チェック
-            current_monotonic_time = time.monotonic()
-            elapsed_time_ms = (current_monotonic_time - start_time) * 1000
-            if elapsed_time_ms >= timeout: continue # 時間切れなら次のキューへ
+            elapsed_time_ms = (time.monotonic() - start_time) * 1000
             remaining_time_ms = timeout - elapsed_time_ms
-            if remaining_time_ms < 100: continue # 残り時間が少なすぎる場合
+            if remaining_time_ms < 100: continue # 時間切れ、または残り時間が少なすぎる場合は次のキューへ
+            # 子フレームの確認が残り時間を使い切らないよう、配分比率で上限を設ける (無効判定に必要な時間は確保する)
+            live_frames = await _probe_child_frames(current_scope, _child_probe_budget(remaining_time_ms), search_context, "単一")
+            search_entry["live_child_frames"] = len(live_frames)
+            for i, next_frame_locator in live_frames:
+                queue.append((next_frame_locator, current_depth + 1, current_frame_path + (i,)))
+                logger.debug("        キューに追加(単一): スコープ=FrameLocator(nth=%d), 新深度=%d", i, current_depth + 1)
 
-            step_start_time = time.monotonic()
-            logger.debug(f"    スコープ '{scope_type_name}{scope_identifier}' (深度 {current_depth}) 内の可視iframeを探索...")
-            try:
-                iframe_base_selector = 'iframe:visible' # 可視iframeのみを対象
-                visible_iframe_locators = current_scope.locator(iframe_base_selector)
-                count = await visible_iframe_locators.count()
-                step_elapsed = (time.monotonic() - step_start_time) * 1000
-                if count > 0: logger.debug(f"      発見した可視iframe候補数: {count} ({step_elapsed:.0f}ms)")
-
-                for i in range(count):
-                    # ループ内でも時間チェック
-                    current_monotonic_time_inner = time.monotonic()
-                    elapsed_time_ms_inner = (current_monotonic_time_inner - start_time) * 1000
-                    if elapsed_time_ms_inner >= timeout:
-                         logger.warning(f"動的探索(単一)タイムアウト ({timeout}ms) - iframeループ中")
-                         break # このスコープのiframe探索を打ち切り
-                    remaining_time_ms_inner = timeout - elapsed_time_ms_inner
-                    if remaining_time_ms_inner < 50: break # 残り時間が少なすぎる場合
-
-                    iframe_step_start_time = time.monotonic()
-                    try:
-                        # nth=i で i番目の可視iframeを特定
-                        nth_iframe_selector = f"{iframe_base_selector} >> nth={i}"
-                        next_frame_locator = current_scope.frame_locator(nth_iframe_selector)
-                        # iframeが有効かどうかのチェックタイムアウト
-                        effective_iframe_check_timeout = max(50, min(iframe_check_timeout, int(remaining_time_ms_inner - 50)))
-                        # iframe内のルート要素が存在するかで有効性を判断
-                        await next_frame_locator.locator(':root').wait_for(state='attached', timeout=effective_iframe_check_timeout)
-                        # 訪問済みでなければキューに追加
-                        scope_id = id(next_frame_locator) # FrameLocatorオブジェクトのIDで訪問管理
-                        if scope_id not in visited_scope_ids:
-                            visited_scope_ids.add(scope_id)
-                            queue.append((next_frame_locator, current_depth + 1))
-                            iframe_step_elapsed = (time.monotonic() - iframe_step_start_time) * 1000
-                            logger.debug(f"        キューに追加(単一): スコープ=FrameLocator(nth={i}), 新深度={current_depth + 1} ({iframe_step_elapsed:.0f}ms)")
-                        else:
-                            logger.debug(f"        スキップ(単一): FrameLocator(nth={i}) は訪問済み")
-                    except PlaywrightTimeoutError:
-                         iframe_step_elapsed = (time.monotonic() - iframe_step_start_time) * 1000
-                         logger.debug(f"      iframe {i} ('{nth_iframe_selector}') は有効でないかタイムアウト ({effective_iframe_check_timeout}ms)。({iframe_step_elapsed:.0f}ms)")
-                    except Exception as e:
-                         iframe_step_elapsed = (time.monotonic() - iframe_step_start_time) * 1000
-                         logger.warning(f"      iframe {i} ('{nth_iframe_selector}') の処理中にエラー: {type(e).__name__} - {e} ({iframe_step_elapsed:.0f}ms)")
-            except Exception as e:
-                step_elapsed = (time.monotonic() - step_start_time) * 1000
-                logger.error(f"    スコープ '{scope_type_name}{scope_identifier}' でのiframe探索中に予期せぬエラー: {type(e).__name__} - {e} ({step_elapsed:.0f}ms)", exc_info=True)
+    # --- 全スコープを一巡しても時間が残っている場合は、重みの大きい順に再確認 ---
+    # 再確認に使う時間は全体の FINDER_BUDGET_REVISIT_SHARE までとし、見つからない要素で全体タイムアウトまで待たないようにする。
+    # 確認したスコープが1つだけの場合 (iframe のないページなど) は再確認しない
+    revisit_deadline_ms = min(timeout, (time.monotonic() - start_time) * 1000 + timeout * config.FINDER_BUDGET_REVISIT_SHARE)
+    if len(visited_scopes) <= 1:
+        visited_scopes = []
+    visited_scopes.sort(key=lambda entry: _depth_weight(entry[1], search_context), reverse=True)
+    for revisit_index, (current_scope, current_depth, current_frame_path) in enumerate(visited_scopes):
+        remaining_time_ms = revisit_deadline_ms - (time.monotonic() - start_time) * 1000
+        if remaining_time_ms < 100:
+            break
+        step_start_time = time.monotonic()
+        effective_element_timeout = int(max(50, remaining_time_ms / (len(visited_scopes) - revisit_index) - 50))
+        try:
+            element = current_scope.locator(target_selector).first
+            await element.wait_for(state=target_state, timeout=effective_element_timeout)
+            logger.info(f"要素 '{target_selector}' を再確認で発見 (深度 {current_depth}, iframe経路 {list(current_frame_path)})。")
+            _record_search_step(search_path, current_frame_path, current_depth, effective_element_timeout, step_start_time, "found_on_revisit")
+            return _on_scope_found(element, current_scope, current_depth, current_frame_path, page_url, target_selector, search_context)
+        except Exception as e:
+            outcome = "not_found" if isinstance(e, PlaywrightTimeoutError) else "error"
+            _record_search_step(search_path, current_frame_path, current_depth, effective_element_timeout, step_start_time, f"{outcome}_on_revisit")
 
     final_elapsed_time = (time.monotonic() - start_time) * 1000
     logger.warning(f"動的探索(単一)完了: 要素 '{target_selector}' が最大深度 {max_depth} までで見つかりませんでした。({final_elapsed_time:.0f}ms)")
+    logger.debug("  探索経路: %s", list(search_path))
+    if cached_frame_path and page_url:
+        scope_cache.forget_frame_path(page_url, target_selector) # 古くなった学習結果を破棄
     return None, None
 
-# --- 動的要素探索ヘルパー関数 (複数要素用) ---
-async def find_all_elements_dynamically(
+# スコープごとの要素グループ: (スコープ, セレクター, 一致した要素数)。Frameツリー方式ではスコープが Frame になる
+ElementGroup = Tuple[Union[Page, FrameLocator, Frame], str, int]
+
+# --- 動的要素探索ヘルパー関数 (複数要素・スコープ単位) ---
+async def find_element_groups_dynamically(
     base_locator: Union[Page, FrameLocator],
     target_selector: str,
     max_depth: int = config.DYNAMIC_SEARCH_MAX_DEPTH,
     timeout: int = config.DEFAULT_ACTION_TIMEOUT,
-) -> List[Tuple[Locator, Union[Page, FrameLocator]]]:
+    search_context: Optional[Dict[str, Any]] = None
+) -> List[ElementGroup]:
     """
-    指定された起点からiframe内を含めて動的に複数の要素を探索します。
-    見つかったすべての要素のLocatorとそのスコープのタプルのリストを返します。
-    タイムアウトした場合は、それまでに見つかった要素のリストを返します。
+    指定された起点からiframe内を含めて動的に複数の要素を探索し、
+    要素が見つかったスコープごとに (スコープ, セレクター, 件数) を返します。
+    要素ごとのLocatorは作らないため、呼び出し側はスコープ単位で evaluate_all などの一括処理ができます。
+    タイムアウトした場合は、それまでに見つかったグループのリストを返します。
+    config.DYNAMIC_SEARCH_BACKEND が 'frame_tree' で起点がページの場合は page.frames を直接探索します。
     """
+    if config.DYNAMIC_SEARCH_BACKEND == "frame_tree" and isinstance(base_locator, Page):
+        if search_context is None: search_context = new_search_context()
+        return await _find_element_groups_in_frame_tree(base_locator, target_selector, max_depth, timeout, search_context)
     logger.info(f"動的探索(複数)開始: 起点={type(base_locator).__name__}, セレクター='{target_selector}', 最大深度={max_depth}, 全体タイムアウト={timeout}ms")
     start_time = time.monotonic()
-    found_elements: List[Tuple[Locator, Union[Page, FrameLocator]]] = []
+    element_groups: List[ElementGroup] = []
     queue: Deque[Tuple[Union[Page, FrameLocator], int]] = deque([(base_locator, 0)])
-    visited_scope_ids = {id(base_locator)}
-    iframe_check_timeout = config.IFRAME_LOCATOR_TIMEOUT # iframe有効性確認のタイムアウト
-    logger.debug(f"  フレーム確認タイムアウト: {iframe_check_timeout}ms")
+    if search_context is None: search_context = new_search_context()
+    logger.debug(f"  フレーム確認タイムアウト: {config.IFRAME_LOCATOR_TIMEOUT}ms")
 
     while queue:
         current_monotonic_time = time.monotonic()
@@ -163,80 +570,54 @@ async def find_all_elements_dynamically(
              break
 
         current_scope, current_depth = queue.popleft()
-        scope_type_name = type(current_scope).__name__
-        scope_identifier = f" ({repr(current_scope)})" if isinstance(current_scope, FrameLocator) else ""
-        logger.debug(f"  探索中(複数): スコープ={scope_type_name}{scope_identifier}, 深度={current_depth}, 残り時間: {remaining_time_ms:.0f}ms")
+        scope_label = _ScopeLabel(current_scope)
+        logger.debug("  探索中(複数): スコープ=%s, 深度=%d, 残り時間: %.0fms", scope_label, current_depth, remaining_time_ms)
 
         step_start_time = time.monotonic()
         try:
-            # 要素が表示されているかに関わらず、スコープ内のすべての要素を取得
-            # all() は要素がなくてもエラーにならない（空リストを返す）
-            elements_in_scope = await current_scope.locator(target_selector).all()
+            # 要素が表示されているかに関わらず、スコープ内の要素数だけを1往復で取得 (count() は待機しない)
+            count_in_scope = await current_scope.locator(target_selector).count()
             step_elapsed = (time.monotonic() - step_start_time) * 1000
-            if elements_in_scope:
-                logger.info(f"  スコープ '{scope_type_name}{scope_identifier}' (深度 {current_depth}) で {len(elements_in_scope)} 個の要素を発見。({step_elapsed:.0f}ms)")
-                for elem in elements_in_scope:
-                    found_elements.append((elem, current_scope))
+            if count_in_scope:
+                logger.info("  スコープ '%s' (深度 %d) で %d 個の要素を発見。(%.0fms)", scope_label, current_depth, count_in_scope, step_elapsed)
+                element_groups.append((current_scope, target_selector, count_in_scope))
             else:
-                logger.debug(f"    スコープ '{scope_type_name}{scope_identifier}' 直下では要素が見つからず。({step_elapsed:.0f}ms)")
+                logger.debug("    スコープ '%s' 直下では要素が見つからず。(%.0fms)", scope_label, step_elapsed)
         except Exception as e:
             step_elapsed = (time.monotonic() - step_start_time) * 1000
-            logger.warning(f"    スコープ '{scope_type_name}{scope_identifier}' での要素 '{target_selector}' 複数探索中にエラー: {type(e).__name__} - {e} ({step_elapsed:.0f}ms)")
+            logger.warning("    スコープ '%s' での要素 '%s' 複数探索中にエラー: %s - %s (%.0fms)", scope_label, target_selector, type(e).__name__, e, step_elapsed)
 
-        # --- iframe探索 ---
+        # --- iframe探索 (兄弟iframeの有効性確認は共有の締め切り内で並行実行) ---
         if current_depth < max_depth:
-            # 再度時間チェック
-            current_monotonic_time = time.monotonic()
-            elapsed_time_ms = (current_monotonic_time - start_time) * 1000
-            if elapsed_time_ms >= timeout: continue # 時間切れなら次のキューへ
+            elapsed_time_ms = (time.monotonic() - start_time) * 1000
             remaining_time_ms = timeout - elapsed_time_ms
-            if remaining_time_ms < 100: continue # 残り時間が少なすぎる場合
-
-            step_start_time = time.monotonic()
-            logger.debug(f"    スコープ '{scope_type_name}{scope_identifier}' (深度 {current_depth}) 内の可視iframeを探索...")
-            try:
-                iframe_base_selector = 'iframe:visible' # 可視iframeのみを対象
-                visible_iframe_locators = current_scope.locator(iframe_base_selector)
-                count = await visible_iframe_locators.count()
-                step_elapsed = (time.monotonic() - step_start_time) * 1000
-                if count > 0: logger.debug(f"      発見した可視iframe候補数: {count} ({step_elapsed:.0f}ms)")
-
-                for i in range(count):
-                    # ループ内でも時間チェック
-                    current_monotonic_time_inner = time.monotonic()
-                    elapsed_time_ms_inner = (current_monotonic_time_inner - start_time) * 1000
-                    if elapsed_time_ms_inner >= timeout:
-                         logger.warning(f"動的探索(複数)タイムアウト ({timeout}ms) - iframeループ中")
-                         break # このスコープのiframe探索を打ち切り
-                    remaining_time_ms_inner = timeout - elapsed_time_ms_inner
-                    if remaining_time_ms_inner < 50: break # 残り時間が少なすぎる場合
-
-                    iframe_step_start_time = time.monotonic()
-                    try:
-                        nth_iframe_selector = f"{iframe_base_selector} >> nth={i}"
-                        next_frame_locator = current_scope.frame_locator(nth_iframe_selector)
-                        # iframeが有効かどうかのチェックタイムアウト
-                        effective_iframe_check_timeout = max(50, min(iframe_check_timeout, int(remaining_time_ms_inner - 50)))
-                        await next_frame_locator.locator(':root').wait_for(state='attached', timeout=effective_iframe_check_timeout)
-                        # 訪問済みでなければキューに追加
-                        scope_id = id(next_frame_locator)
-                        if scope_id not in visited_scope_ids:
-                            visited_scope_ids.add(scope_id)
-                            queue.append((next_frame_locator, current_depth + 1))
-                            iframe_step_elapsed = (time.monotonic() - iframe_step_start_time) * 1000
-                            logger.debug(f"        キューに追加(複数): スコープ=FrameLocator(nth={i}), 新深度={current_depth + 1} ({iframe_step_elapsed:.0f}ms)")
-                        else:
-                             logger.debug(f"        スキップ(複数): FrameLocator(nth={i}) は訪問済み")
-                    except PlaywrightTimeoutError:
-                         iframe_step_elapsed = (time.monotonic() - iframe_step_start_time) * 1000
-                         logger.debug(f"      iframe {i} ('{nth_iframe_selector}') は有効でないかタイムアウト ({effective_iframe_check_timeout}ms)。({iframe_step_elapsed:.0f}ms)")
-                    except Exception as e:
-                         iframe_step_elapsed = (time.monotonic() - iframe_step_start_time) * 1000
-                         logger.warning(f"      iframe {i} ('{nth_iframe_selector}') の処理中にエラー: {type(e).__name__} - {e} ({iframe_step_elapsed:.0f}ms)")
-            except Exception as e:
-                step_elapsed = (time.monotonic() - step_start_time) * 1000
-                logger.error(f"    スコープ '{scope_type_name}{scope_identifier}' でのiframe探索中に予期せぬエラー: {type(e).__name__} - {e} ({step_elapsed:.0f}ms)", exc_info=True)
+            if remaining_time_ms < 100: continue # 時間切れ、または残り時間が少なすぎる場合は次のキューへ
+            live_frames = await _probe_child_frames(current_scope, remaining_time_ms, search_context, "複数")
+            for i, next_frame_locator in live_frames:
+                queue.append((next_frame_locator, current_depth + 1))
+                logger.debug("        キューに追加(複数): スコープ=FrameLocator(nth=%d), 新深度=%d", i, current_depth + 1)
 
     final_elapsed_time = (time.monotonic() - start_time) * 1000
-    logger.info(f"動的探索(複数)完了: 合計 {len(found_elements)} 個の要素が見つかりました。({final_elapsed_time:.0f}ms)")
-    return found_elements
\ No newline at end of file
+    total_count = sum(count for _, _, count in element_groups)
+    logger.info(f"動的探索(複数)完了: 合計 {total_count} 個の要素が {len(element_groups)} スコープで見つかりました。({final_elapsed_time:.0f}ms)")
+    return element_groups
+
+# --- 動的要素探索ヘルパー関数 (複数要素用) ---
+async def find_all_elements_dynamically(
+    base_locator: Union[Page, FrameLocator],
+    target_selector: str,
+    max_depth: int = config.DYNAMIC_SEARCH_MAX_DEPTH,
+    timeout: int = config.DEFAULT_ACTION_TIMEOUT,
+    search_context: Optional[Dict[str, Any]] = None
+) -> List[Tuple[Locator, Union[Page, FrameLocator]]]:
+    """
+    指定された起点からiframe内を含めて動的に複数の要素を探索します。
+    見つかったすべての要素のLocatorとそのスコープのタプルのリストを返します。
+    要素ごとに操作が必要な場合に使用し、一括抽出には find_element_groups_dynamically を使用してください。
+    """
+    element_groups = await find_element_groups_dynamically(base_locator, target_selector, max_depth=max_depth, timeout=timeout, search_context=search_context)
+    return [
+        (scope.locator(selector).nth(i), scope)
+        for scope, selector, count in element_groups
+        for i in range(count)
+    ]
\ No newline at end of file
@@ -550,14 +550,12 @@ async def execute_actions_async(initial_page: Page, actions: List[dict], api_req
                         # PDFかどうかを判定して処理
                         if isinstance(absolute_url, str) and absolute_url.lower().endswith('.pdf'):
                             logger.info(f"  リンク先がPDFファイルです。ダウンロードとテキスト抽出を試みます: {absolute_url}")
-                            pdf_bytes = await utils.download_pdf_async(api_request_context, absolute_url)
-                            if pdf_bytes:
-                                # 同期関数を非同期で実行
-                                pdf_text_content = await asyncio.to_thread(utils.extract_text_from_pdf_sync, pdf_bytes)
-                                logger.info(f"  PDFテキスト抽出完了 (先頭200文字): {pdf_text_content[:200] if pdf_text_content else 'None'}...")
+                            # 一時ファイルへのダウンロードとテキスト抽出 (失敗時はエラーメッセージが返る)
+                            pdf_text_content, _, _ = await utils.fetch_pdf_text_async(api_request_context, absolute_url)
+                            if pdf_text_content.startswith("Error:"):
+                                logger.error(f"  PDFダウンロードまたはテキスト抽出エラー: {pdf_text_content}")
                             else:
-                                pdf_text_content = "Error: PDF download failed or returned no data."
-                                logger.error(f"  PDFダウンロード失敗: {absolute_url}")
+                                logger.info(f"  PDFテキスト抽出完了 (先頭200文字): {pdf_text_content[:200]}...")
                         else:
                              logger.debug(f"  リンク先はPDFではありません ({absolute_url})。")
                     except Exception as url_e:
@@ -638,14 +636,12 @@ async def execute_actions_async(initial_page: Page, actions: List[dict], api_req
                                 if isinstance(abs_url, str) and abs_url.lower().endswith('.pdf'):
                                     pdf_text_content = "Error: PDF download or extraction failed." # デフォルトエラーメッセージ
                                     try:
-                                        pdf_bytes = await utils.download_pdf_async(api_request_context, abs_url)
-                                        if pdf_bytes:
-                                            pdf_text_content = await asyncio.to_thread(utils.extract_text_from_pdf_sync, pdf_bytes)
-                                            logger.info(f"  [{idx+1}] PDF Text Extracted (Length: {len(pdf_text_content or '')})")
-                                            logger.debug(f"    Text: {pdf_text_content[:200] if pdf_text_content else 'None'}...")
+                                        pdf_text_content, _, _ = await utils.fetch_pdf_text_async(api_request_context, abs_url)
+                                        if pdf_text_content.startswith("Error:"):
+                                            logger.error(f"  [{idx+1}] PDF download or extraction failed: {pdf_text_content}")
                                         else:
-                                            pdf_text_content = "Error: PDF download failed or returned no data."
-                                            logger.error(f"  [{idx+1}] PDF download failed.")
+                                            logger.info(f"  [{idx+1}] PDF Text Extracted (Length: {len(pdf_text_content)})")
+                                            logger.debug(f"    Text: {pdf_text_content[:200]}...")
                                     except Exception as pdf_err:
                                         logger.error(f"  [{idx+1}] PDF processing error: {pdf_err}")
                                         pdf_text_content = f"Error: {pdf_err}"
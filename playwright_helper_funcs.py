@@ -5,16 +5,18 @@ Playwrightに関連するヘルパー関数 (要素探索以外) を提供しま
 """
 import asyncio
 import logging
+import re
 import time
 from playwright.async_api import (
     Page,
     Frame,
+    FrameLocator,
     Locator,
     BrowserContext,
     TimeoutError as PlaywrightTimeoutError,
     Error as PlaywrightError
 )
-from typing import Tuple, Optional, Union
+from typing import Tuple, Optional, Union, Dict, Any, List
 from urllib.parse import urljoin
 
 import config
@@ -23,10 +25,13 @@ import utils # PDF関連の関数を使用するため
 logger = logging.getLogger(__name__)
 
 
-async def get_page_inner_text(context: BrowserContext, url: str, timeout: int) -> Tuple[bool, Optional[str]]:
+async def get_page_inner_text(
+    context: BrowserContext, url: str, timeout: int, response_info: Optional[Dict[str, Any]] = None
+) -> Tuple[bool, Optional[str]]:
     """
     指定されたURLに新しいページでアクセスし、ページのinnerTextを取得する。
     成功したかどうかとテキスト内容（またはエラーメッセージ）のタプルを返す。
+    response_info を渡すと、ナビゲーションのレスポンスの status / etag / last_modified を格納する (差分取得の検証子用)。
     """
     page = None
     start_time = time.monotonic()
@@ -38,7 +43,11 @@ async def get_page_inner_text(context: BrowserContext, url: str, timeout: int) -
         # ナビゲーションタイムアウトを設定 (ページアクセスタイムアウトの90%か10秒の大きい方)
         nav_timeout = max(int(page_access_timeout * 0.9), 10000)
         logger.debug(f"  Navigating to {url} with timeout {nav_timeout}ms")
-        await page.goto(url, wait_until="load", timeout=nav_timeout)
+        navigation_response = await page.goto(url, wait_until="load", timeout=nav_timeout)
+        if response_info is not None and navigation_response is not None:
+            response_headers = navigation_response.headers
+            response_info.update({"status": navigation_response.status, "etag": response_headers.get("etag"),
+                                  "last_modified": response_headers.get("last-modified")})
         logger.debug(f"  Navigation to {url} successful.")
 
         # <body>要素が表示されるまで待機 (残り時間の50%か2秒の大きい方)
@@ -115,4 +124,241 @@ async def generate_iframe_selector_async(iframe_locator: Locator) -> Optional[st
         logger.debug(f"iframe属性取得中にエラー（無視）: {e}")
 
     # 適切なセレクターが見つからなければNoneを返す
-    return None
\ No newline at end of file
+    return None
+
+
+# MutationObserver で DOM 変更が quietMs の間止まるまで待つ (timeoutMs で打ち切り)
+_DOM_SETTLE_JS = """
+(root, args) => new Promise(resolve => {
+    const start = performance.now();
+    let mutations = 0;
+    let quietTimer = null;
+    let hardTimer = null;
+    const observer = new MutationObserver(records => {
+        mutations += records.length;
+        clearTimeout(quietTimer);
+        quietTimer = setTimeout(() => finish(true), args.quietMs);
+    });
+    const finish = (settled) => {
+        observer.disconnect();
+        clearTimeout(quietTimer);
+        clearTimeout(hardTimer);
+        resolve({settled: settled, mutations: mutations, elapsedMs: Math.round(performance.now() - start)});
+    };
+    observer.observe(root, {childList: true, subtree: true, characterData: true});
+    quietTimer = setTimeout(() => finish(true), args.quietMs);
+    hardTimer = setTimeout(() => finish(false), args.timeoutMs);
+})
+"""
+
+async def wait_for_dom_settle_async(scope: Union[Page, FrameLocator], quiet_ms: int, timeout: int) -> Dict[str, Any]:
+    """
+    スコープ (ページまたはiframe) のDOM変更が quiet_ms の間発生しなくなるまで待つ。
+    戻り値: {"settled": 静止したか, "mutations": 観測した変更数, "elapsed_ms": 経過時間}
+    タイムアウトしても例外にはせず settled=False を返す。
+    """
+    settle_result = await scope.locator(':root').evaluate(
+        _DOM_SETTLE_JS, {"quietMs": quiet_ms, "timeoutMs": timeout}, timeout=timeout + 1000
+    )
+    return {"settled": settle_result["settled"], "mutations": settle_result["mutations"], "elapsed_ms": settle_result["elapsedMs"]}
+
+class _NetworkQuietTracker:
+    """
+    ページのリクエストの開始と完了を監視し、進行中のリクエストがない状態が quiet_ms 続くのを待つ。
+    page.wait_for_load_state("networkidle") はページが一度 networkidle に達すると以降はすぐに完了するため、
+    クリック後の AJAX 通信などを待つにはアクションの前から監視する必要がある。
+    """
+    def __init__(self, page: Page):
+        self.page = page
+        self.in_flight: set = set()
+        self.requests_seen = 0
+        self._last_activity = time.monotonic()
+        page.on("request", self._on_request)
+        page.on("requestfinished", self._on_request_done)
+        page.on("requestfailed", self._on_request_done)
+
+    def _on_request(self, request: Any) -> None:
+        self.in_flight.add(request)
+        self.requests_seen += 1
+        self._last_activity = time.monotonic()
+
+    def _on_request_done(self, request: Any) -> None:
+        self.in_flight.discard(request)
+        self._last_activity = time.monotonic()
+
+    def close(self) -> None:
+        self.page.remove_listener("request", self._on_request)
+        self.page.remove_listener("requestfinished", self._on_request_done)
+        self.page.remove_listener("requestfailed", self._on_request_done)
+
+    async def wait(self, quiet_ms: int, timeout: int) -> Dict[str, Any]:
+        """タイムアウトしても例外にはせず settled=False を返す。"""
+        start_time = time.monotonic()
+        try:
+            while True:
+                now = time.monotonic()
+                if not self.in_flight and (now - self._last_activity) * 1000 >= quiet_ms:
+                    settled = True
+                    break
+                if (now - start_time) * 1000 >= timeout:
+                    settled = False
+                    break
+                await asyncio.sleep(config.SETTLE_POLL_INTERVAL / 1000)
+        finally:
+            self.close()
+        return {"settled": settled, "elapsed_ms": round((time.monotonic() - start_time) * 1000), "requests": self.requests_seen}
+
+async def wait_for_selector_count_async(
+    scope: Union[Page, FrameLocator], selector: str, timeout: int, expected_count: Optional[int] = None,
+    baseline_count: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    selector に一致する要素数の変化を待つ。expected_count 指定時はその数以上になるまで、
+    未指定時は baseline_count (省略時は開始時点の数) から変化するまで、待機しない count() で短い間隔でポーリングする。
+    タイムアウト時は PlaywrightTimeoutError を送出する。
+    """
+    start_time = time.monotonic()
+    locator = scope.locator(selector)
+    if baseline_count is None:
+        baseline_count = await locator.count()
+    while True:
+        current_count = await locator.count()
+        if (current_count >= expected_count) if expected_count is not None else (current_count != baseline_count):
+            return {"settled": True, "elapsed_ms": round((time.monotonic() - start_time) * 1000),
+                    "baseline_count": baseline_count, "count": current_count}
+        if (time.monotonic() - start_time) * 1000 >= timeout:
+            raise PlaywrightTimeoutError(f"Count of '{selector}' did not change from {baseline_count} within {timeout}ms"
+                                         + (f" (expected >= {expected_count})" if expected_count is not None else "") + ".")
+        await asyncio.sleep(config.SETTLE_POLL_INTERVAL / 1000)
+
+SETTLE_MODES = ("network_idle", "dom_quiet", "response", "selector_count")
+
+class ArmedSettle:
+    """
+    アクションの前に監視を開始しておく静止待機 (arm_settle_async で作成する)。
+    アクションの後に wait() で待つため、アクションの直後に完了した通信やDOM変更も取りこぼさない。
+    wait() を呼ばない場合は cancel() で監視を解除する。
+    """
+    def __init__(
+        self, page: Page, scope: Union[Page, FrameLocator], mode: str, timeout: int, quiet_ms: int,
+        url_pattern: Optional[str], selector: Optional[str], expected_count: Optional[int]
+    ):
+        self.page = page
+        self.scope = scope
+        self.mode = mode
+        self.timeout = timeout
+        self.quiet_ms = quiet_ms
+        self.url_pattern = url_pattern
+        self.selector = selector
+        self.expected_count = expected_count
+        self._network_tracker: Optional[_NetworkQuietTracker] = None
+        self._response_future: Optional[asyncio.Future] = None
+        self._response_handler = None
+        self._baseline_count: Optional[int] = None
+
+    async def _arm(self) -> None:
+        if self.mode == "network_idle":
+            self._network_tracker = _NetworkQuietTracker(self.page)
+        elif self.mode == "response":
+            url_regex = re.compile(self.url_pattern)
+            response_future = asyncio.get_running_loop().create_future()
+            def _on_response(response: Any) -> None:
+                if not response_future.done() and url_regex.search(response.url):
+                    response_future.set_result(response)
+            self._response_future = response_future
+            self._response_handler = _on_response
+            self.page.on("response", _on_response)
+        elif self.mode == "selector_count":
+            self._baseline_count = await self.scope.locator(self.selector).count()
+
+    def cancel(self) -> None:
+        if self._network_tracker:
+            self._network_tracker.close()
+            self._network_tracker = None
+        if self._response_handler:
+            self.page.remove_listener("response", self._response_handler)
+            self._response_handler = None
+
+    async def wait(self) -> Dict[str, Any]:
+        """
+        network_idle / dom_quiet は時間内に静止しなくても settled=False を返す。
+        response / selector_count は待つべき事象が起きなければ PlaywrightTimeoutError を送出する。
+        """
+        start_time = time.monotonic()
+        try:
+            if self.mode == "network_idle":
+                return await self._network_tracker.wait(self.quiet_ms, self.timeout)
+            if self.mode == "dom_quiet":
+                return await wait_for_dom_settle_async(self.scope, self.quiet_ms, self.timeout)
+            if self.mode == "response":
+                try:
+                    response = await asyncio.wait_for(self._response_future, self.timeout / 1000)
+                except asyncio.TimeoutError:
+                    raise PlaywrightTimeoutError(f"No response matching '{self.url_pattern}' within {self.timeout}ms.")
+                return {"settled": True, "elapsed_ms": round((time.monotonic() - start_time) * 1000), "url": response.url, "status": response.status}
+            return await wait_for_selector_count_async(self.scope, self.selector, self.timeout, self.expected_count, baseline_count=self._baseline_count)
+        finally:
+            self.cancel()
+
+async def arm_settle_async(
+    page: Page,
+    scope: Union[Page, FrameLocator],
+    mode: str,
+    timeout: int,
+    quiet_ms: int = config.SETTLE_QUIET_MS,
+    url_pattern: Optional[str] = None,
+    selector: Optional[str] = None,
+    expected_count: Optional[int] = None
+) -> ArmedSettle:
+    """
+    固定sleepの代わりに、イベントに基づいてページの落ち着きを待つ共通プリミティブ。監視はこの時点で開始する。
+    mode: 'network_idle' (進行中のリクエストがない状態が quiet_ms 続く), 'dom_quiet' (DOM変更の静止),
+          'response' (url_pattern に一致するレスポンス), 'selector_count' (selector の要素数が開始時点から変化)
+    クリックなどで起きる事象を待つ場合は、アクションの前にこの関数を呼び、アクションの後に wait() を呼ぶ。
+    """
+    if mode not in SETTLE_MODES:
+        raise ValueError(f"Invalid settle mode: '{mode}'. Use one of {list(SETTLE_MODES)}.")
+    if mode == "response" and not url_pattern:
+        raise ValueError("settle mode 'response' requires 'url_pattern'.")
+    if mode == "selector_count" and not selector:
+        raise ValueError("settle mode 'selector_count' requires a selector.")
+    armed = ArmedSettle(page, scope, mode, timeout, quiet_ms, url_pattern, selector, expected_count)
+    await armed._arm()
+    return armed
+
+async def wait_for_settle_async(
+    page: Page,
+    scope: Union[Page, FrameLocator],
+    mode: str,
+    timeout: int,
+    quiet_ms: int = config.SETTLE_QUIET_MS,
+    url_pattern: Optional[str] = None,
+    selector: Optional[str] = None,
+    expected_count: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    呼び出した時点から監視を開始して静止を待つ (wait_for_settle ステップ用)。
+    呼び出し前に起きた事象 (直前のステップのクリックで完了した通信、既に変化した要素数など) は見えないため、
+    アクションが引き起こす事象を待つ場合は arm_settle_async (click / paginate の settle_mode) を使う。
+    """
+    armed = await arm_settle_async(page, scope, mode, timeout, quiet_ms, url_pattern, selector, expected_count)
+    return await armed.wait()
+
+async def scroll_scope_to_bottom_async(scope: Union[Page, FrameLocator]) -> int:
+    """スコープ (ページまたはiframe) の文書を最下部までスクロールし、スクロール後の scrollHeight を返す。"""
+    return await scope.locator(':root').evaluate(
+        "root => { const doc = root.ownerDocument; const el = doc.scrollingElement || root;"
+        " doc.defaultView.scrollTo(0, el.scrollHeight); return el.scrollHeight; }"
+    )
+
+async def extract_items_from_index_async(
+    scope: Union[Page, FrameLocator], selector: str, start_index: int, attribute_name: Optional[str] = None
+) -> List[Optional[str]]:
+    """
+    selector に一致する要素のうち start_index 以降のテキスト (または属性値) を1回の evaluate_all でまとめて取得する。
+    無限スクロールで増えた分だけを差分抽出するために使用する。
+    """
+    return await scope.locator(selector).evaluate_all(
+        "(els, args) => els.slice(args.start).map(el => args.attr ? el.getAttribute(args.attr) : (el.textContent || '').trim())",
+        {"start": start_index, "attr": attribute_name}
+    )
@@ -0,0 +1,143 @@
+# --- ファイル: playwright_hints.py ---
+"""
+LLMが生成した target_hints (要素特定ヒントの候補リスト) を Playwright の Locator に変換し、
+全候補を並行に検査して最適な要素を決定する機能を提供します。
+"""
+import asyncio
+import json
+import logging
+import time
+from playwright.async_api import (
+    Page,
+    FrameLocator,
+    Locator,
+    TimeoutError as PlaywrightTimeoutError,
+)
+from typing import List, Tuple, Optional, Union, Dict, Any
+
+import config
+from playwright_finders import find_element_dynamically
+
+logger = logging.getLogger(__name__)
+
+# 確信度の優先順位 (小さいほど優先)
+CONFIDENCE_RANK: Dict[str, int] = {"high": 0, "medium": 1, "low": 2}
+SUPPORTED_HINT_TYPES = (
+    "role_and_text", "test_id", "aria_label", "text_exact", "placeholder", "nth_child", "css_selector_candidate"
+)
+
+def _css_string(value: Any) -> str:
+    """CSS属性セレクター用に値をクォートする。"""
+    return json.dumps(str(value), ensure_ascii=False)
+
+def build_locator_from_hint(scope: Union[Page, FrameLocator], hint: Dict[str, Any]) -> Optional[Locator]:
+    """
+    1つのヒントを Locator に変換する。未対応の type や必要な値が欠けている場合は None を返す。
+    """
+    hint_type = hint.get("type")
+    value = hint.get("value")
+    if hint_type == "role_and_text":
+        role = value or hint.get("role")
+        if not role: return None
+        role_kwargs: Dict[str, Any] = {}
+        if hint.get("name"):
+            role_kwargs.update(name=str(hint["name"]), exact=True)
+        if role == "heading" and hint.get("level") is not None:
+            role_kwargs["level"] = int(hint["level"])
+        return scope.get_by_role(role, **role_kwargs)
+    if hint_type == "test_id" and value:
+        return scope.get_by_test_id(str(value))
+    if hint_type == "aria_label" and value:
+        return scope.locator(f"[aria-label={_css_string(value)}]")
+    if hint_type == "text_exact" and value:
+        return scope.get_by_text(str(value), exact=True)
+    if hint_type == "placeholder" and value:
+        return scope.get_by_placeholder(str(value), exact=True)
+    if hint_type == "nth_child":
+        common_selector = hint.get("common_selector")
+        if not common_selector or hint.get("index") is None: return None
+        return scope.locator(common_selector).nth(int(hint["index"]))
+    if hint_type == "css_selector_candidate" and value:
+        return scope.locator(str(value))
+    return None
+
+async def resolve_target_hints_async(
+    scope: Union[Page, FrameLocator],
+    hints: List[Dict[str, Any]],
+    fallback_selector: Optional[str],
+    timeout: int = config.DEFAULT_ACTION_TIMEOUT,
+    target_state: str = "attached",
+    search_context: Optional[Dict[str, Any]] = None,
+    search_mode: Optional[str] = None
+) -> Tuple[Optional[Locator], Optional[Union[Page, FrameLocator]], Dict[str, Any]]:
+    """
+    target_hints の全候補を並行に検査し、一意にマッチした候補のうち確信度が最も高いものを採用する。
+    一意な候補が得られない場合は fallback_selector で動的探索 (iframe含む) を行う。
+    戻り値: (Locator or None, 見つかったスコープ or None, 解決レポート)
+    """
+    start_time = time.monotonic()
+    report: Dict[str, Any] = {"winner": None, "hint_index": None, "confidence": None, "candidates": [], "elapsed_ms": 0}
+    candidates: List[Tuple[int, Dict[str, Any], Locator]] = []
+    for idx, hint in enumerate(hints or []):
+        if not isinstance(hint, dict) or hint.get("type") not in SUPPORTED_HINT_TYPES:
+            logger.debug(f"  未対応または不正なヒントをスキップ: {hint}")
+            continue
+        try:
+            locator = build_locator_from_hint(scope, hint)
+        except Exception as build_err:
+            logger.debug(f"  ヒント {idx} のLocator生成に失敗 (スキップ): {type(build_err).__name__} - {build_err}")
+            locator = None
+        if locator is not None:
+            candidates.append((idx, hint, locator))
+    logger.info(f"target_hints 解決開始: 候補 {len(candidates)}/{len(hints or [])} 件, 状態='{target_state}', タイムアウト={timeout}ms")
+
+    hints_budget_ms = min(timeout, config.TARGET_HINTS_TIMEOUT)
+    chosen: Optional[Tuple[int, Dict[str, Any], Locator]] = None
+    while candidates:
+        # count() は待機しないため、全候補を1往復分の時間で並行に検査できる (nth_child は nth() 済みなので 0/1)
+        counts = await asyncio.gather(*[loc.count() for _, _, loc in candidates], return_exceptions=True)
+        report["candidates"] = [
+            {"index": idx, "type": hint.get("type"), "confidence": hint.get("confidence"),
+             "count": cnt if isinstance(cnt, int) else f"Error: {type(cnt).__name__}"}
+            for (idx, hint, _), cnt in zip(candidates, counts)
+        ]
+        unique = [cand for cand, cnt in zip(candidates, counts) if cnt == 1]
+        if unique:
+            # 確信度 → ヒントの並び順 (LLMは確信度の高い順に出力) で最良候補を選ぶ
+            chosen = min(unique, key=lambda c: (CONFIDENCE_RANK.get(str(c[1].get("confidence")).lower(), len(CONFIDENCE_RANK)), c[0]))
+            break
+        elapsed_ms = (time.monotonic() - start_time) * 1000
+        if elapsed_ms + config.TARGET_HINTS_POLL_INTERVAL >= hints_budget_ms:
+            break
+        await asyncio.sleep(config.TARGET_HINTS_POLL_INTERVAL / 1000)
+
+    if chosen:
+        idx, hint, locator = chosen
+        remaining_ms = max(100, int(timeout - (time.monotonic() - start_time) * 1000))
+        # フォールバックがある場合はその探索時間を残しておく
+        state_wait_ms = max(100, remaining_ms // 2) if fallback_selector else remaining_ms
+        try:
+            await locator.wait_for(state=target_state, timeout=state_wait_ms)
+            report.update(winner=hint.get("type"), hint_index=idx, confidence=hint.get("confidence"))
+            report["elapsed_ms"] = round((time.monotonic() - start_time) * 1000)
+            logger.info(f"target_hints 解決成功: ヒント {idx} (type={hint.get('type')}, confidence={hint.get('confidence')}) ({report['elapsed_ms']}ms)")
+            return locator, scope, report
+        except PlaywrightTimeoutError:
+            logger.warning(f"ヒント {idx} (type={hint.get('type')}) の要素が状態 '{target_state}' になりませんでした。フォールバックします。")
+
+    # --- フォールバック: 従来のセレクターで動的探索 ---
+    if fallback_selector:
+        remaining_ms = int(timeout - (time.monotonic() - start_time) * 1000)
+        if remaining_ms > 100:
+            logger.info(f"一意にマッチするヒントがないため fallback_selector '{fallback_selector}' で動的探索します (残り {remaining_ms}ms)...")
+            element, found_scope = await find_element_dynamically(
+                scope, fallback_selector, max_depth=config.DYNAMIC_SEARCH_MAX_DEPTH, timeout=remaining_ms, target_state=target_state,
+                search_context=search_context, search_mode=search_mode
+            )
+            if element:
+                report["winner"] = "fallback_selector"
+                report["elapsed_ms"] = round((time.monotonic() - start_time) * 1000)
+                return element, found_scope, report
+    report["elapsed_ms"] = round((time.monotonic() - start_time) * 1000)
+    logger.warning(f"target_hints 解決失敗: 有効な候補もフォールバックも見つかりませんでした。({report['elapsed_ms']}ms)")
+    return None, None, report
@@ -21,6 +21,8 @@ from playwright_stealth import stealth_async
 from typing import List, Tuple, Dict, Any, Optional # Optional を追加
 
 import config
+import utils
+import result_stream
 from playwright_actions import execute_actions_async # アクション実行関数をインポート
 
 logger = logging.getLogger(__name__)
@@ -40,7 +42,8 @@ async def _launch_browser_and_context(
     headless_mode: bool,
     slow_motion: int,
     default_timeout: int,
-    apply_stealth: bool = True # ステルスモードを適用するかどうかのフラグ
+    apply_stealth: bool = True, # ステルスモードを適用するかどうかのフラグ
+    storage_state: Optional[Dict[str, Any]] = None # チェックポイント再開時に復元するストレージ状態
 ) -> Tuple[Browser, BrowserContext]:
     """ブラウザとコンテキストを起動し、オプションでステルスモードを適用する"""
     logger.info(f"ブラウザ起動 (Chromium, Headless: {headless_mode}, SlowMo: {slow_motion}ms)...")
@@ -55,8 +58,11 @@ async def _launch_browser_and_context(
         locale='ja-JP',
         timezone_id='Asia/Tokyo',
         java_script_enabled=True,
-        extra_http_headers={'Accept-Language': 'ja-JP,ja;q=0.9,en-US;q=0.8,en;q=0.7'}
+        extra_http_headers={'Accept-Language': 'ja-JP,ja;q=0.9,en-US;q=0.8,en;q=0.7'},
+        storage_state=storage_state
     )
+    if storage_state:
+        logger.info("チェックポイントのストレージ状態 (Cookie等) をコンテキストに復元しました。")
     context.set_default_timeout(default_timeout)
     logger.info(f"コンテキストのデフォルトタイムアウトを {default_timeout}ms に設定しました。")
 
@@ -79,11 +85,19 @@ async def run_playwright_automation_async(
         actions: List[Dict[str, Any]],
         headless_mode: bool = False,
         slow_motion: int = 100,
-        default_timeout: int = config.DEFAULT_ACTION_TIMEOUT
+        default_timeout: int = config.DEFAULT_ACTION_TIMEOUT,
+        checkpoint_path: Optional[str] = None,
+        resume_from: Optional[str] = None,
+        result_stream_path: Optional[str] = None,
+        spill_artifacts: Optional[bool] = None
     ) -> Tuple[bool, List[Dict[str, Any]]]:
     """
     Playwright を非同期で初期化し、指定されたURLにアクセス後、一連のアクションを実行します。
     ステルスモードでエラーが発生した場合、ステルスモードなしでリトライします。
+    checkpoint_path を指定すると各ステップ成功後にチェックポイントを保存し、
+    resume_from を指定するとそのチェックポイントのステップ・URL・ストレージ状態・iframe スコープ (paginate の途中ならそのページ) から再開します。
+    result_stream_path を指定すると、各ステップの結果を完了ごとにそのファイルへ JSONL で追記します (再開時は追記、それ以外は上書き)。
+    spill_artifacts で大きな結果のアーティファクトへの退避を実行ごとに切り替えられます (None の場合は config.ARTIFACT_SPILL_ENABLED)。
     """
     logger.info("--- Playwright 自動化開始 (非同期) ---")
     all_success = False
@@ -94,8 +108,39 @@ async def run_playwright_automation_async(
     page: Optional[Page] = None
     initial_navigation_successful = False
     retry_attempted = False # リトライフラグ
+    start_index = 0
+    resumed_results: List[Dict[str, Any]] = []
+    resume_storage_state: Optional[Dict[str, Any]] = None
+    resume_frame_chains: Optional[List[Optional[List[str]]]] = None
+    resume_results_bytes: Optional[int] = None # 同じチェックポイントへ保存を続ける場合の書き込み済みバイト数
+    resume_paginate_state: Optional[Dict[str, Any]] = None # paginate の途中で保存されたチェックポイントの再開位置
+    result_writer: Optional[result_stream.JsonlResultWriter] = None
 
     try:
+        if result_stream_path:
+            result_writer = result_stream.JsonlResultWriter(result_stream_path, append=bool(resume_from))
+        # --- チェックポイントからの再開準備 ---
+        if resume_from:
+            checkpoint_data = utils.load_checkpoint(resume_from)
+            if checkpoint_data["actions_digest"] != utils.compute_actions_digest(actions):
+                raise ValueError(f"チェックポイント '{resume_from}' は現在のアクションリストと一致しません。同じプランでのみ再開できます。")
+            start_index = checkpoint_data["next_step_index"]
+            resumed_results = checkpoint_data["results"]
+            resume_storage_state = checkpoint_data.get("storage_state")
+            resume_frame_chains = checkpoint_data.get("frame_chains")
+            resume_paginate_state = checkpoint_data.get("paginate_state")
+            target_url = checkpoint_data["current_url"]
+            if not checkpoint_path:
+                checkpoint_path = resume_from # 再開後も同じファイルにチェックポイントを更新する
+            if checkpoint_path == resume_from and checkpoint_data["version"] >= 2:
+                resume_results_bytes = checkpoint_data["results_bytes"]
+            if checkpoint_data.get("completed") or start_index >= len(actions):
+                logger.info("チェックポイントのプランは既に完了しています。保存済みの結果を返します。")
+                return True, resumed_results
+            logger.info(f"チェックポイントから再開: ステップ {start_index + 1}/{len(actions)}, URL: {target_url}")
+        if checkpoint_path:
+            logger.info(f"チェックポイントを有効化しました: '{checkpoint_path}'")
+
         playwright = await async_playwright().start()
         effective_default_timeout = default_timeout if default_timeout else config.DEFAULT_ACTION_TIMEOUT
 
@@ -103,7 +148,8 @@ async def run_playwright_automation_async(
         logger.info("--- Initial attempt (with Stealth Mode) ---")
         apply_stealth_mode = True # 最初はステルスモードを適用
         browser, context = await _launch_browser_and_context(
-            playwright, headless_mode, slow_motion, effective_default_timeout, apply_stealth=apply_stealth_mode
+            playwright, headless_mode, slow_motion, effective_default_timeout, apply_stealth=apply_stealth_mode,
+            storage_state=resume_storage_state
         )
 
         logger.info("新しいページを作成します...")
@@ -142,7 +188,8 @@ async def run_playwright_automation_async(
                      logger.info("--- Retry attempt (without Stealth Mode) ---")
                      apply_stealth_mode = False # ステルスモードを無効化
                      browser, context = await _launch_browser_and_context(
-                         playwright, headless_mode, slow_motion, effective_default_timeout, apply_stealth=apply_stealth_mode
+                         playwright, headless_mode, slow_motion, effective_default_timeout, apply_stealth=apply_stealth_mode,
+                         storage_state=resume_storage_state
                      )
                      logger.info("新しいページを作成します (リトライ)...")
                      page = await context.new_page()
@@ -169,12 +216,24 @@ async def run_playwright_automation_async(
         if initial_navigation_successful and page:
             logger.info("アクションの実行を開始します...")
             all_success, final_results = await execute_actions_async(
-                page, actions, api_request_context, effective_default_timeout
+                page, actions, api_request_context, effective_default_timeout,
+                checkpoint_path=checkpoint_path, start_index=start_index, initial_results=resumed_results,
+                initial_frame_chains=resume_frame_chains, checkpoint_results_bytes=resume_results_bytes,
+                on_step_result=result_writer.write if result_writer else None,
+                spill_artifacts=spill_artifacts, initial_paginate_state=resume_paginate_state
             )
+            timing_summary = utils.summarize_step_timings(final_results)
+            logger.info(f"実行タイミングサマリ: {timing_summary['totals']}")
+            final_results.append({"step": "Run Summary", "status": "summary", "action": "run_summary", "timing_summary": timing_summary})
+            if result_writer: result_writer.write(final_results[-1])
             if all_success:
                 logger.info("すべてのステップが正常に完了しました。")
             else:
                 logger.error("自動化タスクの途中でエラーが発生しました。")
+                if checkpoint_path and len(final_results) > 1:
+                    # 失敗時は再開に使うチェックポイントファイルを (サマリ直前の) エラー結果に明示する
+                    final_results[-2]["resume_from"] = checkpoint_path
+                    logger.info(f"最後に成功したステップから再開するには resume_from='{checkpoint_path}' を指定してください。")
         elif not initial_navigation_successful and retry_attempted:
              # リトライ後のナビゲーションも失敗した場合
              raise PlaywrightError(f"Navigation failed even after retrying without stealth mode for URL: {target_url}")
@@ -209,12 +268,17 @@ async def run_playwright_automation_async(
              }
              if overall_error_screenshot_path:
                  error_details["error_screenshot"] = overall_error_screenshot_path
+             if checkpoint_path and os.path.exists(checkpoint_path):
+                 error_details["resume_from"] = checkpoint_path
              final_results.append(error_details)
+             if result_writer: result_writer.write(error_details)
          all_success = False
 
     # --- クリーンアップ処理 ---
     finally:
         logger.info("クリーンアップ処理を開始します...")
+        if result_writer:
+            result_writer.close()
         if context:
             try:
                 await context.close()
@@ -0,0 +1,124 @@
+# --- ファイル: refresh_cache.py ---
+"""
+定期実行する同じプランの差分取得 (incremental モード) のためのキャッシュ。
+URLごとに検証子 (ETag / Last-Modified) と内容のハッシュ、前回抽出したテキストの保存先を記録し、
+次回は条件付きリクエストを送って、304 または内容が同じ場合は前回のテキストを再利用します。
+抽出テキストは artifact_store に保存し、このキャッシュにはそのハッシュだけを持ちます。
+"""
+import json
+import logging
+import os
+import time
+from typing import Dict, Any, Optional
+
+import config
+import artifact_store
+
+logger = logging.getLogger(__name__)
+
+# 各項目の状態
+REFRESH_NEW = "new"             # 前回の記録がない
+REFRESH_CHANGED = "changed"     # 前回から内容が変わった
+REFRESH_UNCHANGED = "unchanged" # 304 または内容のハッシュが同じ (前回のテキストを再利用)
+
+_cache: Optional[Dict[str, Dict[str, Any]]] = None # 遅延ロードされるキャッシュ本体
+
+def _make_key(url: str, variant: Optional[str]) -> str:
+    # 同じURLでも抽出方法 (pdf_options など) が違えば結果が異なるため別エントリにする
+    return f"{url}|{variant}" if variant else url
+
+def _load() -> Dict[str, Dict[str, Any]]:
+    global _cache
+    if _cache is None:
+        _cache = {}
+        if os.path.exists(config.REFRESH_CACHE_FILE):
+            try:
+                with open(config.REFRESH_CACHE_FILE, "r", encoding="utf-8") as f:
+                    loaded = json.load(f)
+                if isinstance(loaded, dict):
+                    _cache = loaded
+                logger.debug(f"差分取得キャッシュを読み込みました: {len(_cache)} 件 ({config.REFRESH_CACHE_FILE})")
+            except Exception as e:
+                logger.warning(f"差分取得キャッシュの読み込みに失敗しました (空のキャッシュで続行): {e}")
+    return _cache
+
+def _save() -> None:
+    if _cache is None:
+        return
+    try:
+        cache_dir = os.path.dirname(config.REFRESH_CACHE_FILE)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{config.REFRESH_CACHE_FILE}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(_cache, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, config.REFRESH_CACHE_FILE)
+    except Exception as e:
+        logger.warning(f"差分取得キャッシュの保存に失敗しました (無視): {e}")
+
+def get_entry(url: str, variant: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """URLの前回の記録を返す。前回のテキストが読めない場合は記録なしとみなす。"""
+    entry = _load().get(_make_key(url, variant))
+    if not entry or not entry.get("text_sha256"):
+        return None
+    return entry
+
+def conditional_headers(entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """前回の記録から条件付きリクエストのヘッダーを作る。"""
+    headers: Dict[str, str] = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+def load_previous_text(entry: Dict[str, Any]) -> Optional[str]:
+    """前回抽出したテキストを読み込む。読めない場合は None。"""
+    try:
+        return artifact_store.load_artifact(entry["text_sha256"])
+    except (OSError, ValueError) as e:
+        logger.warning(f"前回のテキストを読み込めませんでした ({entry.get('text_sha256')}): {e}")
+        return None
+
+def record(
+    url: str, variant: Optional[str], text: str, content_sha256: Optional[str],
+    etag: Optional[str] = None, last_modified: Optional[str] = None
+) -> str:
+    """
+    取得結果を記録し、前回と比べた状態 (new / changed / unchanged) を返す。
+    content_sha256 はダウンロードした本体のハッシュ (ない場合はテキストのハッシュで比較する)。
+    エラーメッセージのテキストは記録しない。
+    """
+    key = _make_key(url, variant)
+    cache = _load()
+    previous = cache.get(key)
+    if text.startswith("Error:"):
+        return REFRESH_CHANGED if previous else REFRESH_NEW
+    try:
+        text_sha256 = artifact_store.store_text(text)
+    except OSError as e:
+        logger.warning(f"差分取得用のテキストを保存できませんでした ({url}): {e}")
+        return REFRESH_CHANGED if previous else REFRESH_NEW
+    content_sha256 = content_sha256 or text_sha256
+    if previous is None:
+        state = REFRESH_NEW
+    elif previous.get("content_sha256") == content_sha256:
+        state = REFRESH_UNCHANGED
+    else:
+        state = REFRESH_CHANGED
+    cache[key] = {
+        "etag": etag,
+        "last_modified": last_modified,
+        "content_sha256": content_sha256,
+        "text_sha256": text_sha256,
+        "updated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    _save()
+    return state
+
+def mark_not_modified(url: str, variant: Optional[str]) -> None:
+    """304 (変更なし) を受け取ったことを記録する。"""
+    entry = _load().get(_make_key(url, variant))
+    if entry:
+        entry["checked_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        _save()
@@ -0,0 +1,122 @@
+# --- ファイル: result_stream.py ---
+"""
+実行結果を1ステップ1行の JSON (JSONL) としてステップ完了ごとに追記するストリーミング出力。
+fsync は一定件数・一定時間ごとにまとめて行い、拡張子が .zst の場合は zstd で圧縮します (zstandard パッケージが必要)。
+従来のテキストレポート (utils.write_results_to_file の形式) は、このファイルから必要なときに生成します。
+
+使い方 (テキストレポートの生成):
+    python result_stream.py output_results.jsonl output_results.txt
+"""
+import io
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, Any, Iterator, List, Optional
+
+import config
+
+try:
+    import zstandard # 任意: .zst 出力を使う場合のみ必要
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ZSTD_SUFFIX = ".zst"
+
+class JsonlResultWriter:
+    """
+    ステップ結果を JSONL で追記するライター。
+    write() はバッファに書き込み、RESULT_STREAM_FSYNC_EVERY 件ごと、または
+    RESULT_STREAM_FSYNC_INTERVAL 秒ごとにディスクへ同期する。close() で残りを同期する。
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        compress = path.endswith(ZSTD_SUFFIX)
+        if compress and zstandard is None:
+            path = path[:-len(ZSTD_SUFFIX)]
+            logger.warning(f"zstandard がインストールされていないため、圧縮せずに '{path}' へ出力します。")
+            compress = False
+        output_dir = os.path.dirname(path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self.path = path
+        self.compress = compress
+        self.records_written = 0
+        self._raw = open(path, "ab" if append else "wb")
+        # 圧縮時は同期のたびに zstd フレームを閉じる (連結されたフレームとしてそのまま読める)
+        self._stream = zstandard.ZstdCompressor(level=config.RESULT_STREAM_ZSTD_LEVEL).stream_writer(self._raw, closefd=False) if compress else self._raw
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        logger.info(f"ステップ結果を '{path}' にストリーミング出力します (圧縮: {'zstd' if compress else 'なし'})。")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """1件の結果を1行の JSON として追記する。JSON にできない値は文字列に変換する。"""
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        self._stream.write(line.encode("utf-8"))
+        self.records_written += 1
+        self._pending += 1
+        if self._pending >= config.RESULT_STREAM_FSYNC_EVERY or time.monotonic() - self._last_sync >= config.RESULT_STREAM_FSYNC_INTERVAL:
+            self.sync()
+
+    def sync(self) -> None:
+        """バッファの内容をディスクへ同期する。"""
+        if self.compress:
+            self._stream.flush(zstandard.FLUSH_FRAME)
+        self._raw.flush()
+        try:
+            os.fsync(self._raw.fileno())
+        except OSError as e:
+            logger.debug(f"fsync に失敗しました (無視): {e}")
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        if self._raw.closed:
+            return
+        self.sync()
+        if self.compress:
+            self._stream.close()
+        self._raw.close()
+        logger.info(f"ステップ結果のストリーミング出力を終了しました: '{self.path}' ({self.records_written} 件)")
+
+    def __enter__(self) -> "JsonlResultWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+def iter_results_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """JSONL (.zst も可) の結果を1件ずつ返す。異常終了で途中までしか書かれていない最終行は読み飛ばす。"""
+    if path.endswith(ZSTD_SUFFIX):
+        if zstandard is None:
+            raise RuntimeError(f"'{path}' を読むには zstandard パッケージが必要です。")
+        raw = open(path, "rb")
+        text_stream = io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True), encoding="utf-8")
+    else:
+        text_stream = open(path, "r", encoding="utf-8")
+    with text_stream:
+        for line_num, line in enumerate(text_stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"'{path}' の {line_num} 行目を JSON として読めないため読み飛ばします: {e}")
+
+def load_results_jsonl(path: str) -> List[Dict[str, Any]]:
+    return list(iter_results_jsonl(path))
+
+def render_text_report(jsonl_path: str, output_path: str, final_summary_data: Optional[Dict[str, Any]] = None) -> None:
+    """JSONL の結果から従来形式のテキストレポートを生成する。"""
+    import utils # utils は Playwright などを読み込むため、レポート生成時だけ読み込む
+    utils.write_results_to_file(load_results_jsonl(jsonl_path), output_path, final_summary_data=final_summary_data)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(sys.argv) != 3:
+        print("使い方: python result_stream.py <結果JSONL> <出力テキストファイル>")
+        sys.exit(1)
+    render_text_report(sys.argv[1], sys.argv[2])
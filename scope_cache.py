@@ -0,0 +1,153 @@
+# --- ファイル: scope_cache.py ---
+"""
+動的探索で要素が見つかったスコープ (iframeの経路) を学習・永続化するキャッシュ。
+キーは (ドメイン, パスパターン, セレクター) で、値は起点ページからの iframe 経路
+(各深さでの 'iframe:visible' の nth インデックスのリスト) です。
+Frameツリー方式 (DYNAMIC_SEARCH_BACKEND='frame_tree') の経路は child_frames のインデックスのリストで、別のキーで保持します。
+shadow DOM 内の要素については、ドメイン単位で shadow host の経路 (CSSセレクターのリスト) も保持します。
+"""
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, Any, Optional, Tuple, List
+from urllib.parse import urlparse
+
+import config
+
+logger = logging.getLogger(__name__)
+
+FramePath = Tuple[int, ...]
+
+_cache: Optional[Dict[str, Dict[str, Any]]] = None # 遅延ロードされるキャッシュ本体
+
+# 数字を含むパスセグメントは記事IDやページ番号とみなしてワイルドカード化する
+_VARIABLE_SEGMENT_REGEX = re.compile(r"\d")
+
+def url_path_pattern(url: str) -> Optional[Tuple[str, str]]:
+    """URLから (ドメイン, パスパターン) を作る。http/https 以外は None を返す。"""
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        return None
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        return None
+    segments = [("*" if _VARIABLE_SEGMENT_REGEX.search(seg) else seg) for seg in parsed.path.split("/") if seg]
+    return parsed.netloc.lower(), "/" + "/".join(segments)
+
+def _make_key(url: str, selector: str, backend: str = "frame_locator") -> Optional[str]:
+    domain_and_pattern = url_path_pattern(url)
+    if not domain_and_pattern:
+        return None
+    domain, pattern = domain_and_pattern
+    # Frameツリー方式の経路は child_frames のインデックスで 'iframe:visible' の nth とは意味が異なるため、別のキーで保持する
+    prefix = "" if backend == "frame_locator" else f"{backend}|"
+    return f"{prefix}{domain}|{pattern}|{selector}"
+
+def _load() -> Dict[str, Dict[str, Any]]:
+    global _cache
+    if _cache is None:
+        _cache = {}
+        if os.path.exists(config.SCOPE_CACHE_FILE):
+            try:
+                with open(config.SCOPE_CACHE_FILE, "r", encoding="utf-8") as f:
+                    loaded = json.load(f)
+                if isinstance(loaded, dict):
+                    _cache = loaded
+                logger.debug(f"スコープキャッシュを読み込みました: {len(_cache)} 件 ({config.SCOPE_CACHE_FILE})")
+            except Exception as e:
+                logger.warning(f"スコープキャッシュの読み込みに失敗しました (空のキャッシュで続行): {e}")
+    return _cache
+
+def _save() -> None:
+    if _cache is None:
+        return
+    try:
+        cache_dir = os.path.dirname(config.SCOPE_CACHE_FILE)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{config.SCOPE_CACHE_FILE}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(_cache, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, config.SCOPE_CACHE_FILE)
+    except Exception as e:
+        logger.warning(f"スコープキャッシュの保存に失敗しました (無視): {e}")
+
+def get_cached_frame_path(url: str, selector: str, backend: str = "frame_locator") -> Optional[FramePath]:
+    """前回そのセレクターが見つかった iframe 経路を返す。未学習なら None。backend は経路の種類 ('frame_locator' / 'frame_tree')。"""
+    if not config.SCOPE_CACHE_ENABLED:
+        return None
+    key = _make_key(url, selector, backend)
+    if not key:
+        return None
+    entry = _load().get(key)
+    if not entry or not isinstance(entry.get("frame_path"), list):
+        return None
+    return tuple(int(i) for i in entry["frame_path"])
+
+def remember_frame_path(url: str, selector: str, frame_path: FramePath, backend: str = "frame_locator") -> None:
+    """要素が見つかった iframe 経路を記録する。内容が変わらない場合は書き込みを省略する。"""
+    if not config.SCOPE_CACHE_ENABLED:
+        return
+    key = _make_key(url, selector, backend)
+    if not key:
+        return
+    cache = _load()
+    entry = cache.get(key)
+    if entry and tuple(entry.get("frame_path", [])) == tuple(frame_path):
+        entry["hits"] = entry.get("hits", 0) + 1
+        if entry["hits"] % 10: # ヒット数の更新だけなら10回に1回の書き込みで十分
+            return
+    else:
+        cache[key] = {"frame_path": list(frame_path), "hits": 1}
+    cache[key]["updated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    _save()
+
+def forget_frame_path(url: str, selector: str, backend: str = "frame_locator") -> None:
+    """キャッシュ済みの経路で要素が見つからなかった場合にエントリを削除する。"""
+    if not config.SCOPE_CACHE_ENABLED:
+        return
+    key = _make_key(url, selector, backend)
+    if key and key in _load():
+        del _cache[key]
+        _save()
+
+def _make_shadow_key(url: str, selector: str) -> Optional[str]:
+    domain_and_pattern = url_path_pattern(url)
+    if not domain_and_pattern:
+        return None
+    return f"shadow|{domain_and_pattern[0]}|{selector}" # コンポーネント構成はサイト内で共通なことが多いためドメイン単位
+
+def get_cached_shadow_path(url: str, selector: str) -> Optional[List[str]]:
+    """前回そのセレクターが見つかった shadow host の経路を返す。未学習なら None。"""
+    if not config.SCOPE_CACHE_ENABLED:
+        return None
+    key = _make_shadow_key(url, selector)
+    entry = _load().get(key) if key else None
+    if not entry or not isinstance(entry.get("shadow_path"), list):
+        return None
+    return [str(host) for host in entry["shadow_path"]]
+
+def remember_shadow_path(url: str, selector: str, shadow_path: List[str]) -> None:
+    """要素が見つかった shadow host の経路を記録する。内容が変わらない場合は書き込みを省略する。"""
+    if not config.SCOPE_CACHE_ENABLED:
+        return
+    key = _make_shadow_key(url, selector)
+    if not key:
+        return
+    cache = _load()
+    entry = cache.get(key)
+    if entry and entry.get("shadow_path") == list(shadow_path):
+        return
+    cache[key] = {"shadow_path": list(shadow_path), "updated_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+    _save()
+
+def forget_shadow_path(url: str, selector: str) -> None:
+    """キャッシュ済みの shadow host 経路で要素が見つからなかった場合にエントリを削除する。"""
+    if not config.SCOPE_CACHE_ENABLED:
+        return
+    key = _make_shadow_key(url, selector)
+    if key and key in _load():
+        del _cache[key]
+        _save()
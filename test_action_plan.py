@@ -0,0 +1,97 @@
+# --- ファイル: test_action_plan.py ---
+"""
+action_plan のコンパイル (冪等性の判定・リトライ設定の正規化)、エラー分類、バックオフ計算、静的検査 (lint_actions) のテスト。
+
+使い方:
+    python -m pytest -q test_action_plan.py
+"""
+import pytest
+
+pytest.importorskip("playwright")
+
+import config
+import action_plan
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError, Error as PlaywrightError
+
+
+def test_compile_actions_normalizes_retry_for_idempotent_step():
+    actions = [{"action": "get_inner_text", "selector": "#main", "retry": 4}]
+    compiled = action_plan.compile_actions(actions)
+    assert compiled[0]["_idempotent"] is True
+    assert compiled[0]["_retry_policy"]["attempts"] == 4
+    assert compiled[0]["_retry_policy"]["backoff_ms"] == config.RETRY_DEFAULT_BACKOFF_MS
+    assert compiled[0]["_retry_policy"]["on"] == list(action_plan.DEFAULT_RETRY_ON)
+    assert "_idempotent" not in actions[0] # 元のリストは変更しない
+
+
+def test_compile_actions_refuses_retry_for_non_idempotent_step():
+    compiled = action_plan.compile_actions([{"action": "click", "selector": "#next", "retry": True}])
+    assert compiled[0]["_idempotent"] is False
+    assert compiled[0]["_retry_policy"] is None
+    assert "not idempotent" in compiled[0]["_retry_refused"]
+
+
+def test_compile_actions_single_attempt_means_no_retry():
+    compiled = action_plan.compile_actions([{"action": "hover", "selector": "a", "retry": 1}])
+    assert compiled[0]["_retry_policy"] is None
+    assert "_retry_refused" not in compiled[0]
+
+
+def test_compile_actions_recurses_into_paginate_steps():
+    compiled = action_plan.compile_actions([
+        {"action": "paginate", "next_selector": "a.next", "steps": [{"action": "get_inner_text", "selector": "h1", "retry": {"attempts": 2}}]}
+    ])
+    body_step = compiled[0]["steps"][0]
+    assert body_step["_retry_policy"]["attempts"] == 2
+
+
+@pytest.mark.parametrize("retry_spec", [
+    "3",
+    {"attempts": 0},
+    {"backoff_factor": 0.5},
+    {"attempts": "many"},
+    {"on": ["timeout", "network"]},
+])
+def test_compile_actions_rejects_invalid_retry(retry_spec):
+    with pytest.raises(ValueError):
+        action_plan.compile_actions([{"action": "get_inner_text", "selector": "h1", "retry": retry_spec}])
+
+
+def test_classify_error():
+    assert action_plan.classify_error(PlaywrightTimeoutError("timeout")) == "timeout"
+    assert action_plan.classify_error(PlaywrightError("closed")) == "playwright"
+    assert action_plan.classify_error(ValueError("bad")) == "value"
+    assert action_plan.classify_error(RuntimeError("boom")) == "other"
+
+
+def test_retry_delay_ms_grows_exponentially_up_to_cap():
+    policy = {"backoff_ms": 300, "backoff_factor": 2.0, "max_backoff_ms": 1000}
+    assert [action_plan.retry_delay_ms(policy, attempt) for attempt in (1, 2, 3, 4)] == [300, 600, 1000, 1000]
+
+
+def test_lint_actions_suggests_settle_mode_on_click_before_sleep():
+    findings = action_plan.lint_actions([
+        {"action": "click", "selector": "#search"},
+        {"action": "sleep", "value": 2},
+    ])
+    assert len(findings) == 1
+    assert findings[0]["step"] == "2"
+    assert findings[0]["rule"] == "fixed-sleep"
+    assert findings[0]["suggestion"] == {"action": "click", "settle_mode": "network_idle"}
+
+
+def test_lint_actions_suggests_wait_for_settle_and_checks_nested_steps():
+    findings = action_plan.lint_actions([
+        {"action": "sleep", "value": 1},
+        {"action": "paginate", "next_selector": "a.next", "steps": [
+            {"action": "input", "selector": "#q", "value": "x"},
+            {"action": "sleep", "value": 1},
+        ]},
+    ])
+    assert [finding["step"] for finding in findings] == ["1", "2.2"]
+    assert findings[0]["suggestion"] == {"action": "wait_for_settle", "settle_mode": "dom_quiet"}
+    assert findings[1]["suggestion"] == {"action": "wait_for_settle", "settle_mode": "dom_quiet"}
+
+
+def test_lint_actions_without_sleep_has_no_findings():
+    assert action_plan.lint_actions([{"action": "click", "selector": "a"}, {"action": "wait_visible", "selector": "h1"}]) == []
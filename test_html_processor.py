@@ -0,0 +1,63 @@
+# --- ファイル: test_html_processor.py ---
+"""
+html_processor.cleanup_html の 'lxml' エンジンが従来の 'bs4' エンジンと同じ出力になることのテスト。
+
+使い方:
+    python -m pytest -q test_html_processor.py
+"""
+import os
+
+import pytest
+
+pytest.importorskip("bs4")
+pytest.importorskip("lxml")
+
+import html_processor
+
+SAMPLE_DOCUMENTS = {
+    "full_document": """<!DOCTYPE html>
+<html><head><title>t</title><meta charset="utf-8"><style>p{}</style><script>var a=1;</script></head>
+<body onload="init()">
+<header>head</header>
+<nav class="menu"><a href="/">home</a></nav>
+<!-- comment -->
+<div id="main" jsaction="x" data-ved="y" style="color:red">
+  <p>本文 <b>太字</b> tail text</p>
+  <a href="/x" style="color:blue" onclick="go()">link</a>
+  <div class="sidebar">side</div>
+  <div role="banner">banner</div>
+  <iframe src="/ad"></iframe>テキストの続き
+  <input type="text" style="width:10px" aria-hidden="true">
+</div>
+<footer>foot</footer>
+</body></html>""",
+    "fragment": '<div class="result"><h3>Title</h3><span jsname="a">snippet</span><svg><path d="M0"/></svg>after</div>',
+    "nested_removals": "<div><aside><p>x</p></aside>keep<noscript>n</noscript><section class='advertisement'>ad</section>end</div>",
+}
+
+
+@pytest.mark.parametrize("name", sorted(SAMPLE_DOCUMENTS))
+def test_lxml_engine_matches_bs4(name):
+    html_content = SAMPLE_DOCUMENTS[name]
+    assert html_processor.cleanup_html(html_content, engine="lxml") == html_processor.cleanup_html(html_content, engine="bs4")
+
+
+def test_lxml_engine_matches_bs4_on_saved_page():
+    saved_page = os.path.join(os.path.dirname(os.path.abspath(__file__)), "t_simplified_html_output.html")
+    if not os.path.exists(saved_page):
+        pytest.skip("保存済みのHTMLがありません")
+    with open(saved_page, "r", encoding="utf-8") as f:
+        html_content = f.read()
+    assert html_processor.cleanup_html(html_content, engine="lxml") == html_processor.cleanup_html(html_content, engine="bs4")
+
+
+def test_cleanup_removes_configured_content():
+    cleaned = html_processor.cleanup_html(SAMPLE_DOCUMENTS["full_document"], engine="lxml")
+    for removed in ("<script", "<style", "<header", "<nav", "comment", "jsaction", "data-ved", "onclick", "sidebar", "banner", "<iframe"):
+        assert removed not in cleaned
+    assert "本文" in cleaned and "テキストの続き" in cleaned
+    assert 'style="color:blue"' in cleaned # a タグの style は残す
+
+
+def test_empty_input():
+    assert html_processor.cleanup_html("", engine="lxml") == ""
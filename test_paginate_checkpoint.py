@@ -0,0 +1,108 @@
+# --- ファイル: test_paginate_checkpoint.py ---
+"""
+paginate のページごとのチェックポイントと、中断したページからの再開のテスト。
+ブラウザは使わず、クリックで URL が切り替わる仮のページで execute_actions_async を実行します。
+
+使い方:
+    python -m pytest -q test_paginate_checkpoint.py
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("playwright")
+pytest.importorskip("httpx")
+
+import config
+import utils
+from playwright_actions import execute_actions_async
+
+ACTIONS = [{
+    "action": "paginate", "next_selector": "a.next", "max_pages": 5, "page_change_wait": "url_change",
+    "stop_when_no_new_items": False, "steps": [{"action": "sleep", "value": 0}],
+}]
+
+
+class FakeContext:
+    async def storage_state(self):
+        return {"cookies": []}
+
+
+class FakeNextLink:
+    def __init__(self, page):
+        self.page = page
+
+    @property
+    def first(self):
+        return self
+
+    async def wait_for(self, state="attached", timeout=0):
+        return None
+
+    async def click(self, timeout=0):
+        if self.page.page_num == self.page.fail_on_page:
+            raise RuntimeError(f"click failed on page {self.page.page_num}")
+        self.page.page_num += 1
+
+
+class FakePage:
+    """クリックで URL が https://example.com/results/<ページ番号> に切り替わるページ。"""
+
+    def __init__(self, page_num=1, fail_on_page=None):
+        self.page_num = page_num
+        self.fail_on_page = fail_on_page
+        self.context = FakeContext()
+
+    @property
+    def url(self):
+        return f"https://example.com/results/{self.page_num}"
+
+    def is_closed(self):
+        return False
+
+    async def title(self):
+        return f"results {self.page_num}"
+
+    def locator(self, selector):
+        return FakeNextLink(self)
+
+    async def wait_for_url(self, predicate, wait_until="load", timeout=0):
+        assert predicate(self.url)
+
+    async def screenshot(self, **kwargs):
+        return None
+
+
+def _body_pages(results):
+    return [result["page"] for result in results if result.get("action") == "sleep"]
+
+
+def test_paginate_resumes_from_last_checkpointed_page(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "DEFAULT_SCREENSHOT_DIR", str(tmp_path / "screenshots"))
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+
+    # 3ページ目から4ページ目への切替で失敗する
+    success, results = asyncio.run(execute_actions_async(FakePage(fail_on_page=3), ACTIONS, None, 1000, checkpoint_path=checkpoint_path))
+    assert success is False
+    assert _body_pages(results) == [1, 2, 3]
+
+    checkpoint = utils.load_checkpoint(checkpoint_path)
+    assert checkpoint["next_step_index"] == 0
+    assert checkpoint["current_url"] == "https://example.com/results/3"
+    assert checkpoint["paginate_state"]["next_page"] == 3
+    assert _body_pages(checkpoint["results"]) == [1, 2]
+
+    # 保存時の URL (3ページ目) から再開すると、1・2ページ目は実行せずに続きから実行する
+    success, resumed_results = asyncio.run(execute_actions_async(
+        FakePage(page_num=3), ACTIONS, None, 1000, checkpoint_path=checkpoint_path,
+        start_index=checkpoint["next_step_index"], initial_results=checkpoint["results"],
+        checkpoint_results_bytes=checkpoint["results_bytes"], initial_paginate_state=checkpoint["paginate_state"],
+    ))
+    assert success is True
+    assert _body_pages(resumed_results) == [1, 2, 3, 4, 5]
+    assert resumed_results[-1]["pages_visited"] == 5
+    final_checkpoint = utils.load_checkpoint(checkpoint_path)
+    assert final_checkpoint["completed"] is True
+    assert final_checkpoint["paginate_state"] is None
+    assert _body_pages(final_checkpoint["results"]) == [1, 2, 3, 4, 5]
@@ -0,0 +1,124 @@
+# --- ファイル: test_playwright_finders.py ---
+"""
+playwright_finders の時間配分と、無効な iframe の記録 (FrameLocator 方式・Frameツリー方式) のテスト。
+ブラウザは使わず、待機した時間だけ進む仮の時計と、Playwright のスコープを模した仮のオブジェクトで探索を実行します。
+
+使い方:
+    python -m pytest -q test_playwright_finders.py
+"""
+import asyncio
+import types
+
+import pytest
+
+pytest.importorskip("playwright")
+
+import config
+import playwright_finders
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+
+class FakeClock:
+    """wait_for のタイムアウトで待った分だけ進む時計。"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class FakeLocator:
+    def __init__(self, clock, found=False, frame_urls=None):
+        self.clock = clock
+        self.found = found
+        self.frame_urls = frame_urls or []
+
+    @property
+    def first(self):
+        return self
+
+    async def wait_for(self, state="attached", timeout=0):
+        if self.found:
+            return
+        self.clock.now += timeout / 1000
+        raise PlaywrightTimeoutError(f"Timeout {timeout}ms exceeded.")
+
+    async def evaluate_all(self, expression):
+        return list(self.frame_urls)
+
+
+class FakeScope:
+    """要素も応答するフレームもないスコープ。子 iframe はルート要素の待機がタイムアウトする。"""
+
+    def __init__(self, clock, frame_urls=()):
+        self.clock = clock
+        self.frame_urls = list(frame_urls)
+
+    def locator(self, selector):
+        if selector == "iframe:visible":
+            return FakeLocator(self.clock, frame_urls=self.frame_urls)
+        return FakeLocator(self.clock)
+
+    def frame_locator(self, selector):
+        return FakeScope(self.clock)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(playwright_finders, "time", types.SimpleNamespace(monotonic=fake_clock.monotonic))
+    monkeypatch.setattr(config, "DYNAMIC_SEARCH_MODE", "bfs")
+    return fake_clock
+
+
+def test_single_lookup_records_dead_frame_at_default_timeout(clock):
+    dead_frame_url = "https://ads.example.com/frame.html"
+    search_context = playwright_finders.new_search_context()
+    element, scope = asyncio.run(playwright_finders.find_element_dynamically(
+        FakeScope(clock, [dead_frame_url]), "#missing", timeout=config.DEFAULT_ACTION_TIMEOUT, search_context=search_context
+    ))
+    assert (element, scope) == (None, None)
+    assert dead_frame_url in search_context["dead_frame_srcs"]
+
+
+def test_child_probe_budget_keeps_full_frame_timeout_when_time_allows():
+    assert playwright_finders._child_probe_budget(8000) >= config.IFRAME_LOCATOR_TIMEOUT + 50
+    assert playwright_finders._child_probe_budget(3000) == 3000 # 残り時間より長くはしない
+    assert playwright_finders._child_probe_budget(20000) == 20000 * config.FINDER_BUDGET_PROBE_SHARE
+
+
+class FakeFrame:
+    """count() が応答しない (hang=True) か、count の件数を返すフレーム。"""
+
+    def __init__(self, url, count=0, hang=False):
+        self.url = url
+        self.count_value = count
+        self.hang = hang
+        self.count_calls = 0
+
+    def locator(self, selector):
+        return self
+
+    async def count(self):
+        self.count_calls += 1
+        if self.hang:
+            await asyncio.sleep(30)
+        return self.count_value
+
+
+def test_frame_tree_groups_record_and_skip_unresponsive_frames(monkeypatch):
+    main_frame = FakeFrame("https://example.com/", count=2)
+    dead_frame = FakeFrame("https://ads.example.com/frame.html", hang=True)
+    page = object() # get_frame_tree を置き換えるため、ページ自体は参照されない
+    monkeypatch.setattr(playwright_finders.frame_tree, "get_frame_tree", lambda _page, _depth: [(main_frame, 0, ()), (dead_frame, 1, (0,))])
+    monkeypatch.setattr(config, "IFRAME_LOCATOR_TIMEOUT", 100)
+    search_context = playwright_finders.new_search_context()
+
+    groups = asyncio.run(playwright_finders._find_element_groups_in_frame_tree(page, "a", 2, 100, search_context))
+    assert groups == [(page, "a", 2)]
+    assert search_context["dead_frame_srcs"] == {dead_frame.url}
+
+    asyncio.run(playwright_finders._find_element_groups_in_frame_tree(page, "a", 2, 100, search_context))
+    assert dead_frame.count_calls == 1 # 2回目は無効と判定済みのため数えない
+    assert main_frame.count_calls == 2
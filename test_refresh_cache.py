@@ -0,0 +1,73 @@
+# --- ファイル: test_refresh_cache.py ---
+"""
+refresh_cache の記録 (new / changed / unchanged の判定)・条件付きリクエストのヘッダー・304 の記録のテスト。
+
+使い方:
+    python -m pytest -q test_refresh_cache.py
+"""
+import json
+
+import pytest
+
+import config
+import refresh_cache
+
+
+@pytest.fixture
+def cache_file(tmp_path, monkeypatch):
+    path = tmp_path / "refresh_cache.json"
+    monkeypatch.setattr(config, "REFRESH_CACHE_FILE", str(path))
+    monkeypatch.setattr(config, "ARTIFACT_DIR", str(tmp_path / "artifacts"))
+    monkeypatch.setattr(refresh_cache, "_cache", None)
+    return path
+
+
+def test_record_reports_new_unchanged_and_changed(cache_file):
+    url = "https://example.com/report.pdf"
+    assert refresh_cache.record(url, None, "v1 text", "sha-a", etag='"abc"') == refresh_cache.REFRESH_NEW
+    assert refresh_cache.record(url, None, "v1 text", "sha-a", etag='"abc"') == refresh_cache.REFRESH_UNCHANGED
+    assert refresh_cache.record(url, None, "v2 text", "sha-b") == refresh_cache.REFRESH_CHANGED
+
+    entry = refresh_cache.get_entry(url)
+    assert entry["content_sha256"] == "sha-b"
+    assert refresh_cache.load_previous_text(entry) == "v2 text"
+
+
+def test_record_compares_text_hash_without_content_hash(cache_file):
+    url = "https://example.com/page"
+    refresh_cache.record(url, None, "same", None)
+    assert refresh_cache.record(url, None, "same", None) == refresh_cache.REFRESH_UNCHANGED
+
+
+def test_variants_are_separate_entries(cache_file):
+    url = "https://example.com/report.pdf"
+    refresh_cache.record(url, "mode=fast", "fast text", "sha-a")
+    assert refresh_cache.get_entry(url) is None
+    assert refresh_cache.record(url, "mode=sorted", "sorted text", "sha-a") == refresh_cache.REFRESH_NEW
+
+
+def test_error_text_is_not_recorded(cache_file):
+    url = "https://example.com/broken.pdf"
+    assert refresh_cache.record(url, None, "Error: download failed", None) == refresh_cache.REFRESH_NEW
+    assert refresh_cache.get_entry(url) is None
+    assert not cache_file.exists()
+
+
+def test_conditional_headers():
+    assert refresh_cache.conditional_headers(None) == {}
+    entry = {"etag": '"abc"', "last_modified": "Wed, 01 May 2024 00:00:00 GMT"}
+    assert refresh_cache.conditional_headers(entry) == {
+        "If-None-Match": '"abc"',
+        "If-Modified-Since": "Wed, 01 May 2024 00:00:00 GMT",
+    }
+
+
+def test_mark_not_modified_keeps_entry_and_persists(cache_file):
+    url = "https://example.com/page"
+    refresh_cache.record(url, None, "text", None, last_modified="Wed, 01 May 2024 00:00:00 GMT")
+    refresh_cache.mark_not_modified(url, None)
+    saved = json.loads(cache_file.read_text(encoding="utf-8"))[url]
+    assert saved["checked_at"]
+    assert saved["last_modified"] == "Wed, 01 May 2024 00:00:00 GMT"
+    refresh_cache.mark_not_modified("https://example.com/unknown", None) # 記録がなければ何もしない
+    assert "https://example.com/unknown" not in json.loads(cache_file.read_text(encoding="utf-8"))
@@ -0,0 +1,50 @@
+# --- ファイル: test_result_stream.py ---
+"""
+result_stream の JSONL 書き込み・読み込みの往復 (追記・途中で切れた最終行・zstd 圧縮) のテスト。
+
+使い方:
+    python -m pytest -q test_result_stream.py
+"""
+import datetime
+
+import pytest
+
+import result_stream
+
+
+def test_jsonl_round_trip(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    records = [
+        {"step": 1, "status": "success", "action": "get_inner_text", "text": "日本語のテキスト"},
+        {"step": 2, "status": "error", "action": "click", "message": "Timeout", "page": 3},
+    ]
+    with result_stream.JsonlResultWriter(path) as writer:
+        for record in records:
+            writer.write(record)
+    assert writer.records_written == 2
+    assert result_stream.load_results_jsonl(path) == records
+
+
+def test_append_mode_and_non_json_values(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    with result_stream.JsonlResultWriter(path) as writer:
+        writer.write({"step": 1})
+    with result_stream.JsonlResultWriter(path, append=True) as writer:
+        writer.write({"step": 2, "at": datetime.date(2024, 1, 2)})
+    assert result_stream.load_results_jsonl(path) == [{"step": 1}, {"step": 2, "at": "2024-01-02"}]
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_text('{"step": 1}\n\n{"step": 2, "te', encoding="utf-8")
+    assert result_stream.load_results_jsonl(str(path)) == [{"step": 1}]
+
+
+def test_zstd_round_trip_across_frames(tmp_path, monkeypatch):
+    pytest.importorskip("zstandard")
+    monkeypatch.setattr(result_stream.config, "RESULT_STREAM_FSYNC_EVERY", 1) # 1件ごとに別フレームになる
+    path = str(tmp_path / "results.jsonl.zst")
+    with result_stream.JsonlResultWriter(path) as writer:
+        for step in range(1, 4):
+            writer.write({"step": step})
+    assert result_stream.load_results_jsonl(path) == [{"step": 1}, {"step": 2}, {"step": 3}]
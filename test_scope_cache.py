@@ -0,0 +1,66 @@
+# --- ファイル: test_scope_cache.py ---
+"""
+scope_cache のキー (ドメイン・パスパターン・探索方式) と、経路の記録・削除・永続化のテスト。
+
+使い方:
+    python -m pytest -q test_scope_cache.py
+"""
+import json
+
+import pytest
+
+import config
+import scope_cache
+
+
+@pytest.fixture
+def cache_file(tmp_path, monkeypatch):
+    path = tmp_path / "selector_scope_cache.json"
+    monkeypatch.setattr(config, "SCOPE_CACHE_ENABLED", True)
+    monkeypatch.setattr(config, "SCOPE_CACHE_FILE", str(path))
+    monkeypatch.setattr(scope_cache, "_cache", None)
+    return path
+
+
+def test_url_path_pattern_wildcards_numeric_segments():
+    assert scope_cache.url_path_pattern("https://Example.com/news/2024/article-123/?q=1#top") == ("example.com", "/news/*/*")
+    assert scope_cache.url_path_pattern("http://example.com") == ("example.com", "/")
+    assert scope_cache.url_path_pattern("about:blank") is None
+    assert scope_cache.url_path_pattern("file:///tmp/a.html") is None
+
+
+def test_make_key_separates_backends():
+    frame_locator_key = scope_cache._make_key("https://example.com/items/42", "#buy")
+    frame_tree_key = scope_cache._make_key("https://example.com/items/42", "#buy", backend="frame_tree")
+    assert frame_locator_key == "example.com|/items/*|#buy"
+    assert frame_tree_key == "frame_tree|example.com|/items/*|#buy"
+    assert scope_cache._make_key("data:text/html,x", "#buy") is None
+
+
+def test_remember_and_get_frame_path_across_urls_with_same_pattern(cache_file):
+    scope_cache.remember_frame_path("https://example.com/items/1", "#buy", (0, 2))
+    assert scope_cache.get_cached_frame_path("https://example.com/items/999", "#buy") == (0, 2)
+    assert scope_cache.get_cached_frame_path("https://example.com/items/999", "#buy", backend="frame_tree") is None
+    assert json.loads(cache_file.read_text(encoding="utf-8"))["example.com|/items/*|#buy"]["frame_path"] == [0, 2]
+
+
+def test_forget_frame_path(cache_file):
+    scope_cache.remember_frame_path("https://example.com/a", "#x", (1,), backend="frame_tree")
+    scope_cache.forget_frame_path("https://example.com/a", "#x", backend="frame_tree")
+    assert scope_cache.get_cached_frame_path("https://example.com/a", "#x", backend="frame_tree") is None
+    scope_cache._cache = None # ファイルから読み直しても消えていること (fixture が元に戻す)
+    assert scope_cache.get_cached_frame_path("https://example.com/a", "#x", backend="frame_tree") is None
+
+
+def test_disabled_cache_returns_nothing(cache_file, monkeypatch):
+    monkeypatch.setattr(config, "SCOPE_CACHE_ENABLED", False)
+    scope_cache.remember_frame_path("https://example.com/a", "#x", (0,))
+    assert scope_cache.get_cached_frame_path("https://example.com/a", "#x") is None
+    assert not cache_file.exists()
+
+
+def test_shadow_path_is_keyed_by_domain(cache_file):
+    scope_cache.remember_shadow_path("https://example.com/one/1", "button", ["my-app", "my-dialog"])
+    assert scope_cache.get_cached_shadow_path("https://example.com/other/path", "button") == ["my-app", "my-dialog"]
+    scope_cache.forget_shadow_path("https://example.com/", "button")
+    assert scope_cache.get_cached_shadow_path("https://example.com/one/1", "button") is None
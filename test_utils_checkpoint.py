@@ -0,0 +1,110 @@
+# --- ファイル: test_utils_checkpoint.py ---
+"""
+utils のチェックポイント (保存先の制限・結果ファイルへの追記・読み込み時の切り詰め) のテスト。
+
+使い方:
+    python -m pytest -q test_utils_checkpoint.py
+"""
+import json
+import os
+import stat
+
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("playwright")
+pytest.importorskip("httpx")
+
+import utils
+
+CHECKPOINT_DATA = {"next_step_index": 1, "current_url": "https://example.com/", "actions_digest": "digest"}
+
+
+@pytest.fixture
+def checkpoint_dir(tmp_path):
+    path = tmp_path / "checkpoints"
+    path.mkdir()
+    return path
+
+
+def test_resolve_checkpoint_path_accepts_files_inside_dir(checkpoint_dir):
+    inside = os.path.realpath(checkpoint_dir / "checkpoint_1.json")
+    assert utils.resolve_checkpoint_path("checkpoint_1.json", str(checkpoint_dir)) == inside
+    assert utils.resolve_checkpoint_path(str(checkpoint_dir / "checkpoint_1.json"), str(checkpoint_dir)) == inside
+
+
+@pytest.mark.parametrize("path", [
+    "../x.json",
+    "/etc/passwd",
+    ".",
+    "sub/../../x.json",
+])
+def test_resolve_checkpoint_path_rejects_paths_outside_dir(checkpoint_dir, path):
+    with pytest.raises(ValueError):
+        utils.resolve_checkpoint_path(path, str(checkpoint_dir))
+
+
+def test_resolve_checkpoint_path_rejects_dir_itself_and_symlink_escape(checkpoint_dir, tmp_path):
+    with pytest.raises(ValueError):
+        utils.resolve_checkpoint_path(str(checkpoint_dir), str(checkpoint_dir))
+    (tmp_path / "secret.json").write_text("{}", encoding="utf-8")
+    os.symlink(tmp_path / "secret.json", checkpoint_dir / "link.json")
+    with pytest.raises(ValueError):
+        utils.resolve_checkpoint_path("link.json", str(checkpoint_dir))
+
+
+def test_save_checkpoint_appends_at_offset_across_saves(checkpoint_dir):
+    filepath = str(checkpoint_dir / "checkpoint.json")
+    first_bytes = utils.save_checkpoint(filepath, CHECKPOINT_DATA, new_results=[{"step": 1}])
+    second_bytes = utils.save_checkpoint(
+        filepath, dict(CHECKPOINT_DATA, next_step_index=2), new_results=[{"step": 2}], results_offset=first_bytes
+    )
+    assert second_bytes > first_bytes
+    loaded = utils.load_checkpoint(filepath)
+    assert loaded["results"] == [{"step": 1}, {"step": 2}]
+    assert loaded["next_step_index"] == 2
+    assert loaded["results_bytes"] == second_bytes
+    assert stat.S_IMODE(os.stat(filepath).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(utils.checkpoint_results_path(filepath)).st_mode) == 0o600
+
+
+def test_save_checkpoint_overwrites_results_written_after_offset(checkpoint_dir):
+    filepath = str(checkpoint_dir / "checkpoint.json")
+    first_bytes = utils.save_checkpoint(filepath, CHECKPOINT_DATA, new_results=[{"step": 1}])
+    with open(utils.checkpoint_results_path(filepath), "ab") as f:
+        f.write(b'{"step": 99, "partial"') # 前回の保存が途中で落ちて残った書きかけの行
+    utils.save_checkpoint(filepath, CHECKPOINT_DATA, new_results=[{"step": 2}], results_offset=first_bytes)
+    assert utils.load_checkpoint(filepath)["results"] == [{"step": 1}, {"step": 2}]
+
+
+def test_load_checkpoint_truncates_torn_trailing_line(checkpoint_dir):
+    filepath = str(checkpoint_dir / "checkpoint.json")
+    results_bytes = utils.save_checkpoint(filepath, CHECKPOINT_DATA, new_results=[{"step": 1}, {"step": 2}])
+    results_path = utils.checkpoint_results_path(filepath)
+    with open(results_path, "ab") as f:
+        f.write(b'{"step": 3, "te')
+    assert utils.load_checkpoint(filepath)["results"] == [{"step": 1}, {"step": 2}]
+    assert os.path.getsize(results_path) == results_bytes
+
+
+def test_load_checkpoint_reads_storage_state_and_confines_results_file(checkpoint_dir, tmp_path):
+    filepath = str(checkpoint_dir / "checkpoint.json")
+    utils.save_checkpoint(filepath, CHECKPOINT_DATA, new_results=[{"step": 1}], storage_state={"cookies": [{"name": "sid"}]})
+    assert utils.load_checkpoint(filepath)["storage_state"] == {"cookies": [{"name": "sid"}]}
+
+    outside_file = tmp_path / "checkpoint.results.jsonl" # チェックポイントのディレクトリの外にある同名のファイル
+    outside_file.write_text('{"step": "outside"}\n' * 10, encoding="utf-8")
+    with open(filepath, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data["results_file"] = "../checkpoint.results.jsonl" # ディレクトリ部分は無視され、外のファイルは読み書きされない
+    with open(filepath, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    assert utils.load_checkpoint(filepath)["results"] == [{"step": 1}]
+    assert outside_file.read_text(encoding="utf-8") == '{"step": "outside"}\n' * 10
+
+
+def test_load_checkpoint_rejects_unknown_version(checkpoint_dir):
+    filepath = checkpoint_dir / "checkpoint.json"
+    filepath.write_text(json.dumps(dict(CHECKPOINT_DATA, version=99, results=[])), encoding="utf-8")
+    with pytest.raises(ValueError):
+        utils.load_checkpoint(str(filepath))
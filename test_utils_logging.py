@@ -0,0 +1,54 @@
+# --- ファイル: test_utils_logging.py ---
+"""
+utils のログの間引き (LogSamplingFilter) と、整形をリスナースレッドに遅らせる QueueHandler のテスト。
+
+使い方:
+    python -m pytest -q test_utils_logging.py
+"""
+import logging
+import queue
+
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("playwright")
+pytest.importorskip("httpx")
+
+import utils
+
+
+def _make_record(name="playwright_finders", level=logging.DEBUG, lineno=10, msg="scope %s", args=("page",)):
+    return logging.LogRecord(name, level, __file__, lineno, msg, args, None)
+
+
+def test_sampling_filter_passes_burst_then_one_in_n_per_call_site():
+    sampling_filter = utils.LogSamplingFilter({"playwright_finders": 5}, burst=3)
+    passed = [count for count in range(1, 21) if sampling_filter.filter(_make_record(lineno=10))]
+    assert passed == [1, 2, 3, 8, 13, 18]
+    # 呼び出し箇所 (行番号) ごとに数えるため、別の箇所は最初から burst 件が通る
+    assert all(sampling_filter.filter(_make_record(lineno=20)) for _ in range(3))
+
+
+def test_sampling_filter_keeps_info_and_unsampled_modules():
+    sampling_filter = utils.LogSamplingFilter({"playwright_finders": 5, "playwright_actions": 1}, burst=0)
+    assert all(sampling_filter.filter(_make_record(level=logging.INFO)) for _ in range(10))
+    assert all(sampling_filter.filter(_make_record(level=logging.WARNING)) for _ in range(10))
+    assert all(sampling_filter.filter(_make_record(name="playwright_actions")) for _ in range(10)) # rate 1 は間引かない
+    assert all(sampling_filter.filter(_make_record(name="utils")) for _ in range(10))
+
+
+def test_deferred_queue_handler_keeps_immutable_args_unformatted():
+    log_queue = queue.SimpleQueue()
+    record = _make_record(msg="iframe %d (%s)", args=(3, "https://example.com/"))
+    utils._DeferredFormatQueueHandler(log_queue).handle(record)
+    queued = log_queue.get_nowait()
+    assert queued is record # 整形せずにそのまま渡す
+    assert queued.getMessage() == "iframe 3 (https://example.com/)"
+
+
+def test_deferred_queue_handler_formats_mutable_args_at_call_time():
+    log_queue = queue.SimpleQueue()
+    frame_path = [0]
+    utils._DeferredFormatQueueHandler(log_queue).handle(_make_record(msg="path %s", args=(frame_path,)))
+    frame_path.append(1) # 呼び出し後の変更はログに反映されない
+    assert log_queue.get_nowait().getMessage() == "path [0]"
@@ -0,0 +1,58 @@
+# --- ファイル: test_utils_pdf_options.py ---
+"""
+utils の pdf_options の正規化 (normalize_pdf_options)・対象ページの選択 (select_pdf_pages)・ページ指定付きのテキスト抽出のテスト。
+
+使い方:
+    python -m pytest -q test_utils_pdf_options.py
+"""
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("playwright")
+pytest.importorskip("httpx")
+
+import utils
+
+
+def test_normalize_pdf_options_defaults():
+    assert utils.normalize_pdf_options(None) == {"mode": "sorted", "max_pages": None, "page_ranges": [], "parallel_chunks": 1}
+
+
+def test_normalize_pdf_options_parses_page_ranges():
+    options = utils.normalize_pdf_options({"mode": "FAST", "max_pages": "5", "pages": "1-3, 7,10-", "parallel_chunks": 2})
+    assert options == {"mode": "fast", "max_pages": 5, "page_ranges": [(1, 3), (7, 7), (10, None)], "parallel_chunks": 2}
+
+
+@pytest.mark.parametrize("pdf_options", [
+    {"mode": "ocr"},
+    {"max_pages": 0},
+    {"max_pages": "all"},
+    {"parallel_chunks": 0},
+    {"pages": "3-1"},
+    {"pages": "0"},
+    {"pages": "a-b"},
+    {"page_ranges": [(1, 2)]}, # 正規化後のキーは受け付けない
+])
+def test_normalize_pdf_options_rejects_invalid_values(pdf_options):
+    with pytest.raises(ValueError):
+        utils.normalize_pdf_options(pdf_options)
+
+
+def test_select_pdf_pages():
+    assert utils.select_pdf_pages(4, utils.normalize_pdf_options(None)) == [0, 1, 2, 3]
+    assert utils.select_pdf_pages(10, utils.normalize_pdf_options({"pages": "8-,2,1-2"})) == [0, 1, 7, 8, 9]
+    assert utils.select_pdf_pages(10, utils.normalize_pdf_options({"pages": "3-20", "max_pages": 2})) == [2, 3]
+    assert utils.select_pdf_pages(3, utils.normalize_pdf_options({"pages": "5-6"})) == []
+
+
+def test_extract_text_from_pdf_sync_reads_only_selected_pages(tmp_path):
+    doc = fitz.open()
+    for page_num in range(1, 6):
+        doc.new_page().insert_text((72, 72), f"page-{page_num}")
+    pdf_path = str(tmp_path / "sample.pdf")
+    doc.save(pdf_path)
+    doc.close()
+
+    text = utils.extract_text_from_pdf_sync(pdf_path, {"pages": "2,4-", "max_pages": 2, "mode": "fast"})
+    assert "page-2" in text and "page-4" in text
+    assert "page-1" not in text and "page-3" not in text and "page-5" not in text
@@ -1,27 +1,99 @@
 # --- ファイル: utils.py (結果追記機能追加版) ---
+import hashlib
 import json
 import logging
+import logging.handlers
 import os
 import sys
 import asyncio
+import atexit
+import multiprocessing
+import queue
+import tempfile
 import time
 import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager, contextmanager
 import fitz  # PyMuPDF
-from playwright.async_api import APIRequestContext, TimeoutError as PlaywrightTimeoutError
+import httpx # PDFのストリーミングダウンロード用
+from playwright.async_api import APIRequestContext
 # <<< typing に Optional, Dict, Any, List, Union を追加 >>>
-from typing import Optional, Dict, Any, List, Union
-from urllib.parse import urljoin
+from typing import Optional, Dict, Any, List, Union, Tuple, AsyncIterator
+from urllib.parse import urljoin, urlparse
 
 import config
+import artifact_store # 退避済みの大きな結果を出力時に読み込む
+import refresh_cache # 差分取得 (incremental) 用の検証子と前回テキスト
 
 logger = logging.getLogger(__name__)
 
 # --- setup_logging_for_standalone, load_input_from_json, ---
-# --- extract_text_from_pdf_sync, download_pdf_async は変更なし ---
+# --- extract_text_from_pdf_sync は変更なし ---
 # (コードは省略)
+
+# --- 非同期ロギング (QueueHandler / QueueListener) ---
+_log_listener: Optional[logging.handlers.QueueListener] = None # 稼働中のリスナー (ロギング設定のたびに作り直す)
+
+# 整形をリスナースレッドに遅らせても結果が変わらない (変更できない) 引数の型
+_DEFERRABLE_LOG_ARG_TYPES = (str, int, float, bool, bytes, type(None))
+
+def _is_deferrable_log_arg(value: Any) -> bool:
+    """整形を遅らせてよい引数か。deferred_log_safe = True のクラス (文字列表現が変わらないログ用ラベル) も含む。"""
+    return isinstance(value, _DEFERRABLE_LOG_ARG_TYPES) or getattr(value, "deferred_log_safe", False) is True
+
+class _DeferredFormatQueueHandler(logging.handlers.QueueHandler):
+    """
+    メッセージの整形 (msg % args) もリスナースレッドに任せる QueueHandler。同一プロセス内のキュー専用。
+    レコードはコピーせずにそのまま渡すため、整形はリスナースレッドで行われる時点の引数の状態になる。
+    引数がすべて変更できない値の場合だけ整形を遅らせ、リストや辞書などを含む場合は標準の prepare() で
+    呼び出し元のスレッドで整形する (呼び出し後に変更された内容がログに出ないようにする)。
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        arg_values = args.values() if isinstance(args, dict) else (args or ())
+        if all(_is_deferrable_log_arg(value) for value in arg_values):
+            return record
+        return super().prepare(record)
+
+class LogSamplingFilter(logging.Filter):
+    """
+    指定モジュールの DEBUG ログ (要素・スコープ単位のログ) を間引くフィルター。
+    呼び出し箇所ごとに最初の burst 件は通し、以降は rate 件に1件だけ通す。INFO 以上は間引かない。
+    """
+    def __init__(self, rates: Dict[str, int], burst: int):
+        super().__init__()
+        self.rates = {name: rate for name, rate in rates.items() if rate and rate > 1}
+        self.burst = burst
+        self._counts: Dict[Tuple[str, int], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or record.name not in self.rates:
+            return True
+        key = (record.name, record.lineno)
+        count = self._counts.get(key, 0) + 1
+        self._counts[key] = count
+        return count <= self.burst or (count - self.burst) % self.rates[record.name] == 0
+
+def stop_logging_listener() -> None:
+    """リスナースレッドを止め、キューに残ったログを書き出す。"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+atexit.register(stop_logging_listener)
+
 def setup_logging_for_standalone(log_file_path: str = config.LOG_FILE):
-    """Web-Runner単体実行用のロギング設定を行います。"""
+    """
+    Web-Runner単体実行用のロギング設定を行います。
+    config.LOG_QUEUE_ENABLED が True の場合、ルートロガーには QueueHandler だけを付け、
+    コンソール・ファイルへの整形と書き込みは QueueListener のスレッドで行います。
+    """
+    global _log_listener
     log_level = logging.INFO # デフォルトレベル
+    stop_logging_listener() # 再設定の場合は前回のリスナーを止めてから作り直す
     root_logger = logging.getLogger()
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
@@ -56,10 +128,23 @@ def setup_logging_for_standalone(log_file_path: str = config.LOG_FILE):
         print(f"DEBUG [utils]: FileHandler created for '{log_file_path}'")
     except Exception as e:
         print(f"警告 [utils]: ログファイル '{log_file_path}' のハンドラ設定に失敗しました: {e}", file=sys.stderr)
+    sampling_filter = LogSamplingFilter(config.LOG_SAMPLING_RATES, config.LOG_SAMPLING_BURST)
+    if config.LOG_QUEUE_ENABLED:
+        log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        queue_handler = _DeferredFormatQueueHandler(log_queue)
+        queue_handler.addFilter(sampling_filter) # 間引くログはキューに入れる前に捨てる
+        _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _log_listener.start()
+        root_handlers: List[logging.Handler] = [queue_handler]
+        log_target += " (QueueListener経由)"
+    else:
+        for handler in handlers:
+            handler.addFilter(sampling_filter)
+        root_handlers = handlers
     logging.basicConfig(
         level=log_level,
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=handlers,
+        handlers=root_handlers,
         force=True
     )
     logging.getLogger('playwright').setLevel(logging.WARNING)
@@ -94,19 +179,257 @@ def load_input_from_json(filepath: str) -> Dict[str, Any]:
         logger.error(f"入力ファイルの読み込み中に予期せぬエラーが発生しました ({filepath}): {e}", exc_info=True)
         raise
 
-def extract_text_from_pdf_sync(pdf_data: bytes) -> Optional[str]:
-    """PDFのバイトデータからテキストを抽出する (同期的)。エラー時はエラーメッセージ文字列を返す。"""
+# --- ステップ単位のタイミング計測 ---
+STEP_TIMING_KEYS = ("finder_ms", "action_ms", "wait_ms", "network_ms")
+
+def new_step_timing() -> Dict[str, Any]:
+    """ステップ結果に付与するタイミング内訳の初期値を返す。"""
+    timing: Dict[str, Any] = {key: 0.0 for key in STEP_TIMING_KEYS}
+    timing["network_bytes"] = 0
+    return timing
+
+@contextmanager
+def measure_ms(timing: Optional[Dict[str, Any]], key: str):
+    """with ブロックの経過時間 (ミリ秒) を timing[key] に加算する。"""
+    start_time = time.monotonic()
+    try:
+        yield
+    finally:
+        if timing is not None:
+            timing[key] = timing.get(key, 0.0) + (time.monotonic() - start_time) * 1000
+
+def finalize_step_timing(timing: Dict[str, Any], total_ms: float) -> Dict[str, Any]:
+    """
+    合計時間を設定し、探索・待機・通信・本体ステップ以外の残りをアクション時間とする。
+    値は結果の可読性のためミリ秒単位で丸める。
+    """
+    accounted_ms = sum(timing.get(key, 0.0) for key in ("finder_ms", "wait_ms", "network_ms", "body_ms"))
+    timing["action_ms"] = timing.get("action_ms", 0.0) + max(0.0, total_ms - accounted_ms)
+    timing["total_ms"] = total_ms
+    return {key: (round(val) if isinstance(val, float) else val) for key, val in timing.items()}
+
+def summarize_step_timings(results: List[Dict[str, Any]], slowest_count: int = 5) -> Dict[str, Any]:
+    """各ステップ結果の timing を集計し、実行全体のサマリ (合計値と遅いステップ上位) を返す。"""
+    timed_results = [res for res in results if isinstance(res, dict) and isinstance(res.get("timing"), dict)]
+    totals: Dict[str, Any] = {key: 0 for key in (*STEP_TIMING_KEYS, "total_ms", "network_bytes")}
+    for res in timed_results:
+        # paginate の本体ステップは親ステップの時間に含まれるため、トップレベルのみ合計する
+        if isinstance(res.get("step"), str) and "." in res["step"]:
+            continue
+        for key in totals:
+            totals[key] += res["timing"].get(key, 0)
+    slowest = sorted(timed_results, key=lambda r: r["timing"].get("total_ms", 0), reverse=True)[:slowest_count]
+    return {
+        "steps_timed": len(timed_results),
+        "totals": totals,
+        "slowest_steps": [
+            {"step": r.get("step"), "action": r.get("action"), "selector": r.get("selector"), "total_ms": r["timing"].get("total_ms", 0)}
+            for r in slowest
+        ],
+    }
+
+# --- チェックポイント (長いアクションプランの途中再開用) ---
+# version 2: 結果は別ファイル (JSONL) に追記し、本体には有効なバイト数だけを記録する。ストレージ状態も別ファイル
+CHECKPOINT_FORMAT_VERSION = 2
+_SUPPORTED_CHECKPOINT_VERSIONS = (1, 2)
+
+def compute_actions_digest(actions: List[Dict[str, Any]]) -> str:
+    """アクションリストの内容からダイジェストを計算する (チェックポイントと実行プランの照合用)。"""
+    serialized = json.dumps(actions, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+def default_checkpoint_path(checkpoint_dir: str = config.CHECKPOINT_DIR) -> str:
+    """タイムスタンプ付きのチェックポイントファイルパスを checkpoint_dir (既定: config.CHECKPOINT_DIR) 配下に生成する。"""
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    return os.path.join(checkpoint_dir, f"checkpoint_{timestamp}_{os.getpid()}.json")
+
+def resolve_checkpoint_path(path: str, checkpoint_dir: str) -> str:
+    """
+    外部から指定されたチェックポイントのパスを checkpoint_dir 配下に限定して解決する。
+    ファイル名だけの場合は checkpoint_dir 内のファイルとみなす。配下にない場合は ValueError を送出する。
+    """
+    base_dir = os.path.realpath(checkpoint_dir)
+    candidate = path if os.path.dirname(path) else os.path.join(checkpoint_dir, path)
+    resolved = os.path.realpath(candidate)
+    if os.path.commonpath([base_dir, resolved]) != base_dir or resolved == base_dir:
+        raise ValueError(f"チェックポイントは '{checkpoint_dir}' 配下のファイルのみ指定できます: '{path}'")
+    return resolved
+
+def checkpoint_results_path(filepath: str) -> str:
+    """チェックポイントの結果を追記する JSONL ファイルのパス。"""
+    return f"{os.path.splitext(filepath)[0]}.results.jsonl"
+
+def checkpoint_storage_state_path(filepath: str) -> str:
+    """チェックポイントのストレージ状態 (Cookie 等) を保存するファイルのパス。"""
+    return f"{os.path.splitext(filepath)[0]}.storage_state.json"
+
+def _write_private_file(filepath: str, text: str) -> None:
+    """所有者のみ読み書きできる権限 (0600) で一時ファイルに書き込み、既存のファイルと置き換える。"""
+    tmp_path = f"{filepath}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, filepath)
+
+def save_checkpoint(
+    filepath: str,
+    checkpoint_data: Dict[str, Any],
+    new_results: Optional[List[Dict[str, Any]]] = None,
+    storage_state: Optional[Dict[str, Any]] = None,
+    results_offset: int = 0
+) -> int:
+    """
+    チェックポイントを保存する。結果は毎回書き直さず、前回の保存以降に増えた new_results だけを
+    結果ファイル (checkpoint_results_path) の results_offset (前回の保存で返したバイト数、初回は 0) の位置から書き込み、
+    本体にはその時点の有効なバイト数 (results_bytes) を記録して返す。
+    前回の保存が途中で失敗して残った書きかけの行は、results_offset で切り詰めて上書きされる。
+    storage_state は変化したときだけ渡し、別ファイルに書き込む。
+    Cookie などを含むため、各ファイルは所有者のみ読み書きできる権限で作成する。
+    書き込み途中でプロセスが落ちても既存のチェックポイントが壊れないよう、本体は一時ファイル経由で置き換える。
+    """
+    checkpoint_dir = os.path.dirname(filepath)
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    results_path = checkpoint_results_path(filepath)
+    fd = os.open(results_path, os.O_WRONLY | os.O_CREAT, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.truncate(results_offset)
+        f.seek(results_offset)
+        for result in new_results or []:
+            f.write((json.dumps(result, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+        results_bytes = f.tell()
+    if storage_state is not None:
+        _write_private_file(checkpoint_storage_state_path(filepath), json.dumps(storage_state, ensure_ascii=False))
+    _write_private_file(filepath, json.dumps({
+        "version": CHECKPOINT_FORMAT_VERSION,
+        **checkpoint_data,
+        "results_file": os.path.basename(results_path),
+        "results_bytes": results_bytes,
+    }, ensure_ascii=False, default=str))
+    logger.debug(f"チェックポイントを保存しました: '{filepath}' (次のステップ: {checkpoint_data.get('next_step_index')}, 追記した結果: {len(new_results or [])} 件)")
+    return results_bytes
+
+def load_checkpoint(filepath: str) -> Dict[str, Any]:
+    """
+    チェックポイントファイルを読み込み、必須キーを検証して返す。
+    結果ファイルは記録されたバイト数までを読み、それ以降 (保存途中で落ちた分) は切り詰める。
+    ストレージ状態のファイルがあれば storage_state として返す。
+    """
+    logger.info(f"チェックポイント '{filepath}' を読み込みます...")
+    with open(filepath, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") not in _SUPPORTED_CHECKPOINT_VERSIONS:
+        raise ValueError(f"サポートされていないチェックポイント形式です (version: {data.get('version')})。")
+    if data["version"] >= 2:
+        # 結果ファイルはチェックポイントと同じディレクトリに限る (切り詰めを行うため、記録された値のディレクトリ部分は使わない)
+        results_path = os.path.join(os.path.dirname(filepath), os.path.basename(data.get("results_file") or ""))
+        results_bytes = data.get("results_bytes", 0)
+        data["results"] = []
+        if results_bytes:
+            with open(results_path, "r+b") as f:
+                raw = f.read(results_bytes)
+                f.truncate(results_bytes)
+            data["results"] = [json.loads(line) for line in raw.decode("utf-8").splitlines() if line.strip()]
+        storage_state_path = checkpoint_storage_state_path(filepath)
+        if os.path.exists(storage_state_path):
+            with open(storage_state_path, "r", encoding="utf-8") as f:
+                data["storage_state"] = json.load(f)
+    for key in ("next_step_index", "results", "current_url", "actions_digest"):
+        if key not in data:
+            raise ValueError(f"チェックポイントに必須キー '{key}' がありません。")
+    logger.info(f"チェックポイントを読み込みました。再開ステップ: {data['next_step_index'] + 1}, URL: {data['current_url']}, 結果: {len(data['results'])} 件")
+    return data
+
+PDF_TEXT_MODES = ("sorted", "fast", "blocks")
+
+def normalize_pdf_options(pdf_options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    ステップの pdf_options を正規化する。形式が不正な場合は ValueError を送出する。
+    mode: 'sorted' (既定。読み順に並べ替え、最も遅い) / 'fast' (並べ替えなし) / 'blocks' (テキストブロック単位)
+    max_pages: 先頭から処理するページ数 / pages: 1始まりのページ範囲 (例: "1-3,7")
+    parallel_chunks: 長い文書をページ単位で分割して並行抽出する数 (PDF_PARALLEL_MIN_PAGES ページ以上の文書が対象)
+    ステップの指定 (ユーザー入力) だけを受け付ける。正規化後のキー (page_ranges など) を渡すと未知のキーとして拒否する。
+    """
+    options = dict(pdf_options or {})
+    unknown_keys = set(options) - {"mode", "max_pages", "pages", "parallel_chunks"}
+    if unknown_keys:
+        raise ValueError(f"Unknown keys in 'pdf_options': {sorted(unknown_keys)}")
+    mode = str(options.get("mode") or "sorted").lower()
+    if mode not in PDF_TEXT_MODES:
+        raise ValueError(f"Invalid 'pdf_options.mode': '{mode}'. Use {list(PDF_TEXT_MODES)}.")
+    try:
+        max_pages = int(options["max_pages"]) if options.get("max_pages") is not None else None
+        parallel_chunks = int(options["parallel_chunks"]) if options.get("parallel_chunks") is not None else 1
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid 'pdf_options' values: {pdf_options}")
+    if (max_pages is not None and max_pages < 1) or parallel_chunks < 1:
+        raise ValueError("Invalid 'pdf_options' values: max_pages>=1 and parallel_chunks>=1 are required.")
+    page_ranges: List[Tuple[int, Optional[int]]] = []
+    for part in str(options.get("pages") or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start_text, _, end_text = part.partition("-")
+        try:
+            start = int(start_text)
+            end = (int(end_text) if end_text.strip() else None) if "-" in part else start # "5-" は最終ページまで
+        except ValueError:
+            raise ValueError(f"Invalid page range in 'pdf_options.pages': '{part}'")
+        if start < 1 or (end is not None and end < start):
+            raise ValueError(f"Invalid page range in 'pdf_options.pages': '{part}'")
+        page_ranges.append((start, end))
+    return {"mode": mode, "max_pages": max_pages, "page_ranges": page_ranges, "parallel_chunks": parallel_chunks}
+
+def select_pdf_pages(page_count: int, options: Dict[str, Any]) -> List[int]:
+    """正規化済みの pdf_options から処理するページ (0始まり) の一覧を返す。"""
+    if options["page_ranges"]:
+        selected = sorted({i for start, end in options["page_ranges"] for i in range(start - 1, min(end or page_count, page_count))})
+    else:
+        selected = list(range(page_count))
+    return selected[:options["max_pages"]] if options["max_pages"] else selected
+
+def _get_page_text(page: Any, mode: str) -> str:
+    if mode == "fast":
+        return page.get_text("text")
+    if mode == "blocks":
+        # (x0, y0, x1, y1, テキスト, ブロック番号, ブロック種別) の種別 0 がテキスト
+        return "\n".join(block[4].strip() for block in page.get_text("blocks") if block[6] == 0 and block[4].strip())
+    return page.get_text("text", sort=True)
+
+def count_pdf_pages_sync(pdf_path: str) -> int:
+    """PDFファイルのページ数を返す (ページの内容は解析しない)。"""
+    with fitz.open(pdf_path, filetype="pdf") as doc:
+        return len(doc)
+
+def extract_text_from_pdf_sync(
+    pdf_data: Union[bytes, str], pdf_options: Optional[Dict[str, Any]] = None, _page_indices: Optional[List[int]] = None
+) -> Optional[str]:
+    """
+    PDFからテキストを抽出する (同期的)。エラー時はエラーメッセージ文字列を返す。
+    pdf_data はバイトデータ、またはPDFファイルのパス (パスの場合はメモリに読み込まずファイルから開く)。
+    pdf_options (normalize_pdf_options 参照) で抽出方式と対象ページを指定できる。対象外のページは読み込まない。
+    _page_indices は並行抽出の分割単位 (0始まりのページ番号) で、extract_pdf_text_async の内部でのみ使う。
+    """
     doc = None
+    options = normalize_pdf_options(pdf_options)
     try:
-        logger.info(f"PDFデータ (サイズ: {len(pdf_data)} bytes) からテキスト抽出を開始します...")
-        doc = fitz.open(stream=pdf_data, filetype="pdf")
+        if isinstance(pdf_data, str):
+            logger.info(f"PDFファイル '{pdf_data}' (サイズ: {os.path.getsize(pdf_data)} bytes) からテキスト抽出を開始します...")
+            doc = fitz.open(pdf_data, filetype="pdf")
+        else:
+            logger.info(f"PDFデータ (サイズ: {len(pdf_data)} bytes) からテキスト抽出を開始します...")
+            doc = fitz.open(stream=pdf_data, filetype="pdf")
         text_parts = []
-        logger.info(f"PDFページ数: {len(doc)}")
-        for page_num in range(len(doc)):
+        if _page_indices is not None:
+            page_numbers = [i for i in _page_indices if 0 <= i < len(doc)]
+        else:
+            page_numbers = select_pdf_pages(len(doc), options)
+        logger.info(f"PDFページ数: {len(doc)} (処理対象: {len(page_numbers)} ページ, 方式: {options['mode']})")
+        for page_num in page_numbers:
             page_start_time = time.monotonic()
             try:
                 page = doc.load_page(page_num)
-                page_text = page.get_text("text", sort=True)
+                page_text = _get_page_text(page, options["mode"])
                 if page_text:
                     text_parts.append(page_text.strip())
                 page_elapsed = (time.monotonic() - page_start_time) * 1000
@@ -135,39 +458,361 @@ def extract_text_from_pdf_sync(pdf_data: bytes) -> Optional[str]:
             try: doc.close(); logger.debug("PDFドキュメントを閉じました。")
             except Exception as close_e: logger.warning(f"PDFドキュメントのクローズ中にエラーが発生しました (無視): {close_e}")
 
-async def download_pdf_async(api_request_context: APIRequestContext, url: str) -> Optional[bytes]:
-    """指定されたURLからPDFを非同期でダウンロードし、バイトデータを返す。失敗時はNoneを返す。"""
-    logger.info(f"PDFを非同期でダウンロード中: {url} (Timeout: {config.PDF_DOWNLOAD_TIMEOUT}ms)")
+PDF_REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36',
+    'Accept': 'application/pdf,text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+    'Accept-Encoding': 'gzip, deflate, br, zstd',
+    'Accept-Language': 'ja-JP,ja;q=0.9,en-US;q=0.8,en;q=0.7'
+}
+
+async def _browser_cookies_for_httpx(api_request_context: APIRequestContext) -> httpx.Cookies:
+    """ブラウザコンテキストのクッキーを httpx 用に変換する (ログイン済みサイトのPDF用)。"""
+    cookies = httpx.Cookies()
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36',
-            'Accept': 'application/pdf,text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-            'Accept-Encoding': 'gzip, deflate, br, zstd',
-            'Accept-Language': 'ja-JP,ja;q=0.9,en-US;q=0.8,en;q=0.7'
-        }
-        response = await api_request_context.get(url, headers=headers, timeout=config.PDF_DOWNLOAD_TIMEOUT, fail_on_status_code=False)
-        if not response.ok:
-            logger.error(f"PDFダウンロード失敗 ({url}) - Status: {response.status} {response.status_text}")
-            try:
-                error_body = await response.text(timeout=5000)
-                logger.debug(f"エラーレスポンスボディ (一部): {error_body[:500]}")
-            except Exception as body_err: logger.warning(f"エラーレスポンスボディの読み取り中にエラーが発生しました: {body_err}")
-            return None
-        content_type = response.headers.get('content-type', '').lower()
-        if 'application/pdf' not in content_type:
-            logger.warning(f"レスポンスのContent-TypeがPDFではありません ({url}): '{content_type}'。ダウンロードは続行しますが、後続処理で失敗する可能性があります。")
-        body = await response.body()
-        if not body:
-             logger.warning(f"PDFダウンロード成功 ({url}) Status: {response.status} ですが、レスポンスボディが空です。")
-             return None
-        logger.info(f"PDFダウンロード成功 ({url})。サイズ: {len(body)} bytes")
-        return body
-    except PlaywrightTimeoutError:
+        storage_state = await api_request_context.storage_state()
+        for cookie in storage_state.get("cookies", []):
+            cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain", ""), path=cookie.get("path", "/"))
+    except Exception as e:
+        logger.debug(f"クッキーの取得に失敗しました (クッキーなしで続行): {e}")
+    return cookies
+
+@asynccontextmanager
+async def open_http_session(api_request_context: APIRequestContext) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    1ステップ内のPDF判定・PDFダウンロード・条件付きリクエストで共有する httpx クライアントを開く。
+    ブラウザのクッキーは開くときに1回だけ取得し、接続もリンク間で再利用する。
+    タイムアウトとヘッダーの差分は各リクエストで指定する。
+    """
+    cookies = await _browser_cookies_for_httpx(api_request_context)
+    async with httpx.AsyncClient(headers=PDF_REQUEST_HEADERS, cookies=cookies, follow_redirects=True, timeout=config.PDF_DOWNLOAD_TIMEOUT / 1000) as client:
+        yield client
+
+@asynccontextmanager
+async def _shared_or_new_client(api_request_context: APIRequestContext, client: Optional[httpx.AsyncClient]) -> AsyncIterator[httpx.AsyncClient]:
+    """共有クライアントが渡されればそれを使い、なければこの呼び出しだけのクライアントを開く。"""
+    if client is not None:
+        yield client
+    else:
+        async with open_http_session(api_request_context) as own_client:
+            yield own_client
+
+# --- リンク先がPDFかどうかの判定 (拡張子ではなく Content-Type とファイル先頭のマジックバイトで判定) ---
+_pdf_detection_cache: "OrderedDict[str, bool]" = OrderedDict() # URL -> PDFかどうか (LRU)
+# これらの Content-Type は (Content-Disposition でPDFのファイル名が指定されていない限り) PDFではないと判断する
+_NON_PDF_CONTENT_TYPE_PREFIXES = ("text/", "image/", "audio/", "video/", "application/xhtml", "application/json", "application/xml", "application/javascript")
+PDF_MAGIC_BYTES = b"%PDF-"
+
+async def _detect_pdf_with_client(client: httpx.AsyncClient, url: str) -> Tuple[bool, str]:
+    """HEAD で Content-Type を確認し、判断できなければ先頭部分だけの GET でマジックバイトを確認する。(判定, 根拠) を返す。"""
+    headers = {'Accept-Encoding': 'identity'} # 先頭バイトを圧縮なしで受け取る
+    timeout = config.PDF_DETECT_TIMEOUT / 1000
+    try:
+        head_response = await client.head(url, headers=headers, timeout=timeout)
+        if head_response.status_code < 400:
+            content_type = head_response.headers.get("content-type", "").lower()
+            disposition = head_response.headers.get("content-disposition", "").lower()
+            if "application/pdf" in content_type:
+                return True, f"content-type '{content_type}'"
+            if content_type.startswith(_NON_PDF_CONTENT_TYPE_PREFIXES) and ".pdf" not in disposition:
+                return False, f"content-type '{content_type}'"
+    except httpx.HTTPError as e:
+        logger.debug(f"HEAD リクエストに失敗しました (先頭部分の取得で判定します) ({url}): {e}")
+    # application/octet-stream や HEAD 非対応のサーバーは、先頭部分だけを取得して判定する
+    async with client.stream("GET", url, headers=dict(headers, Range=f"bytes=0-{config.PDF_SNIFF_BYTES - 1}"), timeout=timeout) as response:
+        if response.status_code >= 400:
+            return False, f"status {response.status_code}"
+        head_bytes = b""
+        async for chunk in response.aiter_bytes():
+            head_bytes += chunk
+            if len(head_bytes) >= config.PDF_SNIFF_BYTES:
+                break # Range を無視して全体を返すサーバーでも、先頭だけ読んで接続を閉じる
+    # PDFの仕様上、ヘッダーの前に最大1024バイトのデータがあり得るため先頭一致ではなく包含で判定する
+    return PDF_MAGIC_BYTES in head_bytes[:config.PDF_SNIFF_BYTES], "magic bytes"
+
+async def is_pdf_url_async(api_request_context: APIRequestContext, url: str, client: Optional[httpx.AsyncClient] = None) -> bool:
+    """
+    URLのリンク先がPDFかどうかを判定する。結果はURLごとにキャッシュする (PDF_DETECT_CACHE_SIZE 件まで)。
+    '?id=123' のようなダウンロード用URLもPDFとして扱い、'.pdf' で終わるHTMLの中間ページは除外する。
+    判定のための通信に失敗した場合は拡張子で判断する (この結果はキャッシュしない)。
+    client (open_http_session) を渡すと、同じステップ内の他のリンクとクッキー・接続を共有する。
+    """
+    if not config.PDF_DETECT_BY_CONTENT_TYPE:
+        return urlparse(url).path.lower().endswith('.pdf')
+    cached = _pdf_detection_cache.get(url)
+    if cached is not None:
+        _pdf_detection_cache.move_to_end(url)
+        return cached
+    try:
+        async with _shared_or_new_client(api_request_context, client) as detect_client:
+            is_pdf, reason = await _detect_pdf_with_client(detect_client, url)
+    except Exception as e:
+        is_pdf = urlparse(url).path.lower().endswith('.pdf')
+        logger.warning(f"PDF判定の通信に失敗したため拡張子で判断します ({url} -> {is_pdf}): {type(e).__name__} - {e}")
+        return is_pdf
+    logger.debug(f"PDF判定: {url} -> {is_pdf} ({reason})")
+    _pdf_detection_cache[url] = is_pdf
+    if len(_pdf_detection_cache) > config.PDF_DETECT_CACHE_SIZE:
+        _pdf_detection_cache.popitem(last=False)
+    return is_pdf
+
+async def download_pdf_to_file_async(
+    api_request_context: APIRequestContext, url: str,
+    extra_headers: Optional[Dict[str, str]] = None, response_info: Optional[Dict[str, Any]] = None,
+    client: Optional[httpx.AsyncClient] = None
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    指定されたURLのPDFを一時ファイルにストリーミングでダウンロードする (本体をメモリに保持しない)。
+    Content-Length が PDF_MAX_DOWNLOAD_BYTES を超える場合は本体を読まずに中止し、
+    ヘッダーがない場合も受信済みサイズが上限を超えた時点で中止する。
+    戻り値は (一時ファイルのパス, エラーメッセージ)。一時ファイルの削除は呼び出し側が行う。
+    extra_headers で条件付きリクエストのヘッダーを追加できる。response_info を渡すと
+    status / etag / last_modified / sha256 (本体のハッシュ) を格納する。304 の場合はパスもエラーも None。
+    client (open_http_session) を渡すと、同じステップ内の他のリンクとクッキー・接続を共有する。
+    """
+    logger.info(f"PDFを一時ファイルにダウンロード中: {url} (Timeout: {config.PDF_DOWNLOAD_TIMEOUT}ms, 上限: {config.PDF_MAX_DOWNLOAD_BYTES} bytes)")
+    headers = dict({'Accept-Encoding': 'gzip, deflate'}, **(extra_headers or {})) # httpx が標準で展開できる形式のみ
+    if response_info is None: response_info = {}
+    tmp_path: Optional[str] = None
+
+    async def _stream_to_file() -> Tuple[Optional[str], Optional[str]]:
+        nonlocal tmp_path
+        async with _shared_or_new_client(api_request_context, client) as download_client:
+            async with download_client.stream("GET", url, headers=headers, timeout=config.PDF_DOWNLOAD_TIMEOUT / 1000) as response:
+                response_info.update({"status": response.status_code, "etag": response.headers.get("etag"),
+                                      "last_modified": response.headers.get("last-modified")})
+                if response.status_code == 304:
+                    logger.info(f"PDFは前回から変更されていません (304): {url}")
+                    return None, None
+                if response.status_code >= 400:
+                    logger.error(f"PDFダウンロード失敗 ({url}) - Status: {response.status_code} {response.reason_phrase}")
+                    return None, f"Error: PDF download failed with status {response.status_code}."
+                content_length = response.headers.get('content-length', '')
+                if content_length.isdigit() and int(content_length) > config.PDF_MAX_DOWNLOAD_BYTES:
+                    logger.error(f"PDFのサイズ ({content_length} bytes) が上限 ({config.PDF_MAX_DOWNLOAD_BYTES} bytes) を超えるためダウンロードを中止します ({url})")
+                    return None, f"Error: PDF size {content_length} bytes exceeds limit of {config.PDF_MAX_DOWNLOAD_BYTES} bytes."
+                content_type = response.headers.get('content-type', '').lower()
+                if 'application/pdf' not in content_type:
+                    logger.warning(f"レスポンスのContent-TypeがPDFではありません ({url}): '{content_type}'。ダウンロードは続行しますが、後続処理で失敗する可能性があります。")
+                fd, tmp_path = tempfile.mkstemp(suffix=".pdf", dir=config.PDF_TEMP_DIR)
+                received = 0
+                content_hash = hashlib.sha256() # 差分取得で内容の変化を判定するため、書き込みながらハッシュを計算
+                with os.fdopen(fd, "wb") as f:
+                    async for chunk in response.aiter_bytes(config.PDF_DOWNLOAD_CHUNK_BYTES):
+                        received += len(chunk)
+                        if received > config.PDF_MAX_DOWNLOAD_BYTES:
+                            logger.error(f"受信サイズが上限 ({config.PDF_MAX_DOWNLOAD_BYTES} bytes) を超えたためダウンロードを中止します ({url})")
+                            return None, f"Error: PDF exceeds size limit of {config.PDF_MAX_DOWNLOAD_BYTES} bytes."
+                        content_hash.update(chunk)
+                        f.write(chunk)
+                response_info["sha256"] = content_hash.hexdigest()
+                if received == 0:
+                    logger.warning(f"PDFダウンロード成功 ({url}) Status: {response.status_code} ですが、レスポンスボディが空です。")
+                    return None, "Error: PDF download failed or returned no data."
+                logger.info(f"PDFダウンロード成功 ({url})。サイズ: {received} bytes -> {tmp_path}")
+                return tmp_path, None
+
+    try:
+        if config.PDF_TEMP_DIR:
+            os.makedirs(config.PDF_TEMP_DIR, exist_ok=True)
+        # httpx のタイムアウトは1回の読み取りごとなので、全体の上限は別に設ける
+        path, error = await asyncio.wait_for(_stream_to_file(), timeout=config.PDF_DOWNLOAD_TIMEOUT / 1000)
+    except asyncio.TimeoutError:
         logger.error(f"PDFダウンロード中にタイムアウトが発生しました ({url})。設定タイムアウト: {config.PDF_DOWNLOAD_TIMEOUT}ms")
-        return None
+        path, error = None, f"Error: PDF download timed out after {config.PDF_DOWNLOAD_TIMEOUT}ms."
+    except Exception as e:
+        logger.error(f"PDFダウンロード中に予期せぬエラーが発生しました ({url}): {type(e).__name__} - {e}")
+        path, error = None, f"Error: PDF download failed - {type(e).__name__}: {e}"
+    if path is None and tmp_path and os.path.exists(tmp_path):
+        os.remove(tmp_path) # 中止・失敗時は途中までのファイルを残さない
+    return path, error
+
+# --- PDFテキスト抽出のプロセスプール ---
+# PyMuPDF の処理をイベントループと別プロセスで行い、GIL の競合を避ける。
+# 壊れたPDFでワーカーが異常終了・無応答になっても、サーバー本体には影響しない。
+# プールの状態: {"executor", "slots": 空きワーカー数のセマフォ, "inflight": 実行中の future, "loop": セマフォを作ったイベントループ}
+_pdf_pool: Optional[Dict[str, Any]] = None
+_retiring_pool_tasks: set = set() # 退役させたプールの後始末タスク (完了まで参照を保持する)
+
+def _get_pdf_pool() -> Dict[str, Any]:
+    global _pdf_pool
+    loop = asyncio.get_running_loop()
+    if _pdf_pool is None:
+        max_workers = config.PDF_POOL_MAX_WORKERS or min(4, os.cpu_count() or 1)
+        # fork はブラウザ制御中のスレッド状態を引き継ぐため、spawn で起動する
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        _pdf_pool = {"executor": executor, "max_workers": max_workers, "slots": asyncio.Semaphore(max_workers), "inflight": set(), "loop": loop}
+        logger.info(f"PDFテキスト抽出用のプロセスプールを起動しました (ワーカー数: {max_workers})")
+    elif _pdf_pool["loop"] is not loop:
+        # 別のイベントループ (asyncio.run の再実行) からはセマフォを作り直す
+        _pdf_pool.update(slots=asyncio.Semaphore(_pdf_pool["max_workers"]), inflight=set(), loop=loop)
+    return _pdf_pool
+
+def _discard_pdf_executor(executor: ProcessPoolExecutor, terminate_workers: bool) -> None:
+    """問題のあったプールのワーカーを終了する。"""
+    if terminate_workers:
+        # 実行中のタスクは ProcessPoolExecutor からは中断できないため、ワーカープロセスを直接終了する
+        for process in list(getattr(executor, "_processes", {}).values()):
+            try: process.terminate()
+            except Exception as e: logger.debug(f"PDFワーカーの終了中にエラー (無視): {e}")
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def _retire_pdf_pool(pool: Dict[str, Any], hung_future: Optional["asyncio.Future[Any]"] = None) -> None:
+    """
+    プールを退役させる。以降の抽出は新しいプールで行い、このプールで実行中の他の文書は完了を待ってから
+    ワーカーを終了する (無応答の1文書のために、他の文書まで巻き添えで失敗させない)。
+    hung_future が完了しないまま他の文書がなくなった時点で、その文書のワーカーごと終了する。
+    """
+    global _pdf_pool
+    if _pdf_pool is pool:
+        _pdf_pool = None
+    other_futures = [future for future in pool["inflight"] if future is not hung_future and not future.done()]
+
+    async def _terminate_when_idle() -> None:
+        if other_futures:
+            logger.info(f"退役させたPDFプールで実行中の {len(other_futures)} 件の完了を待ってからワーカーを終了します。")
+            await asyncio.wait(other_futures, timeout=config.PDF_EXTRACT_TIMEOUT / 1000)
+        _discard_pdf_executor(pool["executor"], terminate_workers=True)
+
+    task = asyncio.get_running_loop().create_task(_terminate_when_idle())
+    _retiring_pool_tasks.add(task)
+    task.add_done_callback(_retiring_pool_tasks.discard)
+
+@atexit.register
+def shutdown_pdf_executor() -> None:
+    """プロセスプールを終了する (プロセス終了時にも自動で呼ばれる)。"""
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _discard_pdf_executor(_pdf_pool["executor"], terminate_workers=True)
+        _pdf_pool = None
+
+async def extract_pdf_text_async(pdf_data: Union[bytes, str], pdf_options: Optional[Dict[str, Any]] = None) -> str:
+    """
+    extract_text_from_pdf_sync をプロセスプールで実行する (config.PDF_PROCESS_POOL_ENABLED が False ならスレッドで実行)。
+    pdf_data はファイルパスを推奨 (ワーカーにはパス文字列だけが渡り、本体はコピーされない)。
+    PDF_EXTRACT_TIMEOUT (ワーカーが処理を始めてからの時間) を超えた文書はエラーとし、そのプールは実行中の他の文書の完了後に
+    ワーカーごと終了する。ワーカーの異常終了で巻き添えになった文書は新しいプールで1回だけ再実行する。
+    pdf_options.parallel_chunks が2以上でファイルパスが渡された場合、長い文書はページを分割して並行に抽出する。
+    """
+    options = normalize_pdf_options(pdf_options)
+    if options["parallel_chunks"] > 1 and isinstance(pdf_data, str) and config.PDF_PROCESS_POOL_ENABLED:
+        try:
+            page_count = await asyncio.to_thread(count_pdf_pages_sync, pdf_data)
+        except Exception as e:
+            page_count = 0 # 開けない文書は通常の抽出でエラーメッセージを返す
+            logger.debug(f"PDFのページ数を取得できませんでした: {e}")
+        page_numbers = select_pdf_pages(page_count, options)
+        if len(page_numbers) >= config.PDF_PARALLEL_MIN_PAGES:
+            chunk_size = -(-len(page_numbers) // options["parallel_chunks"]) # 切り上げ
+            chunks = [page_numbers[i:i + chunk_size] for i in range(0, len(page_numbers), chunk_size)]
+            logger.info(f"PDF ({len(page_numbers)} ページ) を {len(chunks)} 分割して並行に抽出します。")
+            chunk_texts = await asyncio.gather(*[
+                _extract_pdf_text_in_pool(pdf_data, pdf_options, page_indices=chunk) for chunk in chunks
+            ])
+            return "\n--- Page Separator ---\n".join(text for text in chunk_texts if text != "(No text extracted from PDF)") or "(No text extracted from PDF)"
+    return await _extract_pdf_text_in_pool(pdf_data, pdf_options)
+
+async def _extract_pdf_text_in_pool(
+    pdf_data: Union[bytes, str], pdf_options: Optional[Dict[str, Any]], page_indices: Optional[List[int]] = None
+) -> str:
+    """
+    空きワーカーができてから投入し、PDF_EXTRACT_TIMEOUT はワーカーが処理を始めてからの時間で判定する
+    (他の文書の待ち行列にいた時間は含めない)。
+    """
+    if not config.PDF_PROCESS_POOL_ENABLED:
+        return await asyncio.to_thread(extract_text_from_pdf_sync, pdf_data, pdf_options, page_indices) or "(No text extracted from PDF)"
+    loop = asyncio.get_running_loop()
+    attempt = 0
+    while attempt < 2:
+        pool = _get_pdf_pool()
+        async with pool["slots"]: # 空きワーカー数だけ投入するので、投入時点から処理が始まる
+            if _pdf_pool is not pool: # 空き待ちの間にプールが退役した場合は新しいプールで待ち直す
+                continue
+            attempt += 1
+            future = loop.run_in_executor(pool["executor"], extract_text_from_pdf_sync, pdf_data, pdf_options, page_indices)
+            pool["inflight"].add(future)
+            future.add_done_callback(pool["inflight"].discard)
+            future.add_done_callback(lambda f: f.cancelled() or f.exception()) # 終了させたワーカーの例外を未取得のまま残さない
+            done, _ = await asyncio.wait({future}, timeout=config.PDF_EXTRACT_TIMEOUT / 1000)
+            if not done:
+                logger.error(f"PDFテキスト抽出が {config.PDF_EXTRACT_TIMEOUT}ms 以内に終わらないため、このプールを退役させます (実行中の他の文書は完了を待ちます)。")
+                _retire_pdf_pool(pool, hung_future=future)
+                return f"Error: PDF text extraction timed out after {config.PDF_EXTRACT_TIMEOUT}ms."
+            try:
+                return future.result() or "(No text extracted from PDF)"
+            except BrokenProcessPool:
+                if _pdf_pool is pool:
+                    _retire_pdf_pool(pool)
+                if attempt == 1:
+                    logger.warning("PDFワーカーが異常終了しました (他の文書が原因の可能性)。新しいプールで再実行します。")
+                    continue
+                logger.error("PDFワーカーが再実行でも異常終了しました。この文書の抽出を中止します。")
+    return "Error: PDF extraction worker crashed while processing this document."
+
+async def fetch_pdf_text_async(
+    api_request_context: APIRequestContext, url: str, pdf_options: Optional[Dict[str, Any]] = None, incremental: bool = False,
+    client: Optional[httpx.AsyncClient] = None
+) -> Tuple[str, int, Optional[str]]:
+    """
+    PDFを一時ファイルにダウンロードしてテキストを抽出し、
+    (テキストまたはエラーメッセージ, ダウンロードしたバイト数, 差分状態) を返す。
+    pdf_options は抽出方式と対象ページの指定 (normalize_pdf_options 参照)。一時ファイルは抽出後に削除する。
+    incremental が True の場合は前回の検証子で条件付きリクエストを送り、304 または内容のハッシュが同じなら
+    前回のテキストを再利用する (抽出しない)。差分状態は 'new' / 'changed' / 'unchanged' (incremental でなければ None)。
+    client (open_http_session) を渡すと、同じステップ内の他のリンクとクッキー・接続を共有する。
+    """
+    variant = json.dumps(pdf_options, sort_keys=True, ensure_ascii=False) if pdf_options else None
+    previous_entry = refresh_cache.get_entry(url, variant) if incremental else None
+    response_info: Dict[str, Any] = {}
+    pdf_path, error = await download_pdf_to_file_async(
+        api_request_context, url, extra_headers=refresh_cache.conditional_headers(previous_entry), response_info=response_info, client=client
+    )
+    if response_info.get("status") == 304 and previous_entry:
+        previous_text = refresh_cache.load_previous_text(previous_entry)
+        if previous_text is not None:
+            refresh_cache.mark_not_modified(url, variant)
+            return previous_text, 0, refresh_cache.REFRESH_UNCHANGED
+        # 前回のテキストが失われている場合は条件なしで取り直す
+        pdf_path, error = await download_pdf_to_file_async(api_request_context, url, response_info=response_info, client=client)
+    if not pdf_path:
+        pdf_text = error or "Error: PDF download failed or returned no data."
+        return pdf_text, 0, (refresh_cache.record(url, variant, pdf_text, None) if incremental else None)
+    try:
+        downloaded_bytes = os.path.getsize(pdf_path)
+        if previous_entry and previous_entry.get("content_sha256") == response_info.get("sha256"):
+            previous_text = refresh_cache.load_previous_text(previous_entry)
+            if previous_text is not None:
+                logger.info(f"PDFの内容が前回と同じため、前回のテキストを再利用します: {url}")
+                refresh_cache.record(url, variant, previous_text, response_info.get("sha256"), response_info.get("etag"), response_info.get("last_modified"))
+                return previous_text, downloaded_bytes, refresh_cache.REFRESH_UNCHANGED
+        pdf_text = await extract_pdf_text_async(pdf_path, pdf_options) or "(No text extracted from PDF)"
+        refresh_state = refresh_cache.record(
+            url, variant, pdf_text, response_info.get("sha256"), response_info.get("etag"), response_info.get("last_modified")
+        ) if incremental else None
+        return pdf_text, downloaded_bytes, refresh_state
+    finally:
+        try: os.remove(pdf_path)
+        except OSError as e: logger.warning(f"一時PDFファイルの削除に失敗しました (無視): {pdf_path} - {e}")
+
+async def conditional_probe_async(
+    api_request_context: APIRequestContext, url: str, entry: Optional[Dict[str, Any]], client: Optional[httpx.AsyncClient] = None
+) -> Dict[str, Any]:
+    """
+    ページの差分取得用に、前回の検証子で条件付きGETを送ってヘッダーだけを確認する (本体は読まずに接続を閉じる)。
+    戻り値: {"not_modified": 304 かどうか, "etag": ..., "last_modified": ...}。通信に失敗した場合は not_modified=False。
+    前回の記録がないか検証子 (ETag / Last-Modified) がない場合は 304 になり得ないため、通信せずに not_modified=False を返す。
+    client (open_http_session) を渡すと、同じステップ内の他のリンクとクッキー・接続を共有する。
+    """
+    validators = refresh_cache.conditional_headers(entry)
+    if not validators:
+        return {"not_modified": False, "etag": None, "last_modified": None}
+    try:
+        async with _shared_or_new_client(api_request_context, client) as probe_client:
+            async with probe_client.stream("GET", url, headers=validators, timeout=config.PDF_DETECT_TIMEOUT / 1000) as response:
+                return {"not_modified": response.status_code == 304,
+                        "etag": response.headers.get("etag"), "last_modified": response.headers.get("last-modified")}
     except Exception as e:
-        logger.error(f"PDF非同期ダウンロード中に予期せぬエラーが発生しました ({url}): {e}", exc_info=True)
-        return None
+        logger.debug(f"条件付きリクエストに失敗しました ({url}): {type(e).__name__} - {e}")
+        return {"not_modified": False, "etag": None, "last_modified": None}
 
 # --- ▼▼▼ write_results_to_file 修正 ▼▼▼ ---
 def write_results_to_file(
@@ -239,6 +884,7 @@ def write_results_to_file(
                             if pdf_texts is not None:
                                 file.write("  Extracted PDF Texts:\n")
                                 for idx, pdf_content in enumerate(pdf_texts):
+                                    pdf_content = artifact_store.resolve_payload(pdf_content) # 退避済みなら1件ずつ読み込む
                                     if pdf_content is not None:
                                         file.write(f"    [{idx+1}]")
                                         if isinstance(pdf_content, str) and pdf_content.startswith("Error:"): file.write(f" (Error): {pdf_content}\n")
@@ -250,6 +896,7 @@ def write_results_to_file(
                             if scraped_texts is not None:
                                 file.write("  Scraped Page Texts:\n")
                                 for idx, scraped_content in enumerate(scraped_texts):
+                                    scraped_content = artifact_store.resolve_payload(scraped_content) # 退避済みなら1件ずつ読み込む
                                     if scraped_content is not None:
                                         file.write(f"    [{idx+1}]")
                                         if isinstance(scraped_content, str) and scraped_content.startswith("Error"): file.write(f" (Error): {scraped_content}\n")
@@ -270,13 +917,13 @@ def write_results_to_file(
                             if valid_texts: file.write('\n'.join(f"- {text}" for text in valid_texts) + "\n")
                             else: file.write("(No text content found)\n")
                         else: file.write("(Invalid format received)\n")
-                    elif action_type in ['get_text_content', 'get_inner_text'] and 'text' in details_to_write: file.write(f"Result Text:\n{details_to_write.pop('text', '')}\n")
-                    elif action_type == 'get_inner_html' and 'html' in details_to_write: file.write(f"Result HTML:\n{details_to_write.pop('html', '')}\n")
+                    elif action_type in ['get_text_content', 'get_inner_text'] and 'text' in details_to_write: file.write(f"Result Text:\n{artifact_store.resolve_payload(details_to_write.pop('text', ''))}\n")
+                    elif action_type == 'get_inner_html' and 'html' in details_to_write: file.write(f"Result HTML:\n{artifact_store.resolve_payload(details_to_write.pop('html', ''))}\n")
                     elif action_type == 'get_attribute':
                         attr_name = details_to_write.pop('attribute', ''); attr_value = details_to_write.pop('value', None)
                         file.write(f"Result Attribute ('{attr_name}'): {attr_value}\n")
                         if 'pdf_text' in details_to_write:
-                            pdf_text = details_to_write.pop('pdf_text', '')
+                            pdf_text = artifact_store.resolve_payload(details_to_write.pop('pdf_text', ''))
                             prefix = "Extracted PDF Text"
                             if isinstance(pdf_text, str) and pdf_text.startswith("Error:"): file.write(f"{prefix} (Error): {pdf_text}\n")
                             elif pdf_text == "(No text extracted from PDF)": file.write(f"{prefix}: (No text extracted)\n")
@@ -290,6 +937,11 @@ def write_results_to_file(
                         file.write("Other Details:\n")
                         for key, val in details_to_write.items(): file.write(f"  {key}: {val}\n")
                 elif status == "skipped" or status == "warning": file.write(f"Message: {res.get('message', 'No message provided.')}\n")
+                elif status == "summary":
+                    timing_summary = res.get('timing_summary', {})
+                    file.write(f"Timing Totals: {timing_summary.get('totals')}\n")
+                    for slow in timing_summary.get('slowest_steps', []):
+                        file.write(f"  Slow Step {slow.get('step')} ({slow.get('action')}): {slow.get('total_ms')}ms  {slow.get('selector') or ''}\n")
                 else: file.write(f"Raw Data: {res}\n") # 不明な場合は生データを書き出す
                 file.write("\n")
 
@@ -31,24 +31,25 @@ NEXT_PAGE_SELECTOR = "#pnnext > span.oeN89d"
 
 DEFAULT_WAIT_MS = 5000
 EMAIL_EXTRACT_WAIT_MS = 7000
-DEFAULT_SLEEP_SEC = 2
 
 # --- JSON生成ヘルパー関数 (次へセレクター変更) ---
 def generate_google_crawl_json(search_term: str, max_pages: int) -> Dict[str, Any]:
     actions: List[Dict[str, Any]] = []
     actions.append({"memo": "検索ボックスに入力", "action": "input", "selector": SEARCH_BOX_SELECTOR, "value": search_term})
-    actions.append({"memo": "検索ボタンをクリック", "action": "click", "selector": SEARCH_BUTTON_SELECTOR, "wait_time_ms": DEFAULT_WAIT_MS})
-    actions.append({"memo": f"検索結果表示待機 ({DEFAULT_SLEEP_SEC}秒)", "action": "sleep", "value": DEFAULT_SLEEP_SEC})
-    for page_num in range(1, max_pages + 1):
-        actions.append({"memo": f"ページ {page_num} メール抽出", "action": "get_all_attributes", "selector": EMAIL_EXTRACT_SELECTOR, "attribute_name": "mail", "wait_time_ms": EMAIL_EXTRACT_WAIT_MS})
-        if page_num < max_pages:
-            actions.append({
-                "memo": f"ページ {page_num + 1} へ移動",
-                "action": "click",
-                "selector": NEXT_PAGE_SELECTOR, # <<< 実績値に戻したセレクター
-                "wait_time_ms": DEFAULT_WAIT_MS
-            })
-            actions.append({"memo": f"ページ遷移待機 ({DEFAULT_SLEEP_SEC}秒)", "action": "sleep", "value": DEFAULT_SLEEP_SEC})
+    # 通信の静止はクリックの前から監視する (クリック後の単独の wait_for_settle では完了済みの通信を検出できない)
+    actions.append({"memo": "検索ボタンをクリックし、検索結果の表示待機 (通信の静止)", "action": "click", "selector": SEARCH_BUTTON_SELECTOR, "settle_mode": "network_idle", "wait_time_ms": DEFAULT_WAIT_MS})
+    # ページごとの「抽出→次へクリック→待機」の展開はせず、paginate でエンジン側にループさせる
+    actions.append({
+        "memo": f"最大 {max_pages} ページのメール抽出",
+        "action": "paginate",
+        "next_selector": NEXT_PAGE_SELECTOR, # <<< 実績値に戻したセレクター
+        "max_pages": max_pages,
+        "page_change_wait": "navigation",
+        "wait_time_ms": DEFAULT_WAIT_MS,
+        "steps": [
+            {"memo": "ページ内メール抽出", "action": "get_all_attributes", "selector": EMAIL_EXTRACT_SELECTOR, "attribute_name": "mail", "wait_time_ms": EMAIL_EXTRACT_WAIT_MS}
+        ]
+    })
     return {"target_url": GOOGLE_SEARCH_URL, "actions": actions}
 
 # --- 結果処理ヘルパー関数 (エラー時のJSON抽出を修正) ---
@@ -49,7 +49,9 @@ async def execute_web_runner_via_mcp(
             "actions": input_json_data.get("actions", []),
             "headless": headless,
             "slow_mo": slow_mo,
-            "default_timeout_ms": input_json_data.get("default_timeout_ms")
+            "default_timeout_ms": input_json_data.get("default_timeout_ms"),
+            "checkpoint": bool(input_json_data.get("checkpoint", False)),
+            "resume_from": input_json_data.get("resume_from")
         }
     }
     if not tool_arguments["input_args"]["target_url"] or not tool_arguments["input_args"]["actions"]:
@@ -18,6 +18,7 @@ from typing import Any, Dict, List, Literal, Union, Optional
 try:
     import config # 設定値を参照するため
     import utils  # ロギング設定などに使う可能性
+    import artifact_store # 退避された大きな結果をリソースとして返す
     # playwright_handler -> playwright_launcher をインポート
     from playwright_launcher import run_playwright_automation_async # メインの実行関数
 except ImportError as import_err:
@@ -44,14 +45,44 @@ class ActionStep(BaseModel):
     option_type: Literal['value', 'index', 'label'] | None = Field(None, description="ドロップダウン選択方法 (select_optionの場合)")
     option_value: str | int | None = Field(None, description="選択する値/インデックス/ラベル (select_optionの場合)")
     wait_time_ms: int | None = Field(None, description="このアクション固有の最大待機時間 (ミリ秒)")
+    # --- paginate アクション用 ---
+    steps: Optional[List["ActionStep"]] = Field(None, description="各ページで実行する本体ステップのリスト (paginateの場合)")
+    next_selector: str | None = Field(None, description="「次へ」要素のCSSセレクター (paginateの場合)")
+    max_pages: int | None = Field(None, description="最大ページ数 (paginateの場合)", ge=1)
+    stop_when_no_new_items: bool | None = Field(None, description="新しい項目がないページで停止するかどうか (paginateの場合)")
+    page_change_wait: Literal['navigation', 'url_change', 'detach', 'settle'] | None = Field(None, description="ページ切替の待機方法 (paginateの場合)。'settle' は settle_mode の静止待機だけで判定する")
+    max_items: int | None = Field(None, description="取得する最大項目数 (scroll_until_stableの場合)")
+    max_duration_ms: int | None = Field(None, description="全体の時間予算 (ミリ秒) (scroll_until_stableの場合)")
+    stable_rounds: int | None = Field(None, description="項目数が連続して増えなければ終了する回数 (scroll_until_stableの場合)")
+    max_scrolls: int | None = Field(None, description="最大スクロール回数 (scroll_until_stableの場合)")
+    settle_mode: str | None = Field(None, description="静止の判定方法 ('dom_quiet', 'network_idle', 'response', 'selector_count')。click / paginate に指定すると、クリックの前に監視を開始してクリック後に待機する")
+    settle_selector: str | None = Field(None, description="settle_mode='selector_count' で要素数を監視するセレクター (click / paginate の場合)")
+    settle_count: int | None = Field(None, description="settle_mode='selector_count' で待つ要素数 (以上)。未指定時はクリック前の数から変化するまで待つ")
+    url_pattern: str | None = Field(None, description="待機するレスポンスURLの正規表現 (settle_mode='response' の場合)")
+    quiet_ms: int | None = Field(None, description="DOM変更がこの時間発生しなければ静止とみなす (ミリ秒)")
+    extract: Literal['text', 'attribute'] | None = Field(None, description="スクロール中に増えた項目を差分抽出する (scroll_until_stableの場合)")
+    search_mode: Literal['bfs', 'race', 'shadow'] | None = Field(None, description="単一要素の探索方式。'race' は全フレームで同時に待機し最初に見つかった要素を使う。'shadow' は open shadow root を先に走査する")
+    optional: bool | None = Field(None, description="trueの場合、要素が見つからない・タイムアウトしてもエラーにせずスキップする")
+    if_exists: str | None = Field(None, description="このセレクターが現在のスコープに存在する場合のみ実行する (待機なしで判定)")
+    unless_exists: str | None = Field(None, description="このセレクターが現在のスコープに存在しない場合のみ実行する (待機なしで判定)")
+    exit_if_exists: str | None = Field(None, description="このセレクターが存在する場合、このステップ以降を実行せずに正常終了する")
+    exit_unless_exists: str | None = Field(None, description="このセレクターが存在しない場合、このステップ以降を実行せずに正常終了する")
+    pdf_options: Dict[str, Any] | None = Field(None, description="PDFテキスト抽出の指定 (mode: sorted/fast/blocks, max_pages, pages: '1-3,7', parallel_chunks)")
+    incremental: bool | None = Field(None, description="差分取得モード。前回から変わっていないPDF/ページのテキストを再利用し、各項目に new/changed/unchanged を付ける")
+    retry: int | bool | Dict[str, Any] | None = Field(None, description="ステップ単位のリトライ設定 (試行回数、または attempts/backoff_ms/backoff_factor/max_backoff_ms/on)。冪等でないアクションでは拒否される")
 # --- ▲▲▲ ActionStep モデルを修正 ▲▲▲ ---
 
+ActionStep.model_rebuild() # steps の自己参照を解決
+
 class WebRunnerInput(BaseModel):
     target_url: Union[HttpUrl, str] = Field(..., description="自動化を開始するWebページのURL")
     actions: List[ActionStep] = Field(..., description="実行するアクションステップのリスト", min_length=1)
     headless: bool = Field(True, description="ヘッドレスモードで実行するかどうか")
     slow_mo: int = Field(0, description="各操作間の待機時間 (ミリ秒)", ge=0)
     default_timeout_ms: int | None = Field(None, description=f"デフォルトのアクションタイムアウト(ミリ秒)")
+    checkpoint: bool = Field(False, description="各ステップ成功後にチェックポイントを保存するかどうか (paginate は URL が変わるページ切替ごとにも保存し、再開時はそのページから続ける。同じ URL のままページが切り替わる場合は paginate の最初のページからやり直す)")
+    resume_from: str | None = Field(None, description=f"再開に使うチェックポイントファイル (サーバー側の '{config.MCP_CHECKPOINT_DIR}' 配下のファイル名、または checkpoint の結果に含まれる resume_from のパス)")
+    spill_artifacts: bool | None = Field(None, description=f"{config.ARTIFACT_SPILL_THRESHOLD} バイトを超える結果を artifact://{{sha256}} リソースに退避し、結果にはハンドルだけを返すかどうか (未指定時はサーバー設定 ARTIFACT_SPILL_ENABLED)")
 
 
 
@@ -62,6 +93,15 @@ mcp = FastMCP(
     dependencies=["playwright", "PyMuPDF", "fitz", "playwright-stealth"] # 依存関係にstealth追加
 )
 
+# --- MCPリソース定義: 退避された大きな結果 (アーティファクト) ---
+@mcp.resource("artifact://{sha256}", mime_type="text/plain")
+def read_artifact(sha256: str) -> str:
+    """
+    結果中のハンドル (artifact_uri) が指すアーティファクトの内容を返します。
+    閾値を超えるHTML・ページテキスト・PDFテキストは結果JSONに含めず、このリソース経由で取得します。
+    """
+    return artifact_store.load_artifact(sha256)
+
 # --- MCPツール定義 (修正: インポート元変更) ---
 @mcp.tool()
 async def execute_web_runner(
@@ -89,6 +129,17 @@ async def execute_web_runner(
         await ctx.debug(f"  headless_mode={input_args.headless}")
         await ctx.debug(f"  slow_motion={input_args.slow_mo}")
         await ctx.debug(f"  default_timeout={effective_default_timeout}")
+        # チェックポイントはサーバーの出力ディレクトリ配下だけを読み書きする (任意のパスの読み込みを防ぐ)
+        checkpoint_path = utils.default_checkpoint_path(config.MCP_CHECKPOINT_DIR) if input_args.checkpoint and not input_args.resume_from else None
+        resume_from_path = None
+        if input_args.resume_from:
+            try:
+                resume_from_path = utils.resolve_checkpoint_path(input_args.resume_from, config.MCP_CHECKPOINT_DIR)
+            except ValueError as e:
+                await ctx.error(str(e))
+                raise ToolError(f"Invalid resume_from: {e}")
+        if checkpoint_path or resume_from_path:
+            await ctx.info(f"Checkpoint file: {checkpoint_path or resume_from_path} (resume: {bool(resume_from_path)})")
 
         # --- ▼▼▼ 修正 ▼▼▼ ---
         # playwright_handler -> playwright_launcher のコア関数を呼び出す
@@ -97,7 +148,10 @@ async def execute_web_runner(
             actions=actions_list,
             headless_mode=input_args.headless,
             slow_motion=input_args.slow_mo,
-            default_timeout=effective_default_timeout
+            default_timeout=effective_default_timeout,
+            checkpoint_path=checkpoint_path,
+            resume_from=resume_from_path,
+            spill_artifacts=input_args.spill_artifacts
         )
         # --- ▲▲▲ 修正 ▲▲▲ ---
 